@@ -0,0 +1,70 @@
+"""
+Benchmarks TransactionClassifier with hundreds of account rules, against checking each
+collection's TransactionFilter in turn.
+
+Run from the repository root with `python -m benchmark.classify [count] [rules]`.
+"""
+import random
+import sys
+import time
+
+from src.config import CollectionConfig, IgnoreConfig, TransactionType
+from src.transaction import GenericTransaction, TransactionClassifier
+
+
+def collection_configs(rules):
+	configs = {TransactionType.Ignore : IgnoreConfig({'tags': ['Ignored'], 'accounts': ['$Closed %d' % i for i in range(rules // 10)]})}
+	for name in ['income', 'expenses', 'savings']:
+		accounts = ['%s payee %d' % (name, i) for i in range(rules // 2)] + ['$%s account %d' % (name, i) for i in range(rules // 2)]
+		configs[TransactionType(name)] = CollectionConfig({
+			'name' : name.title(),
+			'outgoing' : name != 'income',
+			'classifiers' : {'tags': ['%s tag' % name], 'accounts': accounts},
+			'threshold' : {'count': 10, 'value': 0, 'percentage': 0},
+		})
+	return configs
+
+
+def synthetic_transactions(count, rules, seed=0):
+	rng = random.Random(seed)
+	names = ['income', 'expenses', 'savings']
+	descriptions = [lambda: '%s payee %d' % (rng.choice(names), rng.randrange(rules)),
+					lambda: 'Transfer to $%s account %d' % (rng.choice(names), rng.randrange(rules)),
+					lambda: 'Merchant %d' % rng.randrange(10000)]
+	return [GenericTransaction(
+		description = rng.choice(descriptions)(),
+		amount = rng.choice([-1, 1]) * rng.randint(1, 10000) / 100,
+		tags = ['%s tag' % rng.choice(names)] if rng.random() < 0.05 else [],
+	) for _ in range(count)]
+
+
+def classify_with_filters(classifier, transaction):
+	for type, filter in classifier.filters.items():
+		if filter.match_by_tag(transaction):
+			return type
+	for type, filter in classifier.filters.items():
+		if filter.match_by_account(transaction):
+			return type
+	return TransactionType.Income if transaction.amount > 0 else TransactionType.Unknown
+
+
+def main(count, rules):
+	classifier = TransactionClassifier(collection_configs(rules))
+	transactions = synthetic_transactions(count, rules)
+
+	start = time.perf_counter()
+	expected = [classify_with_filters(classifier, t) for t in transactions]
+	filters_time = time.perf_counter() - start
+
+	start = time.perf_counter()
+	actual = classifier.classify_many(transactions)
+	compiled_time = time.perf_counter() - start
+
+	assert expected == actual, "classifications differ"
+	print("%d transactions, %d rules: filters %.0f/s, compiled %.0f/s" % (
+		count, rules, count / filters_time, count / compiled_time))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000,
+		int(sys.argv[2]) if len(sys.argv) > 2 else 500)
@@ -0,0 +1,40 @@
+"""
+Benchmarks downloading transactions from a stub client with a fixed latency per page.
+
+Run from the repository root with `python -m benchmark.fetch [count] [latency]`.
+"""
+import sys
+import time
+
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+from src.fetch import ConcurrentFetcher
+
+
+class LatencyClient:
+	"""Serves one transaction per hour, sleeping for `latency` seconds on every page."""
+	def __init__(self, count, latency, start=datetime(2020, 1, 1)):
+		self.latency = latency
+		self.transactions_by_date = [SimpleNamespace(id=str(i), created_at=start + timedelta(hours=i)) for i in range(count)]
+
+	def transactions(self, account=None, *, since=None, until=None, limit=None, page_size=50):
+		selected = [t for t in reversed(self.transactions_by_date) if since <= t.created_at <= until][:limit]
+		for offset in range(0, len(selected), page_size):
+			time.sleep(self.latency)
+			yield from selected[offset:offset + page_size]
+
+
+def main(count, latency):
+	client = LatencyClient(count, latency)
+	since = client.transactions_by_date[0].created_at
+	until = client.transactions_by_date[-1].created_at
+	for concurrency in [1, 2, 4, 8]:
+		start = time.perf_counter()
+		fetched = list(ConcurrentFetcher(client, concurrency).transactions(since=since, until=until, page_size=100))
+		print("concurrency %d: %d transactions in %.2fs" % (concurrency, len(fetched), time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 5000,
+		float(sys.argv[2]) if len(sys.argv) > 2 else 0.05)
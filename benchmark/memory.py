@@ -0,0 +1,34 @@
+"""
+Measures the memory held by GenericTransactions converted from a large history.
+
+Run from the repository root with `python -m benchmark.memory [count]`.
+"""
+import resource
+import sys
+import tracemalloc
+
+from datetime import datetime, timedelta
+
+from src.transaction import GenericTransaction
+
+
+def main(count):
+	start = datetime(2020, 1, 1)
+	tracemalloc.start()
+	transactions = [GenericTransaction(
+		id = 'transaction-%d' % i,
+		description = 'Merchant %d' % (i % 5000),
+		amount = -(i % 10000) / 100,
+		date = start + timedelta(minutes=i),
+		category = 'Category %d' % (i % 40),
+		parentCategory = 'Parent %d' % (i % 6),
+	) for i in range(count)]
+	current, peak = tracemalloc.get_traced_memory()
+	tracemalloc.stop()
+	print("%d transactions: %.1f MB held (%.0f bytes each), %.1f MB peak, %.1f MB max RSS" % (
+		len(transactions), current / 2**20, current / count, peak / 2**20,
+		resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 2**10))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 500000)
@@ -0,0 +1,50 @@
+"""
+Benchmarks converting and classifying raw transactions on 1, 2, 4 and 8 worker processes.
+
+Run from the repository root with `python -m benchmark.parallel [count]`.
+"""
+import sys
+import time
+
+from datetime import datetime, timedelta, timezone
+
+from benchmark.streams import collection_configs
+from src.config import UpApiConfig
+from src.interface import UpBankApiHelper
+from src.parallel import ParallelAggregator
+from src.state import StreamState
+from test.fake import FakeClient, raw_account, raw_category, raw_transaction
+
+
+def synthetic_client(count):
+	accounts = [raw_account('personal', 'Spending'), raw_account('joint', '2Up', ownership='JOINT')]
+	categories = [raw_category('parent%d' % p, 'Parent %d' % p, children=['child%d-%d' % (p, c) for c in range(8)]) for p in range(4)]
+	categories += [raw_category('child%d-%d' % (p, c), 'Child %d-%d' % (p, c), parent='parent%d' % p) for p in range(4) for c in range(8)]
+	start = datetime(2020, 1, 1, tzinfo=timezone.utc)
+	transactions = [raw_transaction('t%d' % i, 'Merchant %d' % (i % 3000), -(i % 9000) / 100 - 1, start + timedelta(minutes=i),
+		'joint' if i % 3 == 0 else 'personal', category='child%d-%d' % (i % 4, i % 8), parent_category='parent%d' % (i % 4))
+		for i in range(count)]
+	return FakeClient(accounts, categories, transactions)
+
+
+def main(count):
+	client = synthetic_client(count)
+	config = UpApiConfig({'limit': None, 'pagesize': 100})
+	helper = UpBankApiHelper(client, config)
+	raw_transactions = [t._raw_response for t in client.transactions()]
+
+	start = time.perf_counter()
+	serial = StreamState(collection_configs())
+	serial.apply(helper.iter_transactions(datetime.min.replace(tzinfo=timezone.utc), datetime.max.replace(tzinfo=timezone.utc)))
+	print("serial: %.2fs" % (time.perf_counter() - start))
+
+	for workers in [1, 2, 4, 8]:
+		aggregator = ParallelAggregator(helper.accounts.values(), helper.categories.values(), config, collection_configs(), workers)
+		start = time.perf_counter()
+		parallel = aggregator.aggregate(raw_transactions)
+		print("%d workers: %.2fs" % (workers, time.perf_counter() - start))
+		assert parallel.streams == serial.streams, "aggregates differ"
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
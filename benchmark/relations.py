@@ -0,0 +1,78 @@
+"""
+Benchmarks relation building in TransactionCollection against the previous all-pairs approach.
+
+Run from the repository root with `python -m benchmark.relations [count]`.
+"""
+import random
+import sys
+import time
+
+from datetime import datetime, timedelta
+from itertools import combinations
+
+from src.interface import TransactionCollection
+from test.fixtures import make_config
+from src.transaction import AccountType, GenericTransaction
+
+ACCOUNTS = [AccountType.JOINT, AccountType.PERSONAL, AccountType.PARTNER, AccountType.EXTERNAL]
+DESCRIPTIONS = ["Woolworths", "Coles", "Transfer", "Cover from Spending", "Cover to Bills", "Salary"]
+
+
+def synthetic_transactions(count, seed=0):
+	rng = random.Random(seed)
+	start = datetime(2020, 1, 1)
+	transactions = []
+	for i in range(count):
+		transactions.append(GenericTransaction(
+			description = rng.choice(DESCRIPTIONS),
+			amount = rng.choice([-1, 1]) * rng.randint(1, 50000) / 100,
+			date = start + timedelta(minutes=i),
+			source = rng.choice(ACCOUNTS),
+			destination = rng.choice(ACCOUNTS),
+		))
+	return transactions
+
+
+def all_pairs_relations(transactions):
+	graph = set()
+	for (i, t1), (j, t2) in combinations(enumerate(transactions), 2):
+		if t1.relates_to(t2):
+			graph.add((i, j))
+	return graph
+
+
+def indexed_relations(transactions):
+	collection = TransactionCollection(make_config(cover_window=None))
+	collection._update_relations(transactions)
+	collection.transactions.extend(transactions)
+	graph = set()
+	position = {id(t): i for i, t in enumerate(transactions)}
+	for i, t in enumerate(transactions):
+		for other in t.connections:
+			if i < position[id(other)]:
+				graph.add((i, position[id(other)]))
+	return graph, collection.relations.comparisons
+
+
+def timed(function, *args):
+	start = time.perf_counter()
+	result = function(*args)
+	return result, time.perf_counter() - start
+
+
+def main(count):
+	small = synthetic_transactions(min(count, 2000))
+	expected, all_pairs_time = timed(all_pairs_relations, small)
+	(actual, _), indexed_time = timed(indexed_relations, synthetic_transactions(len(small)))
+	print("%d transactions: all-pairs %.3fs, indexed %.3fs" % (len(small), all_pairs_time, indexed_time))
+	assert expected == actual, "relation graphs differ"
+
+	(graph, comparisons), indexed_time = timed(indexed_relations, synthetic_transactions(count))
+	pairs = count * (count - 1) // 2
+	estimated = all_pairs_time * pairs / (len(small) * (len(small) - 1) // 2)
+	print("%d transactions: indexed %.3fs with %d comparisons (all-pairs would need %d, ~%.0fs)" % (
+		count, indexed_time, comparisons, pairs, estimated))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
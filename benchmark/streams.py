@@ -0,0 +1,51 @@
+"""
+Benchmarks building and cleaning up a StreamCollection with many transactions.
+
+Run from the repository root with `python -m benchmark.streams [count]`.
+"""
+import random
+import sys
+import time
+
+from src.stream import StreamCollection
+from src.transaction import GenericTransaction
+from test.fixtures import collection_configs
+
+PARENT_CATEGORIES = ["Home", "Personal", "Good Life", "Transport"]
+
+
+def synthetic_transactions(count, merchants=2000, seed=0):
+	rng = random.Random(seed)
+	transactions = []
+	for _ in range(count):
+		if rng.random() < 0.8:
+			parent = rng.choice(PARENT_CATEGORIES)
+			transactions.append(GenericTransaction(
+				description = "Merchant %d" % rng.randrange(merchants),
+				amount = -rng.randint(1, 20000) / 100,
+				category = "%s %d" % (parent, rng.randrange(8)),
+				parentCategory = parent,
+			))
+		else:
+			transactions.append(GenericTransaction(
+				description = "Payer %d" % rng.randrange(merchants // 10),
+				amount = rng.randint(1, 200000) / 100,
+			))
+	return transactions
+
+
+def build(transactions):
+	streams = StreamCollection(collection_configs())
+	streams.add_transactions(transactions)
+	return str(streams.cleanup().link())
+
+
+def main(count):
+	transactions = synthetic_transactions(count)
+	start = time.perf_counter()
+	output = build(transactions)
+	print("%d transactions: %.3fs, %d output lines" % (count, time.perf_counter() - start, output.count("\n") + 1))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 50000)
@@ -0,0 +1,115 @@
+"""
+Benchmarks each stage of the pipeline on synthetic Up API data at several sizes, saving the
+results as JSON so that runs can be compared over time.
+
+Run from the repository root with `python -m benchmark.suite [--sizes 1000,10000] [--baseline results.json]`.
+"""
+import argparse
+import json
+import os
+import platform
+import time
+
+from datetime import datetime, timezone
+from itertools import islice
+
+from benchmark.synthetic import SyntheticBank, SyntheticClient, collection_configs, config, up_api_config
+from src.fetch import ConcurrentFetcher
+from src.interface import TransactionCollection, UpBankApiHelper
+from src.transaction import TransactionClassifier
+
+STAGES = ['fetch', 'convert', 'relate', 'classify', 'aggregate', 'render']
+CHUNK_SIZE = 10000
+
+
+def run(size, seed=0, latency=0.0, concurrency=1, page_size=100):
+	"""Times each stage on `size` transactions, returning the seconds spent in each."""
+	bank = SyntheticBank(size, seed)
+	client = SyntheticClient(bank, latency)
+	seconds = {}
+
+	start = time.perf_counter()
+	fetched = ConcurrentFetcher(client, concurrency).transactions(since=bank.since, until=bank.until, page_size=page_size)
+	count = sum(1 for _ in fetched)
+	seconds['fetch'] = time.perf_counter() - start
+	assert count == size, (count, size)
+
+	# Converted a chunk at a time, so the fetched payloads don't all need to be held at once
+	helper = UpBankApiHelper(client, up_api_config(page_size))
+	transactions, seconds['convert'] = [], 0.0
+	fetched = iter(client.transactions(since=bank.since, until=bank.until, page_size=page_size))
+	while chunk := list(islice(fetched, CHUNK_SIZE)):
+		start = time.perf_counter()
+		transactions += [helper.to_generic_transaction(transaction) for transaction in chunk]
+		seconds['convert'] += time.perf_counter() - start
+	del chunk
+
+	collection = TransactionCollection(config())
+	start = time.perf_counter()
+	collection._update_relations(transactions)
+	seconds['relate'] = time.perf_counter() - start
+	collection.transactions = transactions
+
+	classifier = TransactionClassifier(collection_configs())
+	start = time.perf_counter()
+	classifier.classify_many(transactions)
+	seconds['classify'] = time.perf_counter() - start
+
+	start = time.perf_counter()
+	collection.ledger.add(transactions)
+	collection._update_joint_transaction_splits()
+	streams = collection.as_streams()
+	seconds['aggregate'] = time.perf_counter() - start
+
+	start = time.perf_counter()
+	output = str(streams)
+	seconds['render'] = time.perf_counter() - start
+	return seconds, output
+
+
+def parser():
+	parser = argparse.ArgumentParser(description='Benchmark each stage of the pipeline on synthetic data.')
+	parser.add_argument('--sizes', type=str, default='1000,10000,100000,1000000', help='Comma separated transaction counts')
+	parser.add_argument('--seed', type=int, default=0, help='Seed of the synthetic data')
+	parser.add_argument('--latency', type=float, default=0.0, help='Seconds of simulated latency per page')
+	parser.add_argument('--concurrency', type=int, default=1, help='Concurrent shards when fetching')
+	parser.add_argument('--output', type=str, default=None, help='Path of the JSON results, by default under benchmark/results')
+	parser.add_argument('--baseline', type=str, default=None, help='Path of earlier JSON results to compare against')
+	return parser
+
+
+def main():
+	args = parser().parse_args()
+	baseline = {}
+	if args.baseline:
+		with open(args.baseline) as f:
+			baseline = {(result['size'], result['stage']) : result['seconds'] for result in json.load(f)['results']}
+
+	results = []
+	for size in [int(size) for size in args.sizes.split(',')]:
+		seconds, _ = run(size, args.seed, args.latency, args.concurrency)
+		for stage in STAGES:
+			results.append({'size': size, 'stage': stage, 'seconds': seconds[stage]})
+			line = "%8d %-10s %9.3fs %8.2fus/transaction" % (size, stage, seconds[stage], seconds[stage] / size * 1e6)
+			if (size, stage) in baseline:
+				line += "  %.2fx baseline" % (baseline[(size, stage)] / seconds[stage])
+			print(line, flush=True)
+
+	now = datetime.now(timezone.utc)
+	output = args.output or os.path.join(os.path.dirname(__file__), 'results', now.strftime('%Y%m%dT%H%M%SZ.json'))
+	os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+	with open(output, 'w') as f:
+		json.dump({
+			'timestamp': now.isoformat(),
+			'python': platform.python_version(),
+			'machine': platform.machine(),
+			'seed': args.seed,
+			'latency': args.latency,
+			'concurrency': args.concurrency,
+			'results': results,
+		}, f, indent=2)
+	print("Saved results to %s" % output)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,165 @@
+"""
+A deterministic generator of Up API payloads for a household with personal and joint accounts,
+and a Client serving them page by page with a simulated latency.
+"""
+import time
+
+from datetime import datetime, timedelta, timezone
+from typing import Iterator, List
+
+from upbankapi.models import Account, Category, Transaction
+
+from src.config import Config, UpApiConfig
+from src.protocol import DEFAULT_PAGE_SIZE
+from test import fixtures
+from test.fake import PING_ID, raw_account, raw_category, raw_transaction
+
+START = datetime(2020, 1, 1, tzinfo=timezone.utc)
+MASK = 2**64 - 1
+
+CATEGORIES = {
+	'home': ['rent-and-mortgage', 'utilities', 'groceries', 'home-maintenance'],
+	'good-life': ['restaurants-and-cafes', 'takeaway', 'pubs-and-bars', 'events-and-gigs'],
+	'personal': ['clothing-and-accessories', 'health-and-medical', 'gifts-and-charity'],
+	'transport': ['fuel', 'public-transport', 'car-insurance-and-maintenance'],
+}
+TAGS = ['Holiday', 'Work', 'Gift', 'Reimbursable']
+PARTNER = 'Partner'
+# The spending side of transfers into the joint account, which a household would ignore
+TRANSFERS_TO_JOINT = ['Transfer to 2Up Spending', 'Cover to 2Up Spending']
+
+
+def mix(seed : int, index : int) -> int:
+	"""A splitmix64 hash, so each transaction can be generated from its index alone."""
+	z = (seed * 0x9E3779B97F4A7C15 + (index + 1) * 0xBF58476D1CE4E5B9) & MASK
+	z = ((z ^ (z >> 30)) * 0xBF58476D1CE4E5B9) & MASK
+	z = ((z ^ (z >> 27)) * 0x94D049BB133111EB) & MASK
+	return z ^ (z >> 31)
+
+
+def config() -> Config:
+	return fixtures.make_config(since=START, until=None, ignore_accounts=TRANSFERS_TO_JOINT)
+
+
+def collection_configs():
+	return config().collections
+
+
+def up_api_config(page_size : int = 100) -> UpApiConfig:
+	return UpApiConfig({'limit': None, 'pagesize': page_size, 'joint-account-funders': {'me': [], 'others': [PARTNER]}})
+
+
+class SyntheticBank:
+	"""
+	Raw payloads for `count` transactions, `interval` apart from START. Transactions come in
+	pairs that depend only on the seed and the pair's index, so any window of the history can
+	be generated without the rest. A pair is one of:
+
+	* a cover, moving money from the joint account to spending and back
+	* a funding transfer from spending to the joint account
+	* a transfer from the partner's account followed by a joint purchase
+	* a salary payment followed by a purchase
+	* two purchases, from either account, some of them tagged
+	"""
+	count : int
+	seed : int
+	interval : timedelta
+
+	def __init__(self, count : int, seed : int = 0, interval : timedelta = timedelta(minutes=30)):
+		self.count = count
+		self.seed = seed
+		self.interval = interval
+
+	@property
+	def since(self) -> datetime:
+		return START
+
+	@property
+	def until(self) -> datetime:
+		return self.date(self.count)
+
+	def date(self, index : int) -> datetime:
+		return START + self.interval * index
+
+	def accounts(self) -> List[dict]:
+		return [raw_account('spending', 'Spending'), raw_account('joint', '2Up Spending', ownership='JOINT')]
+
+	def categories(self) -> List[dict]:
+		categories = []
+		for parent, children in CATEGORIES.items():
+			categories.append(raw_category(parent, parent.replace('-', ' ').title(), children=children))
+			categories += [raw_category(child, child.replace('-', ' ').title(), parent=parent) for child in children]
+		return categories
+
+	def transaction(self, index : int) -> dict:
+		pair, second = divmod(index, 2)
+		kind = mix(self.seed, pair) % 100
+		amount = mix(self.seed, pair) % 20000 / 100 + 1
+		date = self.date(index)
+		id = 't%d' % index
+		if kind < 8:
+			if second:
+				return raw_transaction(id, TRANSFERS_TO_JOINT[1], -amount, date, 'spending', transfer_account='joint')
+			return raw_transaction(id, 'Cover from Spending', amount, date, 'joint', transfer_account='spending')
+		if kind < 14:
+			if second:
+				return raw_transaction(id, 'Transfer from Spending', amount * 10, date, 'joint', transfer_account='spending')
+			return raw_transaction(id, TRANSFERS_TO_JOINT[0], -amount * 10, date, 'spending', transfer_account='joint')
+		if kind < 18 and not second:
+			return raw_transaction(id, PARTNER, amount * 10, date, 'joint', transfer_account='partner-spending')
+		if kind < 24 and not second:
+			return raw_transaction(id, 'Employer', 2000 + amount, date, 'spending')
+		return self.purchase(index, date, 'joint' if kind < 18 else None)
+
+	def purchase(self, index : int, date : datetime, account : str = None) -> dict:
+		value = mix(self.seed + 1, index)
+		parent = list(CATEGORIES)[value % len(CATEGORIES)]
+		children = CATEGORIES[parent]
+		category = children[(value >> 8) % len(children)]
+		tags = [TAGS[(value >> 16) % len(TAGS)]] if (value >> 24) % 10 == 0 else []
+		if account is None:
+			account = 'joint' if (value >> 32) % 3 == 0 else 'spending'
+		return raw_transaction('t%d' % index, 'Merchant %d' % ((value >> 40) % 3000), -((value >> 48) % 15000 / 100 + 1),
+			date, account, category=category, parent_category=parent, tags=tags)
+
+	def transactions(self, since : datetime = None, until : datetime = None) -> Iterator[dict]:
+		"""The payloads created in the since..until window, newest first as returned by the Up API."""
+		first = 0 if since is None else max(0, -(-(since - START) // self.interval))
+		last = self.count - 1 if until is None else min(self.count - 1, (until - START) // self.interval)
+		return (self.transaction(index) for index in range(last, first - 1, -1))
+
+
+class SyntheticClient:
+	"""Implements the Client protocol over a SyntheticBank, sleeping for `latency` seconds on every page."""
+	bank : SyntheticBank
+	latency : float
+	pages : int
+
+	def __init__(self, bank : SyntheticBank, latency : float = 0.0):
+		self.bank = bank
+		self.latency = latency
+		self.pages = 0
+
+	def ping(self):
+		return PING_ID
+
+	def accounts(self, *, limit=None):
+		return [Account(self, raw) for raw in self.bank.accounts()][:limit]
+
+	def categories(self):
+		return [Category(self, raw) for raw in self.bank.categories()]
+
+	def transactions(self, account=None, *, since=None, until=None, category=None, limit=None, page_size=DEFAULT_PAGE_SIZE):
+		account = getattr(account, 'id', account)
+		count = 0
+		for raw in self.bank.transactions(since, until):
+			if account is not None and raw['relationships']['account']['data']['id'] != account:
+				continue
+			if limit is not None and count == limit:
+				return
+			if count % page_size == 0:
+				self.pages += 1
+				if self.latency:
+					time.sleep(self.latency)
+			count += 1
+			yield Transaction(self, raw)
@@ -0,0 +1,53 @@
+"""
+Benchmarks building the Sankey output from a columnar TransactionTable.
+
+Run from the repository root with `python -m benchmark.table [count]`.
+"""
+import sys
+import time
+import numpy as np
+
+from benchmark.streams import collection_configs, synthetic_transactions
+from src.stream import StreamCollection
+from src.table import TransactionTable
+
+
+def tile(table, count):
+	"""Repeats the rows of a table until it holds `count` transactions."""
+	rows = np.resize(np.arange(len(table)), count)
+	columns = lambda name: (getattr(table, name)[rows], getattr(table, name[:-1] + '_values'))
+	return TransactionTable(
+		amounts = table.amounts[rows],
+		totals = table.totals[rows],
+		dates = table.dates[rows],
+		descriptions = (table.descriptions[rows], table.description_values),
+		category_paths = (table.category_paths[rows], table.category_path_values),
+		tags = (table.tags[rows], table.tag_values),
+		sources = (table.sources[rows], table.source_values),
+		destinations = (table.destinations[rows], table.destination_values),
+	)
+
+
+def main(count):
+	transactions = synthetic_transactions(100000)
+	start = time.perf_counter()
+	streams = StreamCollection(collection_configs())
+	streams.add_transactions(transactions)
+	expected = str(streams.cleanup().link())
+	objects_time = time.perf_counter() - start
+
+	table = TransactionTable.from_transactions(transactions)
+	start = time.perf_counter()
+	actual = str(table.as_streams(collection_configs()))
+	table_time = time.perf_counter() - start
+	assert expected == actual, "outputs differ"
+	print("%d transactions: objects %.3fs, table %.3fs" % (len(transactions), objects_time, table_time))
+
+	table = tile(table, count)
+	start = time.perf_counter()
+	str(table.as_streams(collection_configs()))
+	print("%d transactions: table %.3fs" % (count, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+	main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,93 @@
+import asyncio
+import logging as log
+
+from datetime import datetime
+from typing import AsyncIterable, List, Tuple, Union
+
+from .config import CategoryConfig, Config, UpApiConfig
+from .fetch import ConcurrentFetcher, page_count
+from .interface import TransactionCollection, UpBankApiHelper
+from .protocol import AsyncClient, Transaction
+from .stream import StreamCollection
+from .timings import timings
+
+
+async def collect(items : Union[AsyncIterable, list]) -> list:
+	"""Collects a paginated list from an async client, which may already be a plain list."""
+	if hasattr(items, '__aiter__'):
+		return [item async for item in items]
+	return list(items)
+
+
+class AsyncUpBankApiHelper(UpBankApiHelper):
+	"""
+	Starts the ping, the accounts, the categories and the first page of every transaction shard
+	at once, rather than one after another. The Up API pages with cursors, so the pages of a
+	shard still follow each other, and a run takes about as long as its longest shard.
+	Transactions are converted as by UpBankApiHelper once everything has arrived.
+	"""
+	@staticmethod
+	async def connect(client : AsyncClient, config : UpApiConfig, since : datetime, until : datetime,
+			retries : int = 5, backoff : float = 1.0, configured_categories : List[CategoryConfig] = None) -> Tuple['AsyncUpBankApiHelper', List[Transaction]]:
+		"""Verifies the token and downloads everything needed to convert the transactions in the window."""
+		# a limited download only needs the newest transactions, so isn't sharded
+		shards = ConcurrentFetcher.shards(since, until, max(config.concurrency, 1) if config.limit is None else 1)
+		fetch_shard = lambda shard: AsyncUpBankApiHelper.fetch_shard(client, *shard, limit=config.limit,
+			page_size=config.pagesize, retries=retries, backoff=backoff)
+		with timings.span('connect'):
+			ping, accounts, categories, *pages = await asyncio.gather(
+				client.ping(),
+				AsyncUpBankApiHelper.fetch_accounts(client),
+				client.categories(),
+				*map(fetch_shard, shards))
+		log.info("Authorized: " + ping)
+		helper = AsyncUpBankApiHelper(client, config, accounts=accounts, categories=categories, configured_categories=configured_categories)
+		return helper, ConcurrentFetcher.merge(pages, config.limit)
+
+	@staticmethod
+	async def fetch_accounts(client : AsyncClient) -> list:
+		return await collect(await client.accounts())
+
+	@staticmethod
+	async def fetch_shard(client : AsyncClient, since : datetime, until : datetime, limit : int, page_size : int,
+			retries : int, backoff : float) -> List[Transaction]:
+		from upbankapi import RateLimitExceededException
+		for attempt in range(retries + 1):
+			try:
+				transactions = await collect(await client.transactions(since=since, until=until, limit=limit, page_size=page_size))
+				timings.count('pages fetched', page_count(len(transactions), page_size))
+				return transactions
+			except RateLimitExceededException:
+				if attempt == retries:
+					raise
+				timings.count('rate limit retries')
+				delay = backoff * 2 ** attempt
+				log.warning("Rate limited fetching %s - %s, retrying in %.1fs", since, until, delay)
+				await asyncio.sleep(delay)
+
+
+async def streams_from_async_up_api(config : Config, client : AsyncClient) -> StreamCollection:
+	"""The default pipeline, fetching from an async client."""
+	if config.up_api.store:
+		log.warning("The transaction store is not used with an async client")
+	helper, fetched = await AsyncUpBankApiHelper.connect(client, config.up_api, config.since, config.until,
+		configured_categories=config.categories)
+	transactions = TransactionCollection(config)
+	transactions.add_transactions(list(timings.timed('convert', map(helper.to_generic_transaction, fetched), counter='transactions converted')))
+	return transactions.as_streams()
+
+
+async def main(config : Config) -> StreamCollection:
+	"""Runs the pipeline on the Up API with the async client, which needs aiohttp to be installed."""
+	from upbankapi import NotAuthorizedException
+	try:
+		from upbankapi import AsyncClient as UpAsyncClient
+	except ImportError:
+		log.critical("The async client needs aiohttp, install it with `pip install up-bank-api[async]`")
+		exit(1)
+	async with UpAsyncClient(config.up_api.token) as client:
+		try:
+			return await streams_from_async_up_api(config, client)
+		except NotAuthorizedException:
+			log.critical("The token is invalid")
+			exit(1)
@@ -0,0 +1,77 @@
+from typing import Iterable, List, Mapping, Optional, Tuple
+
+from .config import CategoryConfig
+from .protocol import Category
+from .transaction import intern_path
+
+
+class CategoryIndex:
+	"""
+	Maps each category straight to the names of its ancestors and itself, from the top level
+	down, so a transaction's category path is found with a single lookup however deep the
+	category is. The index is built once from the categories of the client, and each path is
+	worked out the first time it is asked for.
+
+	Categories from the config sit under an Up category, another configured category or at the
+	top level, found by name. A transaction is moved into the first configured category that
+	matches one of its tags or its description, before its Up category is considered.
+	"""
+	categories : Mapping[str, Category]
+	configured : Mapping[str, CategoryConfig]
+	paths : Mapping[str, Tuple[str, ...]]
+
+	def __init__(self, categories : Iterable[Category], configured : Optional[List[CategoryConfig]] = None):
+		self.categories = {category.id : category for category in categories}
+		self.ids = {category.name : id for id, category in self.categories.items()}
+		self.configured = {category.name : category for category in configured or []}
+		self.tags = {}
+		self.accounts = []
+		for category in self.configured.values():
+			for tag in category.tags.collection:
+				self.tags.setdefault(tag, category.name)
+			if category.accounts:
+				self.accounts.append(category)
+		self.paths = {}  # Up category id -> path
+		self.configured_paths = {}  # configured name -> path
+		for name in self.configured:  # so that a mistake in the config is found before the transactions are downloaded
+			self.configured_path(name)
+
+	def path(self, id : Optional[str]) -> Tuple[str, ...]:
+		"""The path of an Up category, which is empty for a transaction without a category."""
+		if id is None:
+			return ()
+		path = self.paths.get(id)
+		if path is None:
+			category = self.categories[id]
+			parent = self.path(category.parent.id) if category.parent else ()
+			path = self.paths[id] = intern_path(parent + (category.name,))
+		return path
+
+	def configured_path(self, name : str, children : Tuple[str, ...] = ()) -> Tuple[str, ...]:
+		path = self.configured_paths.get(name)
+		if path is None:
+			if name in children:
+				raise ValueError("Categories %s are their own parent" % ' > '.join(children))
+			parent = self.configured[name].parent
+			if parent is None:
+				path = (name,)
+			elif parent in self.configured:
+				path = self.configured_path(parent, children + (name,)) + (name,)
+			elif parent in self.ids:
+				path = self.path(self.ids[parent]) + (name,)
+			else:
+				raise ValueError("Unknown parent category %r of %r" % (parent, name))
+			path = self.configured_paths[name] = intern_path(path)
+		return path
+
+	def categorise(self, id : Optional[str], description : str, tags : Iterable[str]) -> Tuple[str, ...]:
+		"""The path of a transaction, from a configured category that it matches or else its Up category."""
+		if self.configured:
+			# tags from the Up API are Tag objects, named by their id
+			tags = [getattr(tag, 'id', tag) for tag in tags]
+			name = next((self.tags[tag] for tag in tags if tag in self.tags), None)
+			if name is None:
+				name = next((category.name for category in self.accounts if category.accounts.contains(description)), None)
+			if name is not None:
+				return self.configured_path(name)
+		return self.path(id)
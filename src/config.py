@@ -1,28 +1,35 @@
 import argparse
+import copy
+import hashlib
+import json
 import logging as log
-import yaml
+import os
+import pickle
 
 from os import getenv
+from os.path import splitext
 from enum import Enum
-from datetime import datetime
-from dateutil import parser
-from dateutil.relativedelta import relativedelta
-from typing import Mapping
-from upbankapi import NotAuthorizedException
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
 
-from .protocol import Client
+# The cached config is built by this module and the classifier rules of transaction.py, so the
+# cache is keyed on their source as well as the config file
+CACHE_SOURCES = [__file__, os.path.join(os.path.dirname(__file__), 'transaction.py')]
+CACHE_DIR = os.path.join(getenv('XDG_CACHE_HOME') or os.path.expanduser('~/.cache'), 'up-bankey')
 
 
 def toDateTime(input: str):
-	if input is None:
-		return None
+	if input is None or isinstance(input, datetime):
+		return input
 	if input in {"today", "now"}:
 		return datetime.now()
 	if input.endswith("ago"):
+		from dateutil.relativedelta import relativedelta
 		value, unit, _ = input.split()  # assumes format '1 year ago', etc
 		if not unit.endswith('s'):
 			unit += 's'  # plural necessary
 		return datetime.now() - relativedelta(**{unit: int(value)})
+	from dateutil import parser
 	return parser.parse(input)
 
 
@@ -106,23 +113,72 @@ class JointAccountConfig:
 		self.partner_accounts = AccountClassifierConfig(config['others'])
 
 
+class MerchantConfig:
+	rules : List[Tuple[str, str]]
+	cache_size : int
+
+	def __init__(self, config):
+		self.rules = [(rule['pattern'], rule.get('replace', '')) for rule in config['rules']]
+		self.cache_size = config['cache-size']
+
+
+class CategoryConfig:
+	"""A category added in the config, which transactions are moved into by their tags or description."""
+	name : str
+	parent : Optional[str]
+	tags : ClassifierConfig
+	accounts : AccountClassifierConfig
+
+	def __init__(self, config):
+		self.name = config['name']
+		self.parent = config.get('parent')
+		self.tags = ClassifierConfig(config.get('tags'))
+		self.accounts = AccountClassifierConfig(config.get('accounts'))
+
+
+class StoreConfig:
+	path : str
+	overlap : timedelta
+
+	def __init__(self, config):
+		self.path = config.get('path', 'transactions.db')
+		self.overlap = timedelta(days=config.get('overlap', 7))
+
+
+class ResponseCacheConfig:
+	path : str
+	ttl : timedelta
+
+	def __init__(self, config):
+		self.path = os.path.expanduser(config.get('path', os.path.join(CACHE_DIR, 'responses')))
+		self.ttl = timedelta(hours=config.get('ttl', 24))
+
+
 class UpApiConfig:
 	token : str
 	limit : int
 	pagesize : int
+	concurrency : int
 	joint : JointAccountConfig
+	store : Optional[StoreConfig]
+	cache : Optional[ResponseCacheConfig]
 
 	def __init__(self, config):
 		self.token = getenv(config['token'] if 'token' in config else "UP_TOKEN")
 		self.limit = config['limit']
 		self.pagesize = config['pagesize']
+		self.concurrency = config.get('concurrency', 1)
 		if 'joint-account-funders' in config:
 			self.joint = JointAccountConfig(config['joint-account-funders'])
+		self.store = StoreConfig(config['store']) if 'store' in config else None
+		self.cache = ResponseCacheConfig(config['cache'] or {}) if 'cache' in config else None
 
 	# TODO: Move into interface
 	def init_client(self, client_constructor):
+		from upbankapi import NotAuthorizedException
+		from .transport import CachingSession
 		try:
-			client = client_constructor(self.token)
+			client = client_constructor(self.token, session=CachingSession(self.cache, pool_size=self.concurrency))
 			log.info("Authorized: " + client.ping())
 			return client
 		except NotAuthorizedException:
@@ -130,26 +186,116 @@ class UpApiConfig:
 			exit(1)
 
 
+class ReplayConfig:
+	"""Fixture recorded with `--record`, which is read in place of the Up API."""
+	path : str
+
+	def __init__(self, config):
+		self.path = os.path.expanduser(config['path'])
+
+	def init_client(self):
+		from .replay import ReplayClient
+		client = ReplayClient(self.path)
+		log.info("Replaying %s: %s", self.path, client.ping())
+		return client
+
+
+class PeriodConfig:
+	name : str
+	since : datetime
+	until : datetime
+
+	# rolling granularity -> (months per period, name format)
+	granularities = {
+		'monthly': (1, lambda date: date.strftime('%Y-%m')),
+		'quarterly': (3, lambda date: '%d-Q%d' % (date.year, (date.month - 1) // 3 + 1)),
+		'yearly': (12, lambda date: str(date.year)),
+	}
+
+	def __init__(self, name, since, until):
+		self.name = str(name)
+		self.since = since
+		self.until = until
+
+	def __repr__(self):
+		return "%s<name=%r, since=%s, until=%s>" % (self.__class__.__name__, self.name, self.since, self.until)
+
+	@staticmethod
+	def from_config(config, until : datetime) -> List['PeriodConfig']:
+		if 'rolling' in config:
+			return PeriodConfig.rolling(config['rolling'], config.get('count', 12), until)
+		return [PeriodConfig(config['name'], toDateTime(config['since']), toDateTime(config.get('until', 'today')))]
+
+	@staticmethod
+	def rolling(granularity : str, count : int, until : datetime) -> List['PeriodConfig']:
+		"""The last `count` calendar periods up to `until`, oldest first. The last period may be partial."""
+		from dateutil.relativedelta import relativedelta
+		months, to_name = PeriodConfig.granularities[granularity]
+		start = datetime(until.year, until.month - (until.month - 1) % months, 1, tzinfo=until.tzinfo)
+		periods = []
+		for i in reversed(range(count)):
+			since = start - relativedelta(months=months * i)
+			periods.append(PeriodConfig(to_name(since), since, min(since + relativedelta(months=months), until)))
+		return periods
+
+
+class CollectionConfigs(dict):
+	"""
+	The collection configs by transaction type, along with their compiled classifier rules and
+	merchant normaliser.
+	"""
+	rules : 'ClassifierRules'
+	normaliser : Optional['DescriptionNormaliser']
+
+	def compile(self, merchants : MerchantConfig = None) -> 'CollectionConfigs':
+		from .transaction import ClassifierRules, DescriptionNormaliser
+		self.rules = ClassifierRules(self)
+		self.normaliser = DescriptionNormaliser(merchants) if merchants and merchants.rules else None
+		return self
+
+
 class Config:
 	output : str
 	since : datetime
 	until : datetime
-	collections : Mapping[TransactionType, CollectionConfig]
+	formats : List[str]
+	cover_window : Optional[timedelta]
+	joint_split : str
+	combine_covers : bool
+	periods : List[PeriodConfig]
+	categories : List[CategoryConfig]
+	collections : CollectionConfigs
+	collections_digest : str
 	up_api : UpApiConfig
-
-	def __init__(self):
-		self.args = Config.parser().parse_args()
-		config = Config._generate_valid_config(self.args.config)
+	replay : Optional[ReplayConfig]
+	cache_hit : bool
+
+	def __init__(self, args : Optional[List[str]] = None, config : Optional[dict] = None):
+		"""
+		Reads the command line, or `args` in its place, and the config file it names. A `config`
+		dict can be given instead of the file, which is resolved with the defaults in the same way.
+		"""
+		self.args = Config.parser().parse_args(args)
+		if config is None:
+			config, self.collections, self.cache_hit = Config._load(self.args.config, None if self.args.no_cache else CACHE_DIR)
+		else:
+			config = copy.deepcopy(config)
+			Config._populate_recursively(config, defaultConfig)
+			self.collections, self.cache_hit = Config._generate_collections(config), False
 		self.output = self.args.output if self.args.output else config['options']['output']
+		self.formats = self.args.format or config['options'].get('formats', ['sankeymatic'])
 		self.since = toDateTime(config['options']['dates']['since'])
 		self.until = toDateTime(config['options']['dates']['until'])
+		cover_window = config['options']['cover-window']
+		self.cover_window = timedelta(days=cover_window) if cover_window is not None else None
+		self.joint_split = config['options'].get('joint-split', 'window')
+		self.combine_covers = bool(config['options'].get('combine-covers', False))
+		self.periods = [period for c in config['options'].get('periods', []) for period in PeriodConfig.from_config(c, self.until)]
+		self.categories = [CategoryConfig(c) for c in config['categories']]
+		self.collections_digest = Config._collections_digest(config)
 		self.up_api = UpApiConfig(config['options']['sources']['up-api'])
-		self.collections = {TransactionType.Ignore : IgnoreConfig(config['ignore'])}
-		for name, c in config['collections'].items():
-			self.collections[TransactionType(name)] = CollectionConfig(c)
-
-		# "Interest" will always be an income stream, so populate here
-		self.collections[TransactionType.Income].accounts.add("Interest")
+		replay = config['options']['sources'].get('replay')
+		self.replay = ReplayConfig(replay) if replay else None
 		self.setup_logging()
 
 	@staticmethod
@@ -157,7 +303,17 @@ class Config:
 		parser = argparse.ArgumentParser(description='Setting the config.')
 		parser.add_argument('--config', type=str, default=None, help='Path to config.yaml file')
 		parser.add_argument('-o', '--output', type=str, default=None, help='Path to output.txt file')
+		parser.add_argument('--format', type=str, action='append', default=None, help='Output format, one of sankeymatic, json, csv or plotly, which can be repeated')
 		parser.add_argument('-v', '--verbose', action="store_true", help='Verbose output')
+		parser.add_argument('--stream', action="store_true", help='Process transactions page by page to bound memory use')
+		parser.add_argument('--state', type=str, default=None, help='Path to a saved stream state, updated with only new transactions')
+		parser.add_argument('--workers', type=int, default=1, help='Number of processes used to convert and classify transactions')
+		parser.add_argument('--record', type=str, default=None, help='Path to write a fixture of the responses from the Up API, which can be replayed with the replay source')
+		parser.add_argument('--async', dest='use_async', action="store_true", help='Fetch the accounts, categories and transactions concurrently with the async client (requires aiohttp)')
+		parser.add_argument('--no-cache', action="store_true", help='Parse the config file without using the compiled config cache')
+		parser.add_argument('--timings', action="store_true", help='Print the time spent in each stage of the pipeline')
+		parser.add_argument('--timings-json', type=str, default=None, help='Path to write the time spent in each stage as JSON')
+		parser.add_argument('--profile-startup', action="store_true", help='Report the time spent importing modules and loading the config')
 		return parser
 	
 	def setup_logging(self):
@@ -171,17 +327,71 @@ class Config:
 		return 'Dates:\n %s - %s\n' % (self.since, self.until) \
 			+ 'Collections:' + '\n'.join(str(collection_config) for collection_config in self.collections.values())
 
-	def print_to_file(self, object):
-		with open(self.output, 'w') as f:
-			print(object, file=f)
+	def output_for(self, period_name : str) -> str:
+		root, extension = splitext(self.output)
+		return "%s-%s%s" % (root, period_name, extension)
 
 	@staticmethod
-	def _generate_valid_config(path):
-		with open(path, 'r') as f:
-			config = yaml.safe_load(f)
-			Config._populate_recursively(config, defaultConfig)
+	def _load(path : str, cache_dir : Optional[str] = CACHE_DIR) -> Tuple[dict, CollectionConfigs, bool]:
+		"""
+		Loads the resolved config and compiled collections, from the cache if the config file
+		has been loaded before. Only the file contents are cached, so relative dates and
+		environment variables are still resolved on every run.
+		"""
+		with open(path, 'rb') as f:
+			contents = f.read()
+		cache_path = Config._cache_path(contents, cache_dir) if cache_dir else None
+		if cache_path and os.path.exists(cache_path):
+			try:
+				with open(cache_path, 'rb') as f:
+					config, collections = pickle.load(f)
+				return config, collections, True
+			except Exception as e:  # a stale or corrupt entry is rebuilt below
+				log.debug("Ignoring config cache %s: %s", cache_path, e)
+
+		config = Config._generate_valid_config(contents)
+		collections = Config._generate_collections(config)
+		if cache_path:
+			try:
+				os.makedirs(cache_dir, exist_ok=True)
+				with open(cache_path + '.tmp', 'wb') as f:
+					pickle.dump((config, collections), f, protocol=pickle.HIGHEST_PROTOCOL)
+				os.replace(cache_path + '.tmp', cache_path)
+			except OSError as e:
+				log.debug("Could not write config cache %s: %s", cache_path, e)
+		return config, collections, False
+
+	@staticmethod
+	def _collections_digest(config : dict) -> str:
+		"""A digest of the resolved config that decides how transactions are classified and grouped."""
+		classifying = {key : config[key] for key in ['collections', 'ignore', 'merchants', 'categories']}
+		return hashlib.sha256(json.dumps(classifying, sort_keys=True, default=str).encode()).hexdigest()
+
+	@staticmethod
+	def _cache_path(contents : bytes, cache_dir : str) -> str:
+		digest = hashlib.sha256(contents)
+		for source in CACHE_SOURCES:
+			with open(source, 'rb') as f:
+				digest.update(f.read())
+		return os.path.join(cache_dir, digest.hexdigest() + '.pickle')
+
+	@staticmethod
+	def _generate_valid_config(contents):
+		import yaml
+		config = yaml.safe_load(contents)
+		Config._populate_recursively(config, defaultConfig)
 		return config
 
+	@staticmethod
+	def _generate_collections(config) -> CollectionConfigs:
+		collections = CollectionConfigs({TransactionType.Ignore : IgnoreConfig(config['ignore'])})
+		for name, c in config['collections'].items():
+			collections[TransactionType(name)] = CollectionConfig(c)
+
+		# "Interest" will always be an income stream, so populate here
+		collections[TransactionType.Income].accounts.add("Interest")
+		return collections.compile(MerchantConfig(config['merchants']))
+
 	# Inspired by https://stackoverflow.com/questions/36831998/how-to-fill-default-parameters-in-yaml-file-using-python
 	@staticmethod
 	def _populate_recursively(input: dict, default):
@@ -209,7 +419,10 @@ defaultConfig = {
 		'dates': {
 			'since' : '1 year ago',
 			'until': 'today'
-		}
+		},
+		'cover-window': 7,
+		'joint-split': 'window',
+		'combine-covers': False
 	},
 	'collections' : {
 		'income': {
@@ -231,7 +444,12 @@ defaultConfig = {
 			'threshold' : defaultThreshold
 		}
 	},
-	'ignore': defaultClassifier
+	'ignore': defaultClassifier,
+	'categories': [],
+	'merchants': {
+		'rules': [],
+		'cache-size': 4096
+	}
 }
 
 
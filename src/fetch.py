@@ -0,0 +1,104 @@
+import logging as log
+import time
+
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Iterable, Iterator, List, Optional, Tuple, Union
+
+from .protocol import Account, Client, DEFAULT_PAGE_SIZE, Transaction
+from .timings import timings
+
+
+def page_count(count : int, page_size : int) -> int:
+	# every page of a request is full apart from the last, and an empty request is still a page
+	return max(1, -(-count // page_size))
+
+
+def count_pages(transactions : Iterable[Transaction], page_size : int) -> Iterator[Transaction]:
+	count = 0
+	for count, transaction in enumerate(transactions, 1):
+		yield transaction
+	timings.count('pages fetched', page_count(count, page_size))
+
+
+class ConcurrentFetcher:
+	"""
+	Downloads transactions by splitting the date window into shards, which are paged through
+	concurrently on a bounded thread pool. Implements the `transactions` call of the Client
+	protocol, so it can stand in for the client wherever only transactions are fetched. A limited
+	download only needs the newest transactions, so it isn't sharded.
+	"""
+	client : Client
+	concurrency : int
+	retries : int
+	backoff : float
+
+	def __init__(self, client : Client, concurrency : int, retries : int = 5, backoff : float = 1.0):
+		self.client = client
+		self.concurrency = concurrency
+		self.retries = retries
+		self.backoff = backoff
+
+	@staticmethod
+	def shards(since : datetime, until : datetime, count : int) -> List[Tuple[datetime, datetime]]:
+		step = (until - since) / count
+		bounds = [since + step * i for i in range(count)] + [until]
+		return list(zip(bounds[:-1], bounds[1:]))
+
+	def transactions(
+		self,
+		account: Union[str, Account] = None,
+		*,
+		since: datetime = None,
+		until: datetime = None,
+		limit: int = None,
+		page_size: int = DEFAULT_PAGE_SIZE,
+	) -> Iterable[Transaction]:
+		if since is None or until is None or limit is not None or self.concurrency <= 1:
+			transactions = self.fetch(account, since, until, limit, page_size)
+			return count_pages(transactions, page_size) if timings.enabled else transactions
+
+		fetch = lambda shard: self.fetch_shard(account, *shard, limit=limit, page_size=page_size)
+		with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+			return ConcurrentFetcher.merge(executor.map(fetch, ConcurrentFetcher.shards(since, until, self.concurrency)), limit)
+
+	@staticmethod
+	def merge(pages : Iterable[List[Transaction]], limit : int = None) -> List[Transaction]:
+		"""Merges the transactions of every shard, newest first as returned by the Up API."""
+		merged = {t.id : t for page in pages for t in page}  # shards share their boundaries
+		transactions = sorted(merged.values(), key=lambda t: t.created_at, reverse=True)
+		return transactions[:limit] if limit else transactions
+
+	def fetch_shard(self, account, since : datetime, until : datetime, limit : int, page_size : int) -> List[Transaction]:
+		transactions = list(self.fetch(account, since, until, limit, page_size))
+		timings.count('pages fetched', page_count(len(transactions), page_size))
+		return transactions
+
+	def fetch(self, account, since : Optional[datetime], until : Optional[datetime], limit : Optional[int], page_size : int) -> Iterator[Transaction]:
+		"""
+		Pages through the transactions of a window, newest first. When rate limited, backs off and
+		resumes from the oldest transaction returned so far, skipping those already returned.
+		"""
+		from upbankapi import RateLimitExceededException
+		count, oldest, returned = 0, until, set()  # ids returned at the oldest time, which are fetched again on resuming
+		for attempt in range(self.retries + 1):
+			try:
+				remaining = None if limit is None else limit - count + len(returned)
+				for transaction in self.client.transactions(account, since=since, until=oldest, limit=remaining, page_size=page_size):
+					if transaction.id in returned:
+						continue
+					if limit is not None and count == limit:
+						return
+					if transaction.created_at != oldest:
+						oldest, returned = transaction.created_at, set()
+					returned.add(transaction.id)
+					count += 1
+					yield transaction
+				return
+			except RateLimitExceededException:
+				if attempt == self.retries:
+					raise
+				timings.count('rate limit retries')
+				delay = self.backoff * 2 ** attempt
+				log.warning("Rate limited fetching %s - %s, retrying in %.1fs", since, until, delay)
+				time.sleep(delay)
@@ -1,57 +1,91 @@
 from __future__ import annotations
 
-from datetime import datetime
-from itertools import chain, combinations, product
-from typing import List, Mapping, Callable, Union
-from upbankapi.models import OwnershipType
+from datetime import datetime, timedelta
+from os import path
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Mapping, Callable, Union
 
-from .config import Config, UpApiConfig
+from .categories import CategoryIndex
+from .config import CategoryConfig, Config, UpApiConfig
+from .fetch import ConcurrentFetcher
+from .ledger import FundingLedger
 from .protocol import Account, Category, Client as ClientProtocol, Transaction
+from .periods import PeriodBuckets
+from .state import StreamState
+from .store import TransactionStore
 from .stream import StreamCollection
-from .transaction import GenericTransaction, TransactionFilter, AccountType
+from .timings import timings
+from .transaction import CoverCombiner, GenericTransaction, RelationIndex, TransactionFilter, AccountType
+
+if TYPE_CHECKING:
+	from .table import TransactionTable
 
 import logging as log
 
 class UpBankApiHelper:
 	accounts : Mapping[str, Account]
 	categories : Mapping[str, Category]
+	category_index : CategoryIndex
 	client : ClientProtocol
+	fetcher : ConcurrentFetcher
 	config : UpApiConfig
 
-	def __init__(self, client : ClientProtocol, config : UpApiConfig):
+	def __init__(self, client : ClientProtocol, config : UpApiConfig, accounts : List[Account] = None, categories : List[Category] = None,
+			configured_categories : List[CategoryConfig] = None):
 		# Cache the accounts and categories to avoid triggering API rate-limit
-		self.accounts = {account.id : account for account in client.accounts()}
-		self.categories = {category.id : category for category in client.categories()}
+		self.accounts = {account.id : account for account in (accounts if accounts is not None else client.accounts())}
+		self.categories = {category.id : category for category in (categories if categories is not None else client.categories())}
+		self.category_index = CategoryIndex(self.categories.values(), configured_categories)
 		self.client = client
+		self.fetcher = ConcurrentFetcher(client, config.concurrency)
 		self.config = config
 
 	@staticmethod
 	def account_type(account : Account):
-		if account.ownership_type == OwnershipType.JOINT:
+		# compared by value, which OwnershipType members equal, to avoid importing upbankapi
+		if account.ownership_type == 'JOINT':
 			return AccountType.JOINT
-		if account.ownership_type == OwnershipType.INDIVIDUAL:
+		if account.ownership_type == 'INDIVIDUAL':
 			return AccountType.PERSONAL
 
 	def transactions(self, since : datetime, until : datetime):
-		up_transactions = self.client.transactions(limit=self.config.limit,
+		return list(self.iter_transactions(since, until))
+
+	def iter_transactions(self, since : datetime, until : datetime) -> Iterator[GenericTransaction]:
+		"""Converts transactions as the pages arrive, without holding the full list."""
+		def fetched():
+			# deferred, so a concurrent download made up front is timed with the pages of a lazy one
+			yield from self.up_transactions(since, until)
+		yield from timings.timed('convert', map(self.to_generic_transaction, timings.timed('fetch', fetched())), counter='transactions converted')
+
+	def up_transactions(self, since : datetime, until : datetime) -> Iterable[Transaction]:
+		if self.config.store:
+			return self.stored_transactions(since, until)
+		return self.fetcher.transactions(limit=self.config.limit,
 										page_size=self.config.pagesize,
 										since=since,
 										until=until)
-		return self.to_generic_transactions(up_transactions)
+
+	def stored_transactions(self, since : datetime, until : datetime):
+		store = TransactionStore(self.config.store.path, self.config.store.overlap)
+		try:
+			store.sync(self.fetcher, since, until, page_size=self.config.pagesize)
+			yield from store.iter_transactions(since, until, limit=self.config.limit, client=self.client)
+		finally:
+			store.close()
 
 	def to_generic_transactions(self, transactionList : List[Transaction]):
 		return [self.to_generic_transaction(source) for source in transactionList]
 
 	def to_generic_transaction(self, transaction : Transaction):
 		return GenericTransaction(
+			id = transaction.id,
 			date = transaction.created_at,
 			description = transaction.description,
 			amount = transaction.amount,
 			currency = transaction.currency,
 			source = self.source_account_type(transaction),
 			destination = self.destination_account_type(transaction),
-			category = self.category(transaction),
-			parentCategory = self.parent_category(transaction),
+			categoryPath = self.category_path(transaction),
 			tags = transaction.tags,
 			message = transaction.message
 		)
@@ -71,68 +105,157 @@ class UpBankApiHelper:
 					return AccountType.PARTNER
 		return AccountType.EXTERNAL
 
-	def category(self, transaction : Transaction):
-		if transaction.category:
-			return self.categories[transaction.category.id].name
-		return None
-
-	def parent_category(self, transaction : Transaction):
-		if transaction.category and transaction.category.parent:
-			return self.categories[transaction.category.parent.id].name
-		return None
+	def category_path(self, transaction : Transaction):
+		id = transaction.category.id if transaction.category else None
+		return self.category_index.categorise(id, transaction.description, transaction.tags)
 
 
 class TransactionCollection:
 	config : Config
 	transactions : List[GenericTransaction]
+	relations : RelationIndex
+	ledger : FundingLedger
+	combiner : CoverCombiner
 
 	def __init__(self, config : Config):
 		self.config = config
 		self.transactions = list()
+		self.relations = RelationIndex(config.cover_window)
+		self.ledger = FundingLedger(config.joint_split)
+		self.combiner = CoverCombiner() if config.combine_covers else None
 		pass
 
 	def add_from_up_api(self, client : ClientProtocol) -> None:
-		helper = UpBankApiHelper(client, self.config.up_api)
+		helper = self._helper(client)
 		transactions = helper.transactions(self.config.since, self.config.until)
 		self.add_transactions(transactions)
 		pass
 
+	def stream_from_up_api(self, client : ClientProtocol) -> StreamCollection:
+		helper = self._helper(client)
+		return self.stream_transactions(helper.iter_transactions(self.config.since, self.config.until))
+
+	def stream_transactions(self, transactions : Iterable[GenericTransaction]) -> StreamCollection:
+		"""
+		Classifies and inserts transactions into streams as they arrive, so memory use does not
+		grow with the length of the history. Covers aren't combined here, so no transactions are
+		kept for the relation pass, and the ledger only totals the funding transfers. Joint expenses
+		can't be split until all of the funding transfers have been seen, so these are held back
+		and inserted last, into streams created when they were first seen so that the output is
+		ordered as in batch mode.
+		"""
+		self._warn_without_combine()
+		streams = StreamCollection(self.config.collections, keep_transactions=False)
+		held = []
+		with timings.span('stream transactions'):
+			for transaction in transactions:
+				self.ledger.add([transaction])
+				if transaction.source == AccountType.JOINT and transaction.destination == AccountType.EXTERNAL:
+					held.append(transaction)
+					streams.reserve(transaction)
+				else:
+					streams.add_transaction(transaction)
+		self._update_joint_transaction_splits()
+		streams.add_transactions(held)
+		return streams.cleanup().link()
+
+	def update_from_up_api(self, client : ClientProtocol, state_path : str) -> StreamCollection:
+		"""
+		Applies the transactions since the last run to the stream state saved at `state_path`,
+		retracting any that have fallen out of the date window, and builds streams from it.
+		"""
+		self._warn_without_combine()
+		collections = self.config.collections
+		joint_split, digest = self.config.joint_split, self.config.collections_digest
+		if path.exists(state_path):
+			state = StreamState.load(state_path, collections, joint_split, digest)
+		else:
+			state = StreamState(collections, joint_split=joint_split, digest=digest)
+		since = self.config.since
+		if state.until is not None:
+			overlap = self.config.up_api.store.overlap if self.config.up_api.store else timedelta(days=7)
+			since = max(since, datetime.fromtimestamp(state.until, tz=since.tzinfo) - overlap)
+
+		helper = self._helper(client)
+		with timings.span('apply to state'):
+			returned = state.apply(helper.iter_transactions(since, self.config.until))
+			log.info("Retracted %d transactions no longer returned since %s", state.retract_missing(returned, since, self.config.until), since)
+			log.info("Retracted %d transactions before %s", state.retract_before(self.config.since), self.config.since)
+		state.until = self.config.until.timestamp()
+		with timings.span('save state'):
+			state.save(state_path)
+		with timings.span('build streams'):
+			return state.as_streams()
+
+	def parallel_from_up_api(self, client : ClientProtocol, workers : int) -> StreamCollection:
+		"""Converts and classifies the transactions on a pool of worker processes."""
+		from .parallel import ParallelAggregator
+		self._warn_without_combine()
+		helper = self._helper(client)
+		aggregator = ParallelAggregator(helper.accounts.values(), helper.categories.values(),
+			self.config.up_api, self.config.collections, workers, joint_split=self.config.joint_split,
+			configured_categories=self.config.categories)
+		raw_transactions = (t._raw_response for t in helper.up_transactions(self.config.since, self.config.until))
+		with timings.span('parallel aggregate'):
+			state = aggregator.aggregate(timings.timed('fetch', raw_transactions))
+		with timings.span('build streams'):
+			return state.as_streams()
+
+	def periods_from_up_api(self, client : ClientProtocol) -> Mapping[str, StreamCollection]:
+		"""Builds the streams for every configured period from a single download."""
+		self._warn_without_combine()
+		periods = self.config.periods
+		buckets = PeriodBuckets(self.config.collections, periods, self.config.joint_split)
+		helper = self._helper(client)
+		since = min(period.since for period in periods)
+		until = max(period.until for period in periods)
+		with timings.span('period buckets'):
+			buckets.add_transactions(helper.iter_transactions(since, until))
+		with timings.span('build streams'):
+			return buckets.as_streams()
+
+	def _helper(self, client : ClientProtocol) -> UpBankApiHelper:
+		return UpBankApiHelper(client, self.config.up_api, configured_categories=self.config.categories)
+
+	def _warn_without_combine(self) -> None:
+		if self.config.combine_covers:
+			log.warning("Cover transfers are only combined when every transaction is collected, not with --stream, --state, --workers or periods")
+
 	def add_transactions(self, transactions : List[GenericTransaction]) -> None:
 		self._update_relations(transactions)
 		self.transactions.extend(transactions)
-		# self._try_combine()
+		self.ledger.add(transactions)
+		if self.combiner is not None:
+			self._combine(transactions)
 		self._update_joint_transaction_splits()
 		pass
 
-	def _update_relations(self, new_transactions : List[Transaction]) -> None:
-		with_existing_transactions = product(self.transactions, new_transactions)
-		with_new_transactions = combinations(new_transactions, 2)
-		for t1, t2 in chain(with_existing_transactions, with_new_transactions):
-			if t1.relates_to(t2):
-				t1.connect(t2)
+	def _update_relations(self, new_transactions : List[GenericTransaction]) -> None:
+		with timings.span('relations'):
+			comparisons = self.relations.comparisons
+			for transaction in new_transactions:
+				self.relations.connect(transaction)
+			timings.count('relation comparisons', self.relations.comparisons - comparisons)
 		pass
 
-	def _try_combine(self) -> None:
-		# TODO: Handle case where two transactions have the same value but only one should be combined
-		combinables = self.filter(lambda t: t.is_combinable)
-		log.debug(f'Found {len(combinables)} combinable transactions')
-		for root in combinables:
-			root.update_using_connections()
-			for t in root.connections:
-				log.debug(f'Removing transaction {t}')
-				self.transactions.remove(t)
-			root.clear_connections()
+	def _combine(self, new_transactions : List[GenericTransaction]) -> None:
+		"""Folds cover transfers into the purchases they paid for, removing the transfers in one pass."""
+		with timings.span('combine'):
+			removed = set()
+			for purchase, transfers in self.combiner.groups(new_transactions):
+				log.debug(f'Combining {purchase} with {transfers}')
+				self.ledger.remove([purchase, *transfers])
+				purchase.combine_with(transfers)
+				self.ledger.add([purchase])
+				removed.update(id(t) for t in transfers)
+			if removed:
+				self.transactions = [t for t in self.transactions if id(t) not in removed]
+			timings.count('transfers combined', len(removed))
 		pass
 
 	def _update_joint_transaction_splits(self) -> None:
-		joint_transactions = self.filter(lambda t: t.source == AccountType.JOINT)
-		personal_funding_total = sum(t.amount for t in joint_transactions if t.destination == AccountType.PERSONAL)
-		partner_funding_total = sum(t.amount for t in joint_transactions if t.destination == AccountType.PARTNER)
-		funding_total = personal_funding_total + partner_funding_total
-		if funding_total != 0:
-			for t in joint_transactions:
-				if t.destination == AccountType.EXTERNAL:
-					t.split = personal_funding_total / (personal_funding_total + partner_funding_total)
+		with timings.span('joint splits'):
+			timings.count('joint splits updated', self.ledger.apply())
 		pass
 
 	def filter(self, filter: Union[TransactionFilter, Callable[[GenericTransaction], bool]]) -> List[GenericTransaction]:
@@ -145,6 +268,10 @@ class TransactionCollection:
 		streams.add_transactions(self.transactions)
 		return streams.cleanup().link()
 
+	def as_table(self) -> TransactionTable:
+		from .table import TransactionTable
+		return TransactionTable.from_transactions(self.transactions)
+
 
 if __name__ == '__main__':
 	config = Config()  # use defaults
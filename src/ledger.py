@@ -0,0 +1,100 @@
+from datetime import date, datetime, timedelta
+from typing import Iterable, List, Mapping, Set
+
+from .transaction import AccountType, GenericTransaction
+
+PERIODS = ['window', 'month', 'fortnight']
+# Fortnights are counted from a Monday, so every bucket starts on a Monday
+FORTNIGHT_EPOCH = date(2000, 1, 3)
+FUNDERS = [AccountType.PERSONAL, AccountType.PARTNER]
+
+
+def check_period(period : str) -> str:
+	if period not in PERIODS:
+		raise ValueError("Unknown joint split period %r, expected one of %s" % (period, ', '.join(PERIODS)))
+	return period
+
+
+def bucket_of(when : datetime, period : str) -> str:
+	"""The key of the funding bucket that a date falls in, which is the same for every date when split by window."""
+	if period == 'month':
+		return when.strftime('%Y-%m')
+	if period == 'fortnight':
+		day = when.date()
+		return (day - timedelta(days=(day - FORTNIGHT_EPOCH).days % 14)).isoformat()
+	return ''
+
+
+def funding_ratio(personal : float, partner : float) -> float:
+	"""
+	The share of the joint expenses paid by me. Expenses are left unsplit while there is no
+	funding, and the ratio is clamped when one of us has taken more out than they put in.
+	"""
+	total = personal + partner
+	if total == 0:
+		return 1.0
+	return min(max(personal / total, 0.0), 1.0)
+
+
+class FundingLedger:
+	"""
+	The transfers into the joint account and the joint expenses, grouped into buckets by date.
+
+	Each joint expense is split by the funding of its own bucket. Adding transactions only marks
+	the buckets they fall in, and `apply` recomputes the splits of those buckets alone, so adding
+	a batch costs time in proportion to the batch and the expenses of the buckets it touches.
+	"""
+	period : str
+	funding : Mapping[str, List[float]]
+	expenses : Mapping[str, List[GenericTransaction]]
+	changed : Set[str]
+
+	def __init__(self, period : str = 'window'):
+		self.period = check_period(period)
+		self.funding = {}  # bucket -> [personal, partner]
+		self.expenses = {}  # bucket -> joint expenses
+		self.changed = set()
+
+	def add(self, transactions : Iterable[GenericTransaction]) -> None:
+		for transaction in transactions:
+			if transaction.source != AccountType.JOINT:
+				continue
+			if transaction.destination in FUNDERS:
+				bucket = bucket_of(transaction.date, self.period)
+				self.funding.setdefault(bucket, [0, 0])[FUNDERS.index(transaction.destination)] += transaction.amount
+				self.changed.add(bucket)
+			elif transaction.destination == AccountType.EXTERNAL:
+				bucket = bucket_of(transaction.date, self.period)
+				self.expenses.setdefault(bucket, []).append(transaction)
+				self.changed.add(bucket)
+
+	def remove(self, transactions : Iterable[GenericTransaction]) -> None:
+		"""Takes transactions back out of the ledger, leaving the expenses unsplit."""
+		removed = {}
+		for transaction in transactions:
+			if transaction.source != AccountType.JOINT:
+				continue
+			bucket = bucket_of(transaction.date, self.period)
+			if transaction.destination in FUNDERS:
+				self.funding[bucket][FUNDERS.index(transaction.destination)] -= transaction.amount
+				self.changed.add(bucket)
+			elif transaction.destination == AccountType.EXTERNAL:
+				transaction.split = 1.0
+				removed.setdefault(bucket, set()).add(id(transaction))
+				self.changed.add(bucket)
+		for bucket, ids in removed.items():
+			self.expenses[bucket] = [t for t in self.expenses[bucket] if id(t) not in ids]
+
+	def ratio(self, bucket : str) -> float:
+		return funding_ratio(*self.funding.get(bucket, [0, 0]))
+
+	def apply(self) -> int:
+		"""Updates the splits of the expenses in the buckets changed since the last call, returning how many were updated."""
+		updated = 0
+		for bucket in self.changed:
+			ratio = self.ratio(bucket)
+			for transaction in self.expenses.get(bucket, []):
+				transaction.split = ratio
+			updated += len(self.expenses.get(bucket, []))
+		self.changed.clear()
+		return updated
@@ -1,16 +1,74 @@
+import logging as log
+import sys
+import time
+
+started = time.perf_counter()
 from .config import Config
 from .interface import TransactionCollection
-from upbankapi import Client
-
+from .render import render_to_files, renderers
+from .timings import timings
+imported = time.perf_counter()
 
 # obtain access to the Up API
 config = Config()
-client = config.up_api.init_client(Client)
+loaded = time.perf_counter()
+renderers(config.formats)  # fail on an unknown format before downloading anything
+from upbankapi import Client
+client_imported = time.perf_counter()
+if config.args.profile_startup:
+	print("Startup: imports %.1fms, config %.1fms (cache %s), client import %.1fms" % (
+		(imported - started) * 1000, (loaded - imported) * 1000, 'hit' if config.cache_hit else 'miss',
+		(client_imported - loaded) * 1000), file=sys.stderr)
+timings.enabled = config.args.timings or config.args.timings_json is not None
+timings.add('startup', loaded - started)
+if config.args.use_async:
+	unsupported = [name for name, used in [('periods', config.periods), ('--state', config.args.state), ('--workers', config.args.workers > 1),
+		('--stream', config.args.stream), ('the transaction store', config.up_api.store)] if used]
+	if unsupported:
+		log.warning("The async client doesn't support %s, ignoring --async", ', '.join(unsupported))
+		config.args.use_async = False
+if config.args.record and (config.up_api.store or config.args.state):
+	# only the transactions downloaded in this run pass through the client to be recorded
+	log.critical("--record can't be used with --state or the transaction store, as the earlier transactions wouldn't be recorded")
+	exit(1)
+if config.args.use_async and (config.replay or config.args.record):
+	log.warning("Replaying and recording use the synchronous client, ignoring --async")
+	config.args.use_async = False
+if not config.args.use_async:  # the async client connects as part of the run
+	with timings.span('connect'):
+		client = config.replay.init_client() if config.replay else config.up_api.init_client(Client)
+	if config.args.record:
+		from .replay import RecordingClient
+		client = RecordingClient(client, config.args.record)
 
 # add transactions
 transactions = TransactionCollection(config)
-transactions.add_from_up_api(client)
-streams = transactions.as_streams()
+if config.args.use_async:
+	import asyncio
+	from .aio import main as async_main
+	outputs = {config.output : asyncio.run(async_main(config))}
+elif config.periods:
+	outputs = {config.output_for(name) : streams for name, streams in transactions.periods_from_up_api(client).items()}
+elif config.args.state:
+	outputs = {config.output : transactions.update_from_up_api(client, config.args.state)}
+elif config.args.workers > 1:
+	outputs = {config.output : transactions.parallel_from_up_api(client, config.args.workers)}
+elif config.args.stream:
+	outputs = {config.output : transactions.stream_from_up_api(client)}
+else:
+	transactions.add_from_up_api(client)
+	outputs = {config.output : transactions.as_streams()}
 
 # print results
-config.print_to_file(streams)
+with timings.span('write output'):
+	for output, streams in outputs.items():
+		render_to_files(streams, output, config.formats)
+
+if config.args.record:
+	client.close()
+	log.info("Recorded %d transactions to %s", len(client.recorded), config.args.record)
+
+if config.args.timings:
+	print(timings, file=sys.stderr)
+if config.args.timings_json:
+	timings.save(config.args.timings_json)
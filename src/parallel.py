@@ -0,0 +1,71 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import Iterable, Iterator, List, Mapping
+
+from .config import CategoryConfig, CollectionConfig, TransactionType, UpApiConfig
+from .protocol import Account, Category
+from .state import StreamState
+from .stream import StreamCollection
+
+# Set up once in each worker process by `_initialise`
+_helper = None
+_collections = None
+_aliases = None
+_joint_split = None
+
+
+def _initialise(accounts : List[dict], categories : List[dict], config : UpApiConfig, collections : Mapping[TransactionType, CollectionConfig],
+		joint_split : str = 'window', configured_categories : List[CategoryConfig] = None):
+	from upbankapi.models import Account as UpAccount, Category as UpCategory
+	from .interface import UpBankApiHelper
+	global _helper, _collections, _aliases, _joint_split
+	_helper = UpBankApiHelper(None, config,
+		accounts=[UpAccount(None, raw) for raw in accounts],
+		categories=[UpCategory(None, raw) for raw in categories],
+		configured_categories=configured_categories)
+	_collections = collections
+	_aliases = StreamCollection(collections)
+	_joint_split = joint_split
+
+
+def _aggregate(raw_transactions : List[dict]) -> StreamState:
+	from upbankapi.models import Transaction as UpTransaction
+	state = StreamState(_collections, _aliases, _joint_split)
+	state.apply(_helper.to_generic_transaction(UpTransaction(None, raw)) for raw in raw_transactions)
+	return state
+
+
+def chunked(items : Iterable, size : int) -> Iterator[list]:
+	iterator = iter(items)
+	while chunk := list(islice(iterator, size)):
+		yield chunk
+
+
+class ParallelAggregator:
+	"""
+	Converts and classifies raw Up API transactions across a pool of worker processes.
+
+	Each worker is sent the accounts, categories and configs once when it starts, and compiles
+	its own classifier. Workers return the stream totals of their chunk as a StreamState, and
+	these are merged in chunk order, so the result is the same as applying every transaction
+	to a single StreamState.
+	"""
+	workers : int
+	chunk_size : int
+
+	def __init__(self, accounts : Iterable[Account], categories : Iterable[Category], config : UpApiConfig,
+			collections : Mapping[TransactionType, CollectionConfig], workers : int, chunk_size : int = 5000, joint_split : str = 'window',
+			configured_categories : List[CategoryConfig] = None):
+		self.initargs = ([a._raw_response for a in accounts], [c._raw_response for c in categories], config, collections,
+			joint_split, configured_categories)
+		self.collections = collections
+		self.joint_split = joint_split
+		self.workers = workers
+		self.chunk_size = chunk_size
+
+	def aggregate(self, raw_transactions : Iterable[dict]) -> StreamState:
+		state = StreamState(self.collections, joint_split=self.joint_split)
+		with ProcessPoolExecutor(self.workers, initializer=_initialise, initargs=self.initargs) as executor:
+			for partial in executor.map(_aggregate, chunked(raw_transactions, self.chunk_size)):
+				state.merge(partial)
+		return state
@@ -0,0 +1,46 @@
+from bisect import bisect_left, bisect_right
+from typing import Iterable, List, Mapping
+
+from .config import CollectionConfig, PeriodConfig, TransactionType
+from .state import StreamState
+from .stream import StreamCollection
+from .transaction import GenericTransaction
+
+
+class PeriodBuckets:
+	"""
+	Builds the streams for several date periods from one pass over the transactions.
+
+	The start and end dates of every period split the timeline into buckets. Each transaction
+	is classified once and added to the one bucket it falls into, and each period's streams
+	are then merged from the aggregated totals of the buckets it spans. Periods include their
+	start date and exclude their end date.
+	"""
+	periods : List[PeriodConfig]
+	boundaries : List[float]
+	buckets : List[StreamState]
+
+	def __init__(self, collections : Mapping[TransactionType, CollectionConfig], periods : List[PeriodConfig], joint_split : str = 'window'):
+		self.collections = collections
+		self.periods = periods
+		self.joint_split = joint_split
+		self.aliases = StreamCollection(collections)
+		self.boundaries = sorted({date.timestamp() for period in periods for date in (period.since, period.until)})
+		self.buckets = [StreamState(collections, self.aliases, joint_split) for _ in self.boundaries[1:]]
+
+	def add_transactions(self, transactions : Iterable[GenericTransaction]) -> None:
+		for transaction in transactions:
+			index = bisect_right(self.boundaries, transaction.date.timestamp()) - 1
+			if 0 <= index < len(self.buckets):
+				self.buckets[index].apply([transaction])
+
+	def as_streams(self) -> Mapping[str, StreamCollection]:
+		streams = {}
+		for period in self.periods:
+			first = bisect_left(self.boundaries, period.since.timestamp())
+			last = bisect_left(self.boundaries, period.until.timestamp())
+			state = StreamState(self.collections, self.aliases, self.joint_split)
+			for bucket in self.buckets[first:last]:
+				state.merge(bucket)
+			streams[period.name] = state.as_streams()
+		return streams
@@ -1,4 +1,4 @@
-from typing import Optional, List, Protocol, Union
+from typing import AsyncIterable, Optional, List, Protocol, Union
 from datetime import datetime
 
 DEFAULT_PAGE_SIZE = 50
@@ -20,6 +20,7 @@ class Category(CategoryBase):
 
 class Transaction(Protocol):
 	_raw_response : dict
+	id : str
 	created_at : datetime
 	description : str
 	amount : float
@@ -60,3 +61,29 @@ class Client(Protocol):
 
 	def ping(self):
 		...
+
+
+class AsyncClient(Protocol):
+	"""The async variant of Client. Paginated results are awaited first, then iterated with `async for`."""
+	async def transactions(
+		self,
+		account: Union[str, Account] = None,
+		*,
+		since: datetime = None,
+		until: datetime = None,
+		category: Union[str, Category] = None,
+		limit: int = None,
+		page_size: int = DEFAULT_PAGE_SIZE,
+	) -> AsyncIterable[Transaction]: ...
+
+	async def accounts(
+		self,
+		*,
+		limit: int = None,
+	) -> AsyncIterable[Account]: ...
+
+	async def categories(self) -> List[Category]:
+		...
+
+	async def ping(self):
+		...
@@ -0,0 +1,129 @@
+import csv
+import json
+
+from abc import ABC, abstractmethod
+from os.path import splitext
+from typing import Iterator, List, Mapping, TextIO, Tuple
+
+from .stream import StreamCollection
+
+
+def links(streams : StreamCollection) -> Iterator[Tuple[str, int, str]]:
+	"""Every stream as (source, amount, target), in the order of the SankeyMatic output."""
+	for section in streams.sections():
+		for stream in section:
+			yield stream.flow
+
+
+class Renderer(ABC):
+	"""
+	Writes a StreamCollection to a text file object. Renderers write each stream as they go,
+	rather than joining the whole output into one string, so several formats can be written
+	from the same streams in one run.
+	"""
+	name : str
+	extension : str
+
+	@abstractmethod
+	def render(self, streams : StreamCollection, f : TextIO) -> None:
+		...
+
+
+class SankeyMaticRenderer(Renderer):
+	"""The SankeyMatic text format, one `source [amount] target` line per stream, matching `str(streams)`."""
+	name = 'sankeymatic'
+	extension = '.txt'
+
+	def render(self, streams : StreamCollection, f : TextIO) -> None:
+		# sections are separated by a newline even when empty, as they are when joined
+		for i, section in enumerate(streams.sections()):
+			if i:
+				f.write('\n')
+			for j, stream in enumerate(section):
+				if j:
+					f.write('\n')
+				f.write("%s [%d] %s" % stream.flow)
+		f.write('\n')
+
+
+class JsonRenderer(Renderer):
+	"""A `{"links": [...], "nodes": [...]}` graph, with links referring to nodes by their index, as used by d3-sankey."""
+	name = 'json'
+	extension = '.json'
+
+	def render(self, streams : StreamCollection, f : TextIO) -> None:
+		nodes = {}
+		node = lambda name: nodes.setdefault(name, len(nodes))
+		f.write('{"links": [')
+		for i, (source, amount, target) in enumerate(links(streams)):
+			if i:
+				f.write(', ')
+			json.dump({'source': node(source), 'target': node(target), 'value': amount}, f)
+		f.write('], "nodes": ')
+		json.dump([{'name': name} for name in nodes], f)
+		f.write('}\n')
+
+
+class CsvRenderer(Renderer):
+	"""A `source,target,value` row per stream."""
+	name = 'csv'
+	extension = '.csv'
+
+	def render(self, streams : StreamCollection, f : TextIO) -> None:
+		writer = csv.writer(f, lineterminator='\n')
+		writer.writerow(['source', 'target', 'value'])
+		for source, amount, target in links(streams):
+			writer.writerow([source, target, amount])
+
+
+class PlotlyRenderer(Renderer):
+	"""
+	A Plotly figure with a single sankey trace, which can be loaded with `plotly.io.read_json`.
+	The links are stored as parallel arrays, so the streams are walked once for each array.
+	"""
+	name = 'plotly'
+	extension = '.plotly.json'
+
+	def render(self, streams : StreamCollection, f : TextIO) -> None:
+		nodes = {}
+		node = lambda name: nodes.setdefault(name, len(nodes))
+		columns = [
+			('source', lambda source, amount, target: node(source)),
+			('target', lambda source, amount, target: node(target)),
+			('value', lambda source, amount, target: amount),
+		]
+		f.write('{"data": [{"type": "sankey", "link": {')
+		for i, (key, column) in enumerate(columns):
+			f.write('%s"%s": [' % (', ' if i else '', key))
+			for j, link in enumerate(links(streams)):
+				if j:
+					f.write(', ')
+				f.write(json.dumps(column(*link)))
+			f.write(']')
+		f.write('}, "node": {"label": ')
+		json.dump(list(nodes), f)
+		f.write('}}]}\n')
+
+
+RENDERERS : Mapping[str, type] = {renderer.name : renderer for renderer in [SankeyMaticRenderer, JsonRenderer, CsvRenderer, PlotlyRenderer]}
+
+
+def renderers(formats : List[str]) -> List[Renderer]:
+	unknown = [name for name in formats if name not in RENDERERS]
+	if unknown:
+		raise ValueError("Unknown output formats %s, expected some of %s" % (', '.join(unknown), ', '.join(RENDERERS)))
+	return [RENDERERS[name]() for name in formats]
+
+
+def render_to_files(streams : StreamCollection, output : str, formats : List[str]) -> List[str]:
+	"""
+	Writes the streams in each format, returning the paths written. SankeyMatic is written to
+	`output` itself, and the other formats next to it with their own extensions.
+	"""
+	paths = []
+	for renderer in renderers(formats):
+		path = output if renderer.name == SankeyMaticRenderer.name else splitext(output)[0] + renderer.extension
+		with open(path, 'w', newline='') as f:
+			renderer.render(streams, f)
+		paths.append(path)
+	return paths
@@ -0,0 +1,139 @@
+"""
+Records the raw responses of the Up API to a fixture, and replays them through the Client
+protocol without a token or the network, so that a run can be repeated exactly.
+
+A fixture is a gzip compressed text file with one response per line, as
+`<kind>\t<created at>\t<json>`, where the kind is ping, accounts, categories or transaction.
+Only transactions have a created at timestamp, which lets replays skip the transactions
+outside of the date window without decoding them.
+"""
+import gzip
+import json
+import threading
+
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple, Union
+
+from .protocol import Account, Category, Client, DEFAULT_PAGE_SIZE, Transaction
+
+
+def read_fixture(path : str) -> Iterator[Tuple[str, str, str]]:
+	"""Yields (kind, created at, json) for every line, decompressing the fixture as it is read."""
+	with gzip.open(path, 'rt', encoding='utf-8') as f:
+		for line in f:
+			kind, created_at, payload = line.rstrip('\n').split('\t', 2)
+			yield kind, created_at, payload
+
+
+class RecordingClient:
+	"""
+	Passes calls through to a client, writing each raw response to a fixture as it is read.
+	Transactions are written once each, in the order they are read, which is the order they are
+	replayed in. Transactions can be read from several threads when fetching concurrently.
+	"""
+	client : Client
+	recorded : set
+
+	def __init__(self, client : Client, path : str):
+		self.client = client
+		self.file = gzip.open(path, 'wt', encoding='utf-8')
+		self.lock = threading.Lock()
+		self.recorded = set()
+		self.ping()  # the client has already connected, but the fixture should say who it was recorded from
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def close(self) -> None:
+		self.file.close()
+
+	def _write(self, kind : str, payload, created_at : str = '') -> None:
+		line = '%s\t%s\t%s\n' % (kind, created_at, json.dumps(payload, separators=(',', ':')))
+		with self.lock:
+			self.file.write(line)
+
+	def ping(self):
+		ping = self.client.ping()
+		self._write('ping', ping)
+		return ping
+
+	def accounts(self, *, limit=None):
+		accounts = list(self.client.accounts(limit=limit))
+		self._write('accounts', [account._raw_response for account in accounts])
+		return accounts
+
+	def categories(self):
+		categories = list(self.client.categories())
+		self._write('categories', [category._raw_response for category in categories])
+		return categories
+
+	def transactions(self, account=None, *, since=None, until=None, category=None, limit=None, page_size=DEFAULT_PAGE_SIZE):
+		for transaction in self.client.transactions(account, since=since, until=until, category=category, limit=limit, page_size=page_size):
+			with self.lock:
+				new = transaction.id not in self.recorded
+				self.recorded.add(transaction.id)
+			if new:
+				self._write('transaction', transaction._raw_response, '%r' % transaction.created_at.timestamp())
+			yield transaction
+
+
+class ReplayClient:
+	"""
+	Implements the Client protocol from a recorded fixture. Each call reads through the fixture
+	again with streamed decompression, so only the transactions being used are held in memory,
+	however large the recording is. Transactions are filtered by their date and account as the
+	Up API would, and returned in the order they were recorded.
+	"""
+	path : str
+
+	def __init__(self, path : str):
+		self.path = path
+
+	def _first(self, kind : str):
+		payload = next((payload for k, _, payload in read_fixture(self.path) if k == kind), None)
+		if payload is None:
+			raise ValueError("The fixture %s has no %s" % (self.path, kind))
+		return json.loads(payload)
+
+	def ping(self) -> str:
+		return self._first('ping')
+
+	def accounts(self, *, limit=None) -> List[Account]:
+		from upbankapi.models import Account as UpAccount
+		return [UpAccount(self, raw) for raw in self._first('accounts')][:limit]
+
+	def categories(self) -> List[Category]:
+		from upbankapi.models import Category as UpCategory
+		return [UpCategory(self, raw) for raw in self._first('categories')]
+
+	def transactions(self, account : Union[str, Account] = None, *, since : datetime = None, until : datetime = None,
+			category : Union[str, Category] = None, limit : int = None, page_size : int = DEFAULT_PAGE_SIZE) -> Iterator[Transaction]:
+		from upbankapi.models import Transaction as UpTransaction
+		account = getattr(account, 'id', account)
+		category = getattr(category, 'id', category)
+		first = since.timestamp() if since is not None else None
+		last = until.timestamp() if until is not None else None
+		count = 0
+		for kind, created_at, payload in read_fixture(self.path):
+			if kind != 'transaction':
+				continue
+			timestamp = float(created_at)
+			if (first is not None and timestamp < first) or (last is not None and timestamp > last):
+				continue
+			if limit is not None and count == limit:
+				return
+			raw = json.loads(payload)
+			if account is not None and raw['relationships']['account']['data']['id'] != account:
+				continue
+			if category is not None and ReplayClient._category(raw) != category:
+				continue
+			count += 1
+			yield UpTransaction(self, raw)
+
+	@staticmethod
+	def _category(raw : dict) -> Optional[str]:
+		data = raw['relationships'].get('category', {}).get('data')
+		return data['id'] if data else None
@@ -0,0 +1,195 @@
+import json
+import logging as log
+
+from datetime import datetime
+from typing import Iterable, List, Mapping, Optional, Set, Tuple
+
+from .config import CollectionConfig, TransactionType
+from .ledger import FUNDERS, bucket_of, check_period, funding_ratio
+from .stream import StreamCollection
+from .transaction import AccountType, GenericTransaction
+
+
+def to_cents(amount : float) -> int:
+	return round(amount * 100)
+
+
+class StreamState:
+	"""
+	The aggregated stream totals before cleanup, which can be saved between runs and updated
+	with only the transactions that are new or have changed since.
+
+	Totals are kept in integer cents so that transactions can be retracted exactly, either
+	because they changed or because they fell out of the date window. Joint expenses are
+	kept separately from the other totals, by the funding bucket they fall in, and split using
+	the funding ratio of their bucket when the streams are built, so changes to the funding only
+	need the ratios to be recomputed. Transactions are tracked by their Up id, so transactions
+	without one can't be applied.
+	"""
+	streams : Mapping[Tuple[str, Optional[str]], list]
+	groups : Mapping[Tuple[Optional[str], Optional[str]], list]
+	funding : Mapping[str, List[int]]
+	applied : Mapping[str, list]
+	joint_split : str
+	digest : Optional[str]
+	until : Optional[float]
+
+	def __init__(self, collections : Mapping[TransactionType, CollectionConfig], aliases : StreamCollection = None, joint_split : str = 'window',
+			digest : Optional[str] = None):
+		self.collections = collections
+		# only used to classify and alias transactions, so can be shared between states
+		self.aliases = aliases if aliases is not None else StreamCollection(collections)
+		self.joint_split = check_period(joint_split)
+		self.digest = digest  # of the config the collections were resolved from
+		self.streams = {}  # (type, source) -> [cents, {bucket : joint cents}, count]
+		self.groups = {}  # category path -> [cents, {bucket : joint cents}, count]
+		self.funding = {}  # bucket -> [personal cents, partner cents]
+		self.applied = {}  # transaction id -> [timestamp, contributions]
+		self.until = None
+
+	def __len__(self):
+		return len(self.applied)
+
+	def __getstate__(self):
+		# only the totals are sent between processes, the classifier is rebuilt by each worker
+		return {'streams': self.streams, 'groups': self.groups, 'funding': self.funding, 'joint_split': self.joint_split, 'until': self.until}
+
+	def split(self, bucket : str) -> float:
+		return funding_ratio(*self.funding.get(bucket, [0, 0]))
+
+	def apply(self, transactions : Iterable[GenericTransaction]) -> Set[str]:
+		"""Applies the transactions, replacing any applied before with the same id, and returns their ids."""
+		ids = set()
+		for transaction in transactions:
+			if transaction.id is None:
+				raise ValueError("Transactions need an id to be tracked: %r" % transaction)
+			self.retract(transaction.id)
+			self.applied[transaction.id] = [transaction.date.timestamp(), self._contributions(transaction)]
+			self._add(self.applied[transaction.id][1], sign=1)
+			ids.add(transaction.id)
+		return ids
+
+	def retract(self, id : str) -> None:
+		if id in self.applied:
+			_, contributions = self.applied.pop(id)
+			self._add(contributions, sign=-1)
+
+	def retract_before(self, since : datetime) -> int:
+		expired = [id for id, (timestamp, _) in self.applied.items() if timestamp < since.timestamp()]
+		for id in expired:
+			self.retract(id)
+		return len(expired)
+
+	def retract_missing(self, ids : Set[str], since : datetime, until : datetime) -> int:
+		"""Retracts the transactions in the since..until window that aren't in `ids`, such as those deleted since they were applied."""
+		missing = [id for id, (timestamp, _) in self.applied.items() if since.timestamp() <= timestamp < until.timestamp() and id not in ids]
+		for id in missing:
+			self.retract(id)
+		return len(missing)
+
+	def merge(self, other : 'StreamState') -> None:
+		"""Adds the totals of another state, without tracking its transactions."""
+		for table in ['streams', 'groups']:
+			buckets = getattr(self, table)
+			for key, (cents, joint, count) in getattr(other, table).items():
+				bucket = buckets.setdefault(key, [0, {}, 0])
+				bucket[0] += cents
+				for funding_bucket, joint_cents in joint.items():
+					bucket[1][funding_bucket] = bucket[1].get(funding_bucket, 0) + joint_cents
+				bucket[2] += count
+		for key, (personal, partner) in other.funding.items():
+			funding = self.funding.setdefault(key, [0, 0])
+			funding[0] += personal
+			funding[1] += partner
+
+	def _contributions(self, transaction : GenericTransaction) -> list:
+		"""
+		Lists the buckets that the transaction adds to, as [table, key, column, cents]. The column
+		of joint expenses is their funding bucket, and of funding the index of the funder.
+		"""
+		contributions = []
+		cents = to_cents(transaction.amount)
+		if transaction.source == AccountType.JOINT and transaction.destination in FUNDERS:
+			contributions.append(['funding', bucket_of(transaction.date, self.joint_split), FUNDERS.index(transaction.destination), cents])
+
+		type = self.aliases.classifier.classify(transaction)
+		if type in {TransactionType.Unknown, TransactionType.Ignore}:
+			if type is TransactionType.Unknown:
+				log.warning("Unmatched transaction found for %s", transaction)
+			return contributions
+
+		if transaction.internal:
+			cents = 0
+		column = None
+		if transaction.source == AccountType.JOINT and transaction.destination == AccountType.EXTERNAL:
+			column = bucket_of(transaction.date, self.joint_split)
+		source = self.aliases.collections[type]._to_source(transaction)
+		contributions.append(['streams', [type.value, source], column, cents])
+		if type is TransactionType.Expense:
+			path = transaction.categoryPath
+			for depth in range(2, len(path) + 1):
+				contributions.append(['groups', list(path[:depth]), column, cents])
+		return contributions
+
+	def _add(self, contributions : list, sign : int) -> None:
+		for table, key, column, cents in contributions:
+			if table == 'funding':
+				self.funding.setdefault(key, [0, 0])[column] += sign * cents
+				continue
+			buckets = getattr(self, table)
+			bucket = buckets.setdefault(tuple(key), [0, {}, 0])
+			if column is None:
+				bucket[0] += sign * cents
+			else:
+				bucket[1][column] = bucket[1].get(column, 0) + sign * cents
+				if bucket[1][column] == 0:
+					del bucket[1][column]
+			bucket[2] += sign
+			if bucket[2] == 0:
+				del buckets[tuple(key)]
+
+	def as_streams(self) -> StreamCollection:
+		streams = StreamCollection(self.collections, keep_transactions=False)
+		splits = {bucket : self.split(bucket) for bucket in self.funding}
+		total = lambda cents, joint: cents / 100 + sum(splits.get(bucket, 1.0) * cents / 100 for bucket, cents in joint.items())
+		for (type, source), (cents, joint, _) in self.streams.items():
+			streams.collections[TransactionType(type)].insert_total(source, total(cents, joint))
+		for path, (cents, joint, _) in self.groups.items():
+			streams.collections[TransactionType.Expense].group(path[:-1]).insert_total(path[-1], total(cents, joint))
+		return streams.cleanup().link()
+
+	def save(self, path : str) -> None:
+		with open(path, 'w') as f:
+			json.dump({
+				'until': self.until,
+				'joint-split': self.joint_split,
+				'digest': self.digest,
+				'streams': [list(key) + value for key, value in self.streams.items()],
+				'groups': [list(key) + value for key, value in self.groups.items()],
+				'funding': self.funding,
+				'applied': self.applied,
+			}, f)
+
+	@staticmethod
+	def load(path : str, collections : Mapping[TransactionType, CollectionConfig], joint_split : str = 'window',
+			digest : Optional[str] = None) -> 'StreamState':
+		"""
+		Loads a saved state, which is only valid for the collections it was built with. A state
+		saved from another config, identified by its `digest`, or with other funding buckets is
+		discarded, so that it is rebuilt from the full window.
+		"""
+		with open(path, 'r') as f:
+			saved = json.load(f)
+		state = StreamState(collections, joint_split=joint_split, digest=digest)
+		if saved.get('digest') != digest:
+			log.warning("Rebuilding the saved state, which was built from another config")
+			return state
+		if saved.get('joint-split') != joint_split:
+			log.warning("Rebuilding the saved state, which was not split by %s", joint_split)
+			return state
+		state.until = saved['until']
+		state.streams = {tuple(row[:-3]) : row[-3:] for row in saved['streams']}
+		state.groups = {tuple(row[:-3]) : row[-3:] for row in saved['groups']}
+		state.funding = saved['funding']
+		state.applied = saved['applied']
+		return state
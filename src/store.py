@@ -0,0 +1,109 @@
+import json
+import logging as log
+import sqlite3
+
+from datetime import datetime, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from .protocol import Client, Transaction
+
+
+def to_timestamp(date : datetime) -> float:
+	# naive datetimes from the config are treated as local time, matching the Up API filters
+	return date.timestamp()
+
+
+class TransactionStore:
+	"""
+	A local SQLite copy of the raw Up API transaction payloads.
+
+	The store remembers the window that has been synced, so later runs only need to download
+	transactions created after the last sync. Transactions can change status after they are
+	first seen (e.g. HELD to SETTLED) or disappear when they are reversed, so the most recent
+	`overlap` is always fetched again, replacing what was stored for it.
+	"""
+	path : str
+	overlap : timedelta
+
+	def __init__(self, path : str, overlap : timedelta = timedelta(days=7)):
+		self.path = path
+		self.overlap = overlap
+		self.connection = sqlite3.connect(path)
+		self.connection.executescript("""
+			CREATE TABLE IF NOT EXISTS transactions (
+				id TEXT PRIMARY KEY,
+				created_at REAL NOT NULL,
+				raw TEXT NOT NULL
+			);
+			CREATE INDEX IF NOT EXISTS transactions_created_at ON transactions (created_at);
+			CREATE TABLE IF NOT EXISTS synced (
+				id INTEGER PRIMARY KEY CHECK (id = 0),
+				since REAL NOT NULL,
+				until REAL NOT NULL
+			);
+		""")
+
+	def __len__(self):
+		return self.connection.execute("SELECT COUNT(*) FROM transactions").fetchone()[0]
+
+	def close(self) -> None:
+		self.connection.close()
+
+	def synced_window(self) -> Optional[Tuple[float, float]]:
+		return self.connection.execute("SELECT since, until FROM synced").fetchone()
+
+	def save(self, transactions : Iterable[Transaction]) -> int:
+		rows = [(t._raw_response['id'], to_timestamp(t.created_at), json.dumps(t._raw_response)) for t in transactions]
+		with self.connection:
+			self.connection.executemany("INSERT OR REPLACE INTO transactions VALUES (?, ?, ?)", rows)
+		return len(rows)
+
+	def remove_missing(self, transactions : List[Transaction], since : float, until : float) -> int:
+		"""
+		Deletes the stored transactions in the window that were not fetched again, such as HELD
+		transactions that have since been reversed or cancelled.
+		"""
+		ids = {t._raw_response['id'] for t in transactions}
+		stored = self.connection.execute("SELECT id FROM transactions WHERE created_at BETWEEN ? AND ?", (since, until)).fetchall()
+		missing = [(id,) for id, in stored if id not in ids]
+		with self.connection:
+			self.connection.executemany("DELETE FROM transactions WHERE id = ?", missing)
+		return len(missing)
+
+	def sync(self, client : Client, since : datetime, until : datetime, page_size : int) -> int:
+		"""Downloads the part of the since..until window that is missing from the store."""
+		since, until = to_timestamp(since), to_timestamp(until)
+		window = self.synced_window()
+		if window is None or since < window[0]:
+			fetch_since = since
+		elif until <= window[1]:
+			log.debug("Transaction store is up to date")
+			return 0
+		else:
+			fetch_since = max(window[1] - self.overlap.total_seconds(), since)
+
+		fetched = list(client.transactions(page_size=page_size,
+									since=datetime.fromtimestamp(fetch_since),
+									until=datetime.fromtimestamp(until)))
+		count = self.save(fetched)
+		removed = self.remove_missing(fetched, fetch_since, until)
+		log.info("Synced %d transactions into %s, removing %d that are no longer returned", count, self.path, removed)
+
+		if window is not None and fetch_since > window[0]:
+			since = window[0]
+		until = max(until, window[1]) if window is not None else until
+		with self.connection:
+			self.connection.execute("INSERT OR REPLACE INTO synced VALUES (0, ?, ?)", (since, until))
+		return count
+
+	def transactions(self, since : datetime, until : datetime, limit : Optional[int] = None, client : Client = None) -> List[Transaction]:
+		"""Loads the stored transactions in the window, newest first as returned by the Up API."""
+		return list(self.iter_transactions(since, until, limit, client))
+
+	def iter_transactions(self, since : datetime, until : datetime, limit : Optional[int] = None, client : Client = None) -> Iterator[Transaction]:
+		from upbankapi.models import Transaction as UpTransaction
+		rows = self.connection.execute(
+			"SELECT raw FROM transactions WHERE created_at BETWEEN ? AND ? ORDER BY created_at DESC LIMIT ?",
+			(to_timestamp(since), to_timestamp(until), limit if limit else -1))
+		for raw, in rows:
+			yield UpTransaction(client, json.loads(raw))
@@ -1,40 +1,97 @@
+import copy
+import heapq
 import logging as log
 import math
 
-from typing import List, Mapping
+from itertools import chain
+
+from typing import Iterable, Iterator, List, Mapping, Optional, Tuple
 
 from .config import CollectionConfig, TransactionType
+from .timings import timings
 from .transaction import GenericTransaction, TransactionAliaser, TransactionClassifier
 
+
+def largest_remainder(values : List[float], groups : List[int], targets : List[int]) -> List[int]:
+	"""
+	Rounds the values so that the values in each group sum to the group's target. Every value
+	is rounded down, and then the values with the largest remainders are rounded up until each
+	group reaches its target. All of the groups are allocated with a single sort.
+	"""
+	rounded = [math.floor(value) for value in values]
+	deficits = list(targets)
+	for group, value in zip(groups, rounded):
+		deficits[group] -= value
+	for i in sorted(range(len(values)), key=lambda i: (groups[i], rounded[i] - values[i])):
+		if deficits[groups[i]] > 0:
+			rounded[i] += 1
+			deficits[groups[i]] -= 1
+	return rounded
+
+
+def round_level(level : List[Tuple[Iterable['Stream'], int]]) -> None:
+	"""Rounds each group of streams to sum to its target, storing the result on each stream."""
+	streams, groups, targets = [], [], []
+	for group, (members, target) in enumerate(level):
+		for stream in members:
+			streams.append(stream)
+			groups.append(group)
+		targets.append(target)
+	rounded = largest_remainder([stream.raw_total for stream in streams], groups, targets)
+	for stream, value in zip(streams, rounded):
+		stream.rounded = value
+
+
 class Stream:
+	rounded : Optional[int]
+
 	def __init__(self, source: str, target: str):
 		self.source = source
 		self.target = target
 		self.transactions = []
+		self.raw_total = 0
+		self.rounded = None
 		self.isOther = False
-		self.round_away_from_zero = True
 
 	def __str__(self):
-		to_sankey_matic = lambda source, target, amount : "%s [%d] %s" % (source, int(amount), target)
+		return "%s [%d] %s" % self.flow
+
+	@property
+	def flow(self) -> Tuple[str, int, str]:
+		"""The stream as (source, amount, target), pointing whichever way the amount is positive."""
 		if self.total > 0:
-			return to_sankey_matic(self.source, self.target, self.total)
-		else:
-			return to_sankey_matic(self.target, self.source, -self.total)
+			return (self.source, int(self.total), self.target)
+		return (self.target, int(-self.total), self.source)
 
 	@property
 	def total(self):
-		total = sum(t.total for t in self.transactions)
-		if total > 0 and self.round_away_from_zero or total < 0 and not self.round_away_from_zero:
-			return math.ceil(total)
-		else:
-			return math.floor(total)
+		# the raw total is maintained as transactions are appended, so transactions are
+		# expected not to change their split once they belong to a stream
+		if self.rounded is not None:
+			return self.rounded
+		total = self.raw_total
+		return math.ceil(total) if total > 0 else math.floor(total)
+
+	def add_total(self, total : float):
+		self.raw_total += total
+		self.rounded = None
 
 	def append(self, transaction : GenericTransaction):
 		self.transactions.append(transaction)
+		self.add_total(transaction.total)
 
 	def append_all(self, transactions : List[GenericTransaction]):
-		for transaction in transactions:
-			self.append(transaction)
+		self.transactions.extend(transactions)
+		self.add_total(sum(transaction.total for transaction in transactions))
+
+	def merge(self, other):
+		self.merge_all([other])
+
+	def merge_all(self, others : List['Stream']):
+		self.transactions.extend(chain.from_iterable(other.transactions for other in others))
+		# summed in the same order as merging one at a time, so the totals are identical
+		self.raw_total = sum((other.raw_total for other in others), self.raw_total)
+		self.rounded = None
 
 	def simplify(self):
 		if self.total < 0:
@@ -48,11 +105,12 @@ class Stream:
 
 # TODO: Convert inheritance of Stream dict to member
 class Streams(dict):
-	def __init__(self, config : CollectionConfig, *arg, **kw):
+	def __init__(self, config : CollectionConfig, *arg, keep_transactions=True, normaliser=None, **kw):
 		super(Streams, self).__init__(*arg, **kw)
-		self.aliaser = TransactionAliaser(config)
+		self.aliaser = TransactionAliaser(config, normaliser)
 		self.config = config
 		self.name = config.name
+		self.keep_transactions = keep_transactions
 		pass
 
 	def __str__(self):
@@ -62,12 +120,33 @@ class Streams(dict):
 		sort_key = lambda stream: (not stream.isOther, abs(stream.total))
 		return sorted(self.values(), key=sort_key, reverse=True)
 
+	def sections(self) -> List[List[Stream]]:
+		"""The streams in the order they are printed, in the sections that are printed one after another."""
+		return [self.values_sorted()]
+
 	def insert(self, transaction : GenericTransaction, source=None):
 		if source is None:
 			source = self._to_source(transaction)
 		if source not in self:
 			self[source] = Stream(source, self.name)
-		self[source].append(transaction)
+		if self.keep_transactions:
+			self[source].append(transaction)
+		else:
+			self[source].add_total(transaction.total)
+		pass
+
+	def reserve(self, transaction : GenericTransaction, source=None):
+		"""Creates the stream the transaction will be inserted into, without adding to its total."""
+		if source is None:
+			source = self._to_source(transaction)
+		if source not in self:
+			self[source] = Stream(source, self.name)
+
+	def insert_total(self, source, total : float):
+		"""Adds an aggregated total to a stream, without any of its transactions."""
+		if source not in self:
+			self[source] = Stream(source, self.name)
+		self[source].add_total(total)
 		pass
 
 	def _to_source(self, transaction : GenericTransaction):
@@ -80,7 +159,7 @@ class Streams(dict):
 
 		# Insert the new stream into the collection
 		if source in self:
-			self[source].append_all(self[oldKey].transactions)
+			self[source].merge(self[oldKey])
 		else:
 			self[source] = self[oldKey]
 			self[source].source = source
@@ -88,31 +167,50 @@ class Streams(dict):
 		pass
 
 	def rename_as_other(self, stream : Stream):
+		self.merge_as_other([stream])
+
+	def merge_as_other(self, streams : List[Stream]):
+		"""
+		Merges the streams into the "Other" stream in a single step. If there is no "Other"
+		stream yet, the first of the streams becomes it, as when renaming them one at a time.
+		"""
+		streams = [stream for stream in streams if self.get(stream.source) is stream]
+		if not streams:
+			return
+		timings.count('streams consolidated', len(streams))
 		othername = "Other "+self.name
-		self.rename(stream, source=othername)
+		for stream in streams:
+			del self[stream.source]
 		if othername in self:
-			self[othername].isOther = True
+			other = self[othername]
+		else:
+			other = streams.pop(0)
+			other.source = othername
+			self[othername] = other
+		other.merge_all(streams)
+		other.isOther = True
 
 	def consolidate_by_count(self, limit):
 		difference = len(self) - limit
 		if difference > 0:
 			streamsNotOther = [x for x in self.values() if not x.isOther]
-			streamsNotOther.sort(key = lambda stream: abs(stream.total))
-			for stream in streamsNotOther[:difference]:
-				self.rename_as_other(stream)
+			# the smallest streams, smallest first and ties earliest first, as a stable sort would
+			# order them, so they're merged and summed in the same order as one at a time
+			merged = heapq.nsmallest(difference, enumerate(streamsNotOther), key=lambda item: (abs(item[1].total), item[0]))
+			self.merge_as_other([stream for _, stream in merged])
 
 	def consolidate_by_total(self, relative, absolute):
-		threshold = max(relative * self.total, absolute)
-		for stream in self.copy().values():
-			if stream.isOther:
-				continue
-			if abs(stream.total) < abs(threshold):
-				self.rename_as_other(stream)
+		threshold = abs(max(relative * self.total, absolute))
+		self.merge_as_other([stream for stream in self.values() if not stream.isOther and abs(stream.total) < threshold])
 
 	@property
 	def total(self):
 		return sum(stream.total for stream in self.values())
 
+	@property
+	def raw_total(self):
+		return sum(stream.raw_total for stream in self.values())
+
 	def apply(self, apply):
 		return [apply(k, s) for k, s in self.items()]
 
@@ -132,100 +230,122 @@ class Streams(dict):
 			self.consolidate_by_count(self.config.threshold.count)
 			self.consolidate_by_total(relative=self.config.threshold.relative, absolute=self.config.threshold.absolute)
 
-	def round(self):
-		self.round_to(self.total)
-		pass
-
-	def round_to(self, total):
-		"""
-		Rounding requires some finesse to ensure the streams balance. Consider a simple example
-		where there's three categories with totals $10.40, $10.30 and $10.30. Using rounding, these
-		each would be valued at $10, for a total of $30. But the total for the parent category would
-		be $31, off by a dollar. To round these properly, the first category should round to $11 and
-		the others $10. Rounding up has been prioritised based on greatest amount of cents.
-		"""
-		totalWithTruncation = sum(self.apply(lambda _,s : math.trunc(s.total)))
-		difference = math.floor(abs(total - totalWithTruncation))
-		if difference > 0:
-			zippedCentsAndKeys = self.apply(lambda k,s : (abs(s.total) % 1, k))
-			zippedCentsAndKeys.sort(reverse=True)
-			keysSortedByCents = [k for _,k in zippedCentsAndKeys]
-		else:
-			keysSortedByCents = self.keys()
-
-		for k in keysSortedByCents:
-			if difference > 0:
-				self[k].round_away_from_zero = True
-				difference -= 1
-			else:
-				self[k].round_away_from_zero = False
-
 	def as_generic_transaction(self) -> GenericTransaction:
 		return GenericTransaction(description=self.name, amount=self.total)
 
 
 class ExpenseStreams(Streams):
 	"""
-	Streams for expenses are a special case, as we need to handle both parent and child categories.
+	Streams for expenses are a special case, as they follow the hierarchy of categories.
 
-	The streams in this class are for each parent category. The streams from the parent categories
-	to the sub-categories are handled by the groups. All transactions from Up Bank are guaranteed
-	to have both category types.
+	The streams in this class are for each top level category. The streams from a category to
+	its sub-categories are handled by the groups, which are keyed on the path of the category,
+	so categories can be nested to any depth. Each transaction is added to a stream at every
+	level of its category path as it is inserted, so all of the levels are totalled in one pass.
 	"""
-	def __init__(self, config):
-		super().__init__(config)
-		self.groups : dict(str, Streams) = dict()
+	def __init__(self, config, keep_transactions=True):
+		super().__init__(config, keep_transactions=keep_transactions)
+		self.groups : Mapping[Tuple[str, ...], Streams] = dict()
 
 	def __str__(self):
 		strings = [str(group) for group in self.groups.values()]
 		strings += [super().__str__()]	# join the parent categories
 		return "\n".join(strings)
 
+	def sections(self) -> List[List[Stream]]:
+		return [group.values_sorted() for group in self.groups.values()] + super().sections()
+
+	@property
+	def depth(self) -> int:
+		return max((len(path) for path in self.groups), default=0)
+
 	def insert(self, transaction : GenericTransaction):
 		super().insert(transaction)
-		group = transaction.parentCategory
-		if group not in self.groups:
-			config = self.config
-			config.name = group
-			self.groups[group] = Streams(config)
-		self.groups[group].insert(transaction, transaction.category)
+		path = transaction.categoryPath
+		for depth in range(1, len(path)):
+			self.group(path[:depth]).insert(transaction, path[depth])
+
+	def reserve(self, transaction : GenericTransaction):
+		super().reserve(transaction)
+		path = transaction.categoryPath
+		for depth in range(1, len(path)):
+			self.group(path[:depth]).reserve(transaction, path[depth])
+
+	def group(self, path : Tuple[str, ...]) -> Streams:
+		if path not in self.groups:
+			config = copy.copy(self.config)
+			config.name = path[-1]
+			self.groups[path] = Streams(config, keep_transactions=self.keep_transactions)
+		return self.groups[path]
 
 	def _to_source(self, transaction):
-		return transaction.parentCategory
+		return transaction.categoryPath[0] if transaction.categoryPath else None
 
 	def validate(self):
 		for group in self.groups.values():
 			group.validate()
 
 	def consolidate(self):
-		for group in self.groups.values():
-			group.consolidate()
-
-	def round(self):
-		super().round()
-		for parent, group in zip(self.values(), self.groups.values()):
-			group.round_to(parent.total)
+		# parents first, so the groups under a category that is merged into Other are dropped
+		# before they are consolidated themselves
+		for path in sorted(self.groups, key=len):
+			group = self.groups.get(path)
+			if group is not None:
+				group.consolidate()
+				self._fold_consolidated(path, group)
+
+	def _fold_consolidated(self, path : Tuple[str, ...], group : Streams) -> None:
+		"""Drops the groups under the categories of a group that were merged into its Other stream, which now stands for them."""
+		folded = [child for child in self.groups if len(child) > len(path) and child[:len(path)] == path and child[len(path)] not in group]
+		for child in folded:
+			del self.groups[child]
+
+	def group_targets(self, depth : int = 1) -> List[Tuple[Streams, int]]:
+		"""
+		Each group of categories at a depth, along with the total that the group needs to sum to.
+		This is the total of its parent stream, which needs to have been rounded first, unless
+		some transactions are in the parent category itself rather than one of the group's, such
+		as when a configured category sits under an Up category. The group is then rounded to its
+		own total, as there's no share of the parent's rounding that belongs to it.
+		"""
+		targets = []
+		for path, group in self.groups.items():
+			if len(path) == depth:
+				parent = (self if depth == 1 else self.groups.get(path[:-1], {})).get(path[-1])
+				raw_total = group.raw_total
+				covers_parent = parent is not None and math.isclose(raw_total, parent.raw_total, rel_tol=1e-9, abs_tol=1e-6)
+				targets.append((group, parent.total if covers_parent else round(raw_total)))
+		return targets
 
 
 class StreamCollection:
-	def __init__(self, config : Mapping[TransactionType, CollectionConfig]):
+	def __init__(self, config : Mapping[TransactionType, CollectionConfig], keep_transactions=True):
+		"""
+		Streams keep references to their transactions so that unexpected streams can be reviewed
+		during validation. Without these, only the totals are kept.
+		"""
 		self.config = config
 		self.classifier = TransactionClassifier(config)
+		normaliser = getattr(config, 'normaliser', None)
 		self.collections = {}
 		for type, collection_config in config.items():
 			if type is TransactionType.Ignore:
 				continue
 			elif type is TransactionType.Expense:
-				self.collections[type] = ExpenseStreams(collection_config)
+				self.collections[type] = ExpenseStreams(collection_config, keep_transactions=keep_transactions)
 			else:
-				self.collections[type] = Streams(collection_config)
+				self.collections[type] = Streams(collection_config, keep_transactions=keep_transactions, normaliser=normaliser)
 
 	def __str__(self):
 		return "\n".join([str(collection) for collection in self.collections.values()])
 
+	def sections(self) -> Iterator[List[Stream]]:
+		return chain.from_iterable(collection.sections() for collection in self.collections.values())
+
 	def add_transactions(self, transactions: List[GenericTransaction]) -> None:
-		for transaction in transactions:
-			self.add_transaction(transaction)
+		with timings.span('classify and insert'):
+			for transaction in transactions:
+				self.add_transaction(transaction)
 
 	def add_transaction(self, transaction: GenericTransaction) -> None:
 		type = self.classifier.classify(transaction)
@@ -237,13 +357,42 @@ class StreamCollection:
 		else:
 			self.collections[type].insert(transaction)
 
+	def reserve(self, transaction: GenericTransaction) -> None:
+		"""
+		Creates the streams that the transaction will be inserted into, so they are ordered as
+		though it was inserted now, for transactions that can only be inserted later.
+		"""
+		type = self.classifier.classify(transaction)
+		if type not in {TransactionType.Unknown, TransactionType.Ignore}:
+			self.collections[type].reserve(transaction)
+
 	def cleanup(self):
-		for collection in self.collections.values():
-			collection.validate()
-			collection.consolidate()
-			collection.round()
+		with timings.span('cleanup'):
+			for collection in self.collections.values():
+				collection.validate()
+				collection.consolidate()
+			self.round()
 		return self
 
+	def round(self):
+		"""
+		Rounding requires some finesse to ensure the streams balance. Consider a simple example
+		where there's three categories with totals $10.40, $10.30 and $10.30. Using rounding, these
+		each would be valued at $10, for a total of $30. But the total for the parent category would
+		be $31, off by a dollar. To round these properly, the first category should round to $11 and
+		the others $10, prioritising the categories with the most cents.
+
+		The streams of each collection are rounded to sum to the collection's rounded total, and
+		then the streams of each expense group to sum to their parent stream, one level of
+		categories at a time, so the totals at every level are consistent by construction. A group
+		that covers only part of its parent stream is rounded to its own total instead.
+		"""
+		collections = self.collections.values()
+		round_level([(collection.values(), round(collection.raw_total)) for collection in collections])
+		expenses = [collection for collection in collections if isinstance(collection, ExpenseStreams)]
+		for depth in range(1, max((collection.depth for collection in expenses), default=0) + 1):
+			round_level([(group.values(), target) for collection in expenses for group, target in collection.group_targets(depth)])
+
 	def link(self):
 		difference = sum(collection.total for collection in self.collections.values())
 		self.collections[TransactionType.Savings].insert(GenericTransaction(description="Bank Account", amount=-difference))
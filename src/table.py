@@ -0,0 +1,133 @@
+import logging as log
+import numpy as np
+
+from datetime import datetime, timezone
+from typing import Iterable, List, Mapping, Tuple
+
+from .config import CollectionConfig, TransactionType
+from .stream import ExpenseStreams, StreamCollection
+from .transaction import GenericTransaction
+
+
+def encode(values : Iterable) -> Tuple[np.ndarray, List]:
+	"""Dictionary-encodes the values, returning their codes and the distinct values in order of appearance."""
+	codes = {}
+	encoded = np.fromiter((codes.setdefault(value, len(codes)) for value in values), dtype=np.int64)
+	return encoded, list(codes)
+
+
+def to_datetime64(date : datetime) -> np.datetime64:
+	if date.tzinfo is not None:
+		date = date.astimezone(timezone.utc).replace(tzinfo=None)
+	return np.datetime64(date, 'us')
+
+
+class TransactionTable:
+	"""
+	A columnar copy of a list of transactions, for aggregating large numbers of transactions
+	without a Python object per transaction. String columns are dictionary-encoded, with each
+	code indexing into the matching `*_values` list.
+
+	Transactions are only classified and aliased once for each distinct combination of the
+	columns that classification depends on, and stream totals are then summed with
+	`np.bincount`. Totals are accumulated in row order, the same order that
+	`StreamCollection.add_transactions` appends them in, so the output is identical.
+	"""
+	KEY_COLUMNS = ['descriptions', 'category_paths', 'tags', 'sources', 'destinations']
+
+	def __init__(self, amounts, totals, dates, descriptions, category_paths, tags, sources, destinations):
+		self.amounts = np.asarray(amounts, dtype=np.float64)
+		self.totals = np.asarray(totals, dtype=np.float64)
+		self.dates = np.asarray(dates, dtype='datetime64[us]')
+		self.descriptions, self.description_values = descriptions
+		self.category_paths, self.category_path_values = category_paths
+		self.tags, self.tag_values = tags
+		self.sources, self.source_values = sources
+		self.destinations, self.destination_values = destinations
+
+	def __len__(self):
+		return len(self.amounts)
+
+	@staticmethod
+	def from_transactions(transactions : List[GenericTransaction]) -> 'TransactionTable':
+		count = len(transactions)
+		return TransactionTable(
+			amounts = np.fromiter((t.amount for t in transactions), dtype=np.float64, count=count),
+			totals = np.fromiter((t.total for t in transactions), dtype=np.float64, count=count),
+			dates = np.array([to_datetime64(t.date) for t in transactions], dtype='datetime64[us]'),
+			descriptions = encode(t.description for t in transactions),
+			category_paths = encode(t.categoryPath for t in transactions),
+			tags = encode(tuple(t.tags) for t in transactions),
+			sources = encode(t.source for t in transactions),
+			destinations = encode(t.destination for t in transactions),
+		)
+
+	def signatures(self) -> Tuple[np.ndarray, np.ndarray]:
+		"""
+		Groups rows that classify and alias identically, returning the first row of each
+		group (in row order) and the group of each row.
+		"""
+		columns = [getattr(self, column) for column in self.KEY_COLUMNS] + [self.amounts > 0]
+		sizes = [int(codes.max(initial=0)) + 1 for codes in columns]
+		if np.prod(sizes, dtype=object) < 2**63:
+			key = np.zeros(len(self), dtype=np.int64)
+			for codes, size in zip(columns, sizes):
+				key = key * size + codes
+			_, first_rows, inverse = np.unique(key, return_index=True, return_inverse=True)
+		else:
+			key = np.stack(columns, axis=1).astype(np.int64)
+			_, first_rows, inverse = np.unique(key, axis=0, return_index=True, return_inverse=True)
+			inverse = inverse.reshape(-1)
+		order = np.argsort(first_rows)
+		renumber = np.empty_like(order)
+		renumber[order] = np.arange(len(order))
+		return first_rows[order], renumber[inverse]
+
+	def representative(self, row : int) -> GenericTransaction:
+		return GenericTransaction(
+			description = self.description_values[self.descriptions[row]],
+			amount = self.amounts[row],
+			categoryPath = self.category_path_values[self.category_paths[row]],
+			tags = list(self.tag_values[self.tags[row]]),
+			source = self.source_values[self.sources[row]],
+			destination = self.destination_values[self.destinations[row]],
+		)
+
+	def as_streams(self, config : Mapping[TransactionType, CollectionConfig]) -> StreamCollection:
+		streams = StreamCollection(config)
+		first_rows, signatures = self.signatures()
+
+		# Map each signature onto the stream (and expense group stream at each level of its
+		# category path) it is inserted into, numbering streams in the order their first
+		# transaction appears
+		stream_keys, group_keys = {}, {}
+		signature_streams = np.full(len(first_rows), -1, dtype=np.int64)
+		depth = max((len(path) for path in self.category_path_values), default=0)
+		signature_groups = np.full((max(depth - 1, 0), len(first_rows)), -1, dtype=np.int64)
+		for signature, row in enumerate(first_rows):
+			transaction = self.representative(row)
+			type = streams.classifier.classify(transaction)
+			if type is TransactionType.Unknown:
+				log.warning("Unmatched transactions found for %s", transaction)
+				continue
+			if type is TransactionType.Ignore:
+				continue
+			collection = streams.collections[type]
+			source = collection._to_source(transaction)
+			signature_streams[signature] = stream_keys.setdefault((type, source), len(stream_keys))
+			if isinstance(collection, ExpenseStreams):
+				path = transaction.categoryPath
+				for level in range(len(path) - 1):
+					signature_groups[level, signature] = group_keys.setdefault(path[:level + 2], len(group_keys))
+
+		stream_totals = self.sum_by(signature_streams[signatures], len(stream_keys))
+		group_totals = sum((self.sum_by(groups[signatures], len(group_keys)) for groups in signature_groups), np.zeros(len(group_keys)))
+		for (type, source), total in zip(stream_keys, stream_totals):
+			streams.collections[type].insert_total(source, total)
+		for path, total in zip(group_keys, group_totals):
+			streams.collections[TransactionType.Expense].group(path[:-1]).insert_total(path[-1], total)
+		return streams.cleanup().link()
+
+	def sum_by(self, groups : np.ndarray, count : int) -> np.ndarray:
+		included = groups >= 0
+		return np.bincount(groups[included], weights=self.totals[included], minlength=count)
@@ -0,0 +1,107 @@
+import json
+import time
+
+from contextlib import nullcontext
+from typing import Iterable, Iterator, List, Mapping
+
+_disabled = nullcontext()
+
+
+class Span:
+	__slots__ = ('timings', 'name', 'start', 'children')
+
+	def __init__(self, timings : 'Timings', name : str):
+		self.timings = timings
+		self.name = name
+
+	def __enter__(self):
+		self.children = 0.0
+		self.timings._stack.append(self)
+		self.start = time.perf_counter()
+		return self
+
+	def __exit__(self, *exc):
+		elapsed = time.perf_counter() - self.start
+		stack = self.timings._stack
+		stack.pop()
+		self.timings.add(self.name, elapsed, elapsed - self.children)
+		if stack:
+			stack[-1].children += elapsed
+
+
+class Timings:
+	"""
+	Named spans and counters for each stage of the pipeline, reported with `--timings`.
+
+	Spans nest, so the self time of a span excludes the spans started inside it. This matters
+	when streaming, where fetching, converting and inserting are interleaved page by page.
+	Everything is a no-op while disabled, and iterables are passed through untouched, so the
+	instrumentation can stay in place. Worker processes keep their own timings, which are not
+	reported.
+	"""
+	enabled : bool
+	spans : Mapping[str, List[float]]  # name -> [calls, total seconds, self seconds]
+	counters : Mapping[str, int]
+
+	def __init__(self, enabled : bool = False):
+		self.enabled = enabled
+		self.spans = {}
+		self.counters = {}
+		self._stack = []
+
+	def span(self, name : str):
+		return Span(self, name) if self.enabled else _disabled
+
+	def add(self, name : str, total : float, own : float = None) -> None:
+		span = self.spans.setdefault(name, [0, 0.0, 0.0])
+		span[0] += 1
+		span[1] += total
+		span[2] += total if own is None else own
+
+	def count(self, name : str, value : int = 1) -> None:
+		if self.enabled:
+			self.counters[name] = self.counters.get(name, 0) + value
+
+	def timed(self, name : str, iterable : Iterable, counter : str = None) -> Iterable:
+		"""Times each step of the iterable under `name`, counting its items under `counter`."""
+		if not self.enabled:
+			return iterable
+		return self._timed(name, iterable, counter)
+
+	def _timed(self, name : str, iterable : Iterable, counter : str) -> Iterator:
+		iterator = iter(iterable)
+		while True:
+			with Span(self, name):
+				try:
+					item = next(iterator)
+				except StopIteration:
+					return
+			if counter:
+				self.counters[counter] = self.counters.get(counter, 0) + 1
+			yield item
+
+	def as_dict(self) -> dict:
+		return {
+			'spans': {name : {'calls': calls, 'total': total, 'self': own} for name, (calls, total, own) in self.spans.items()},
+			'counters': dict(self.counters),
+		}
+
+	def save(self, path : str) -> None:
+		with open(path, 'w') as f:
+			json.dump(self.as_dict(), f, indent=2)
+
+	def __str__(self):
+		width = max([len(name) for name in list(self.spans) + list(self.counters)] + [len('Stage')])
+		lines = ["%-*s %10s %12s %12s" % (width, 'Stage', 'Calls', 'Total (ms)', 'Self (ms)')]
+		for name, (calls, total, own) in self.spans.items():
+			lines.append("%-*s %10d %12.1f %12.1f" % (width, name, calls, total * 1000, own * 1000))
+		if self.counters:
+			lines.append("")
+			lines.append("%-*s %10s" % (width, 'Counter', 'Value'))
+			for name, value in self.counters.items():
+				lines.append("%-*s %10d" % (width, name, value))
+		return "\n".join(lines)
+
+
+# Shared by the whole pipeline, enabled by `--timings` or `--timings-json`
+timings = Timings()
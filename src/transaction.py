@@ -1,12 +1,30 @@
 from __future__ import annotations
 
-from .config import AccountClassifierConfig, ClassifierConfig, CollectionConfig, TransactionType
+from .config import AccountClassifierConfig, ClassifierConfig, CollectionConfig, MerchantConfig, TransactionType
 from .protocol import Transaction
-from datetime import datetime
-from typing import Optional, List, Mapping, Callable
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from functools import lru_cache
+from typing import Optional, Iterable, Iterator, List, Mapping, Callable, Tuple
 from enum import Enum
+import re
+import sys
 import copy
 
+
+def intern(value : Optional[str]) -> Optional[str]:
+	return sys.intern(value) if type(value) is str else value
+
+
+_paths = {}
+
+
+def intern_path(path : Tuple[str, ...]) -> Tuple[str, ...]:
+	"""Shares one tuple between all of the transactions in a category."""
+	return _paths.setdefault(path, path)
+
+
 class AccountType(str, Enum):
 	JOINT = 'JOINT'
 	PARTNER = 'PARTNER'
@@ -14,7 +32,22 @@ class AccountType(str, Enum):
 	EXTERNAL = 'EXTERNAL'
 
 
-class GenericTransaction(Transaction):
+class GenericTransaction:
+	"""
+	A transaction from any source, reduced to what is needed to classify it.
+
+	Large histories hold hundreds of thousands of these, so they are slotted, the repeated
+	strings are interned and the set of relations is only allocated once a transaction is
+	connected to another. Transactions from the Up API are compared by their unique id.
+
+	The category path lists the names of the category and its ancestors from the top level
+	down, and is either given or made from the category and its parent. The category and
+	parent category are the last two names of the path.
+	"""
+	__slots__ = ('id', 'description', 'amount', '_split', 'currency', 'date', 'source', 'destination',
+		'category', 'parentCategory', 'categoryPath', 'tags', 'message', '_relations')
+
+	id: Optional[str]
 	description: str
 	amount: float
 	_split: float
@@ -24,9 +57,10 @@ class GenericTransaction(Transaction):
 	destination: Optional[AccountType]
 	category: Optional[str]
 	parentCategory: Optional[str]
+	categoryPath: Tuple[str, ...]
 	tags: List[str]
 	message: Optional[str]
-	_relations: set[GenericTransaction]
+	_relations: Optional[set[GenericTransaction]]
 
 	def __init__(self,
 			description,
@@ -38,31 +72,48 @@ class GenericTransaction(Transaction):
 			category=None,
 			parentCategory=None,
 			tags=list(),
-			message=None):
-		self.description = description
+			message=None,
+			id=None,
+			categoryPath=None):
+		self.id = id
+		self.description = intern(description)
 		self.amount = amount
-		self.currency = currency
+		self.currency = intern(currency)
 		self.date = date
 		self.source = source
 		self.destination = destination
-		self.category = category
-		self.parentCategory = parentCategory
+		if categoryPath is None:
+			categoryPath = tuple(intern(name) for name in (parentCategory, category) if name is not None)
+		else:
+			category = categoryPath[-1] if categoryPath else None
+			parentCategory = categoryPath[-2] if len(categoryPath) > 1 else None
+		self.categoryPath = intern_path(tuple(categoryPath))
+		self.category = intern(category)
+		self.parentCategory = intern(parentCategory)
 		self.tags = tags
 		self.message = message
-		self._relations = set()
+		self._relations = None
 		self._split = 1.0
 
 	def __repr__(self):
 		return f"<Transaction {self.date}: {self.amount} {self.currency} [{self.description}]>"
 
 	def __eq__(self, other) -> bool:
-		if type(other) is type(self):
-			return self.__dict__ == other.__dict__
-		return False
+		if type(other) is not type(self):
+			return False
+		if self.id is not None or other.id is not None:
+			return self.id == other.id
+		return self._fields() == other._fields()
 
 	def __hash__(self):
+		if self.id is not None:
+			return hash(self.id)
 		return hash((self.description, self.date, self.amount))
 
+	def _fields(self) -> tuple:
+		return (self.description, self.amount, self._split, self.currency, self.date, self.source,
+			self.destination, self.category, self.parentCategory, self.tags, self.message)
+
 	@property
 	def total(self) -> float:
 		if self.internal:
@@ -83,7 +134,7 @@ class GenericTransaction(Transaction):
 
 	@split.setter
 	def split(self, split : float) -> None:
-		assert(split > 0 and split < 1)
+		assert(split >= 0 and split <= 1)
 		assert(self.involves_account(AccountType.JOINT))
 		self._split = split
 
@@ -91,39 +142,40 @@ class GenericTransaction(Transaction):
 		return (self.source == account) ^ (self.destination == account)
 
 	def connect(self, other : GenericTransaction) -> None:
+		if other._relations is None:
+			other._relations = set()
+		if self._relations is None:
+			self._relations = set()
 		other._relations.add(self)
 		self._relations.add(other)
 
 	def clear_connections(self) -> None:
-		self._relations = set()
+		self._relations = None
 
 	@property
-	def is_combinable(self) -> bool:
-		return len(self._relations) >= 2 \
-			and self.involves_account(AccountType.EXTERNAL) \
-			and any(t.involves_account(AccountType.PERSONAL) for t in self._relations) \
-			and any(t.involves_account(AccountType.JOINT) for t in self._relations)
+	def relations(self) -> set[GenericTransaction]:
+		return self._relations if self._relations is not None else set()
 
 	@property
 	def connections(self) -> List[GenericTransaction]:
-		return list(self._relations)
+		return list(self.relations)
 
 	@property
 	def root_transaction(self) -> GenericTransaction:
 		# only the root transaction has a category
-		for t in self._relations | {self}:
+		for t in self.relations | {self}:
 			if t.involves_account(AccountType.EXTERNAL):
 				return t
 		raise RuntimeError("No root transaction found")
 
-	def update_using_connections(self) -> None:
-		# 
-		for transaction in self._relations:
-			if self.amount == transaction.amount:
-				self.source = transaction.source
+	def combine_with(self, transfers : Iterable[GenericTransaction]) -> None:
+		"""Takes the account of the transfer that paid for this purchase, which has the same amount."""
+		for transfer in transfers:
+			if self.amount == transfer.amount:
+				self.source = transfer.source
 
-	def relates_to(self, other : GenericTransaction) -> bool:
-		return self.matches(other) or self.covers_or_covered(other)
+	def relates_to(self, other : GenericTransaction, cover_window : Optional[timedelta] = None) -> bool:
+		return self.matches(other) or self.covers_or_covered(other, cover_window)
 
 	def matches(self, other : GenericTransaction) -> bool:
 		return self.amount == -1 * other.amount 	\
@@ -131,22 +183,232 @@ class GenericTransaction(Transaction):
 			and self.source == other.destination 	\
 			and self.destination == other.source
 
-	def covers(self, other : GenericTransaction) -> bool:
-		return self.covers_or_covered(other) 		\
+	def covers(self, other : GenericTransaction, window : Optional[timedelta] = None) -> bool:
+		return self.covers_or_covered(other, window) 		\
 			and self.date >= other.date
 
-	def covers_or_covered(self, other : GenericTransaction) -> bool:
+	def covers_or_covered(self, other : GenericTransaction, window : Optional[timedelta] = None) -> bool:
 		return abs(self.amount) == abs(other.amount) \
-			and "cover" in (self.description + other.description).lower()
+			and "cover" in (self.description + other.description).lower() \
+			and (window is None or abs(self.date.timestamp() - other.date.timestamp()) <= window.total_seconds())
+
+	@property
+	def mentions_cover(self) -> bool:
+		return "cover" in self.description.lower()
 
 	def between_accounts(self, account : AccountType, other_account : AccountType) -> bool:
 		return (self.source == account and self.destination == other_account) or \
 				(self.source == other_account and self.destination == account)
 
 
+class DateSortedBucket:
+	"""Transactions kept in date order, so those within a window of a date can be found by bisection."""
+	def __init__(self):
+		self.timestamps = []
+		self.transactions = []
+
+	def __iter__(self):
+		return iter(self.transactions)
+
+	def add(self, transaction : GenericTransaction) -> None:
+		timestamp = transaction.date.timestamp()
+		index = bisect_right(self.timestamps, timestamp)
+		self.timestamps.insert(index, timestamp)
+		self.transactions.insert(index, transaction)
+
+	def around(self, date : datetime, window : Optional[timedelta]) -> List[GenericTransaction]:
+		if window is None:
+			return self.transactions
+		timestamp, seconds = date.timestamp(), window.total_seconds()
+		first = bisect_left(self.timestamps, timestamp - seconds)
+		last = bisect_right(self.timestamps, timestamp + seconds)
+		return self.transactions[first:last]
+
+
+class RelationIndex:
+	"""
+	Buckets transactions by absolute amount so that relations are only checked between
+	transactions that could possibly relate. Mirrored transfers must share a currency and have
+	opposite accounts, so they are keyed on (abs(amount), currency, source, destination) and
+	looked up in the bucket of the mirrored direction, at any date. A "cover" can also relate to
+	any transaction of the same absolute amount within the cover window, so covers are kept in a
+	further bucket keyed on abs(amount), and every bucket is sorted by date to find those in the
+	window.
+	"""
+	matches : Mapping[Tuple[float, str, Optional[AccountType], Optional[AccountType]], DateSortedBucket]
+	covers : Mapping[float, DateSortedBucket]
+	keys : Mapping[float, set[tuple]]
+	cover_window : Optional[timedelta]
+
+	def __init__(self, cover_window : Optional[timedelta] = None):
+		self.matches = defaultdict(DateSortedBucket)
+		self.covers = defaultdict(DateSortedBucket)
+		self.keys = defaultdict(set)
+		self.cover_window = cover_window
+		self.comparisons = 0
+
+	def candidates(self, transaction : GenericTransaction) -> Iterator[GenericTransaction]:
+		amount = abs(transaction.amount)
+		mirrored = (amount, transaction.currency, transaction.destination, transaction.source)
+		if mirrored in self.matches:
+			yield from self.matches[mirrored]
+		if transaction.mentions_cover:
+			for key in self.keys.get(amount, ()):
+				if key != mirrored:
+					yield from self.matches[key].around(transaction.date, self.cover_window)
+		elif amount in self.covers:
+			for cover in self.covers[amount].around(transaction.date, self.cover_window):
+				if RelationIndex._key(cover) != mirrored:
+					yield cover
+
+	def add(self, transaction : GenericTransaction) -> None:
+		key = RelationIndex._key(transaction)
+		self.matches[key].add(transaction)
+		self.keys[key[0]].add(key)
+		if transaction.mentions_cover:
+			self.covers[key[0]].add(transaction)
+
+	@staticmethod
+	def _key(transaction : GenericTransaction) -> tuple:
+		return (abs(transaction.amount), transaction.currency, transaction.source, transaction.destination)
+
+	def connect(self, transaction : GenericTransaction) -> None:
+		"""Connects the transaction to all related transactions in the index, then indexes it."""
+		for candidate in self.candidates(transaction):
+			self.comparisons += 1
+			if candidate.relates_to(transaction, self.cover_window):
+				candidate.connect(transaction)
+		self.add(transaction)
+
+
+class DisjointSet:
+	"""Union-find over hashable keys, with path halving and union by size."""
+	parent : dict
+	size : dict
+
+	def __init__(self):
+		self.parent = {}
+		self.size = {}
+
+	def find(self, key) -> object:
+		self.parent.setdefault(key, key)
+		while self.parent[key] != key:
+			self.parent[key] = self.parent[self.parent[key]]
+			key = self.parent[key]
+		return key
+
+	def union(self, a, b) -> None:
+		a, b = self.find(a), self.find(b)
+		if a == b:
+			return
+		if self.size.get(a, 1) < self.size.get(b, 1):
+			a, b = b, a
+		self.parent[b] = a
+		self.size[a] = self.size.get(a, 1) + self.size.get(b, 1)
+
+
+def _date_order(transaction : GenericTransaction) -> tuple:
+	# relations are sets, so candidates are sorted to match them the same way on every run
+	return (transaction.date, transaction.id or '', transaction.description)
+
+
+class CoverCombiner:
+	"""
+	Combines purchases with the cover transfers between the personal and joint accounts that
+	paid for them, so that the purchase is counted against the account that covered it and
+	the transfers are dropped.
+
+	The two halves of each transfer are joined in a disjoint set, and each transfer is then
+	matched to one related purchase. Where several transactions of the same amount could be
+	matched, the pairs nearest in date are matched first, so every transaction is combined at
+	most once. Only a new batch and the transactions related to it need to be checked, as any
+	group that the batch completes includes one of them.
+	"""
+	combined : set  # object ids of the transactions already combined
+
+	def __init__(self):
+		self.combined = set()
+
+	@staticmethod
+	def is_transfer(transaction : GenericTransaction) -> bool:
+		return transaction.mentions_cover and transaction.between_accounts(AccountType.PERSONAL, AccountType.JOINT)
+
+	@staticmethod
+	def is_purchase(transaction : GenericTransaction) -> bool:
+		return not transaction.mentions_cover and transaction.involves_account(AccountType.EXTERNAL)
+
+	def groups(self, transactions : Iterable[GenericTransaction]) -> List[Tuple[GenericTransaction, List[GenericTransaction]]]:
+		"""Matches the transfers related to the transactions with purchases, as (purchase, transfers)."""
+		available = lambda t: id(t) not in self.combined
+		transfers = {}
+		for transaction in transactions:
+			for t in [transaction, *transaction.relations]:
+				if CoverCombiner.is_transfer(t) and available(t):
+					transfers[id(t)] = t
+
+		sets = DisjointSet()
+		halves = [(t, r) for t in transfers.values() for r in t.relations
+			if CoverCombiner.is_transfer(r) and available(r) and t.matches(r)]
+		paired = set()
+		for t, r in CoverCombiner._nearest_first(halves):
+			if id(t) not in paired and id(r) not in paired:
+				transfers[id(r)] = r
+				sets.union(id(t), id(r))
+				paired.update((id(t), id(r)))
+		members = defaultdict(list)
+		for key, t in transfers.items():
+			members[sets.find(key)].append(t)
+
+		candidates = [(min(group, key=_date_order), p) for group in members.values() for t in group for p in t.relations
+			if CoverCombiner.is_purchase(p) and available(p)]
+		groups = []
+		for first, purchase in CoverCombiner._nearest_first(candidates):
+			if available(first) and available(purchase):
+				group = members[sets.find(id(first))]
+				self.combined.update(id(t) for t in [purchase, *group])
+				groups.append((purchase, group))
+		return groups
+
+	@staticmethod
+	def _nearest_first(pairs : List[Tuple[GenericTransaction, GenericTransaction]]) -> List[Tuple[GenericTransaction, GenericTransaction]]:
+		distance = lambda a, b: abs(a.date.timestamp() - b.date.timestamp())
+		unique = {(id(a), id(b)) : (a, b) for a, b in pairs}.values()
+		return sorted(unique, key=lambda pair: (distance(*pair), _date_order(pair[0]), _date_order(pair[1])))
+
+
+class DescriptionNormaliser:
+	"""
+	Maps descriptions onto a canonical merchant key, so that variations of the same merchant
+	(store numbers, locations, reference ids) end up in the same stream. The configured regex
+	substitutions are applied in order, then whitespace is collapsed. The same merchants repeat
+	many times, so keys are memoised in a bounded LRU keyed on the raw description.
+	"""
+	config : MerchantConfig
+
+	def __init__(self, config : MerchantConfig):
+		self.config = config
+		self.patterns = [(re.compile(pattern), replace) for pattern, replace in config.rules]
+		self.normalise = lru_cache(maxsize=config.cache_size)(self._normalise)
+
+	def __getstate__(self):
+		# the cache can't be pickled, so it is rebuilt empty
+		return {'config': self.config}
+
+	def __setstate__(self, state):
+		self.__init__(state['config'])
+
+	def _normalise(self, description : str) -> str:
+		key = description
+		for pattern, replace in self.patterns:
+			key = pattern.sub(replace, key)
+		key = " ".join(key.split())
+		return intern(key) if key else description
+
+
 class TransactionAliaser:
-	def __init__(self, config : CollectionConfig):
+	def __init__(self, config : CollectionConfig, normaliser : DescriptionNormaliser = None):
 		self.config = config
+		self.normaliser = normaliser
 
 	def get_alias(self, transaction : GenericTransaction):
 		alias = self.get_alias_by_tag(transaction)
@@ -155,13 +417,22 @@ class TransactionAliaser:
 		alias = self.get_alias_by_account(transaction)
 		if alias is not None:
 			return alias
-		return transaction.description
+		return self.merchant(transaction)
+
+	def merchant(self, transaction : GenericTransaction):
+		if self.normaliser is None:
+			return transaction.description
+		return self.normaliser.normalise(transaction.description)
 
 	def get_alias_by_tag(self, transaction : GenericTransaction):
 		return next((self.config.tags.get_alias(tag) for tag in transaction.tags), None)
 	
-	def get_alias_by_account(self, transaction : GenericTransaction):		
-		return self.config.accounts.get_alias(transaction.description)
+	def get_alias_by_account(self, transaction : GenericTransaction):
+		# an alias for the exact description wins over one for its merchant
+		alias = self.config.accounts.get_alias(transaction.description)
+		if alias is None and self.normaliser is not None:
+			alias = self.config.accounts.get_alias(self.merchant(transaction))
+		return alias
 
 
 class TransactionFilter:
@@ -231,37 +502,100 @@ class TransactionFilter:
 		return bool(self.predicate) and self.predicate(transaction)
 
 
+class ClassifierRules:
+	"""
+	The tag and account classifiers of every collection compiled into lookup tables. Each rule
+	maps to the position of its collection in the config, so that when several collections
+	match, the first one configured wins as it would when checking the filters in order.
+
+	Accounts with a $ prefix may appear anywhere in the description, so these are kept in a
+	trie that is only walked from the $ characters of a description.
+	"""
+	types : List[TransactionType]
+	tags : Mapping[str, int]
+	accounts : Mapping[str, int]
+	prefixed_accounts : dict
+
+	def __init__(self, configs : Mapping[TransactionType, CollectionConfig]):
+		self.types = list(configs.keys())
+		self.tags = {}
+		self.accounts = {}
+		self.prefixed_accounts = {}
+		for index, config in enumerate(configs.values()):
+			for tag in config.tags.collection:
+				self.tags.setdefault(tag, index)
+			for account in config.accounts.collection:
+				self.accounts.setdefault(account, index)
+				if account.startswith('$'):
+					self._insert_prefixed(account, index)
+
+	def _insert_prefixed(self, account : str, index : int) -> None:
+		node = self.prefixed_accounts
+		for character in account:
+			node = node.setdefault(character, {})
+		node[None] = min(node.get(None, index), index)
+
+	def _match_prefixed(self, description : str, start : int) -> Optional[int]:
+		best = None
+		node = self.prefixed_accounts
+		for character in description[start:]:
+			node = node.get(character)
+			if node is None:
+				break
+			if None in node and (best is None or node[None] < best):
+				best = node[None]
+		return best
+
+	def _to_type(self, index : Optional[int]) -> TransactionType:
+		return TransactionType.Unknown if index is None else self.types[index]
+
+	def match_tags(self, transaction : GenericTransaction) -> TransactionType:
+		indices = [self.tags[tag] for tag in transaction.tags if tag in self.tags]
+		return self._to_type(min(indices, default=None))
+
+	def match_account(self, transaction : GenericTransaction) -> TransactionType:
+		description = transaction.description
+		best = self.accounts.get(description)
+		start = description.find('$')
+		while start != -1:
+			index = self._match_prefixed(description, start)
+			if index is not None and (best is None or index < best):
+				best = index
+			start = description.find('$', start + 1)
+		return self._to_type(best)
+
+
 class TransactionClassifier:
 	filters : Mapping[TransactionType, TransactionFilter]
+	rules : ClassifierRules
 
 	def __init__(self, configs : Mapping[TransactionType, CollectionConfig]):
+		# Changes to the configs after this point are not picked up by the compiled rules
 		self.filters = {type : TransactionFilter(accounts=config.accounts, tags=config.tags) for type, config in configs.items()}
-
-	def classify(self, transaction : GenericTransaction) -> TransactionType:
-		classifierOrder = [
+		self.rules = getattr(configs, 'rules', None) or ClassifierRules(configs)
+		self.classifierOrder = [
 			self.classify_by_tag,
 			self.classify_by_category_presence,
 			self.classify_by_source_and_destination,
 			self.classify_by_account,
 			self.classify_by_postive_value,
 		]
-		for classifier in classifierOrder:
+
+	def classify(self, transaction : GenericTransaction) -> TransactionType:
+		for classifier in self.classifierOrder:
 			classification = classifier(transaction)
 			if classification is not TransactionType.Unknown:
 				return classification
 		return TransactionType.Unknown
 
+	def classify_many(self, transactions : Iterable[GenericTransaction]) -> List[TransactionType]:
+		return [self.classify(transaction) for transaction in transactions]
+
 	def classify_by_tag(self, transaction : GenericTransaction) -> TransactionType:
-		for type, filter in self.filters.items():
-			if filter.match_by_tag(transaction):
-				return type
-		return TransactionType.Unknown
+		return self.rules.match_tags(transaction)
 
 	def classify_by_account(self, transaction : GenericTransaction) -> TransactionType:
-		for type, filter in self.filters.items():
-			if filter.match_by_account(transaction):
-				return type
-		return TransactionType.Unknown
+		return self.rules.match_account(transaction)
 
 	# TODO: Need to filter out transactions between 2Up and Funding accounts
 	def classify_by_source_and_destination(self, transaction : GenericTransaction) -> TransactionType:
@@ -0,0 +1,122 @@
+import hashlib
+import json
+import logging as log
+import os
+import re
+import time
+
+from typing import Optional
+from urllib.parse import urlparse
+
+import requests
+
+from requests.adapters import DEFAULT_POOLSIZE, HTTPAdapter
+from requests.structures import CaseInsensitiveDict
+
+from .config import ResponseCacheConfig
+from .timings import timings
+
+# Single accounts and categories and their lists, but not the transactions of an account
+CACHEABLE_PATH = re.compile(r'/(accounts|categories)(/[^/]+)?$')
+# Describe how the body was sent rather than the body, which is cached decoded
+TRANSFER_HEADERS = {'content-encoding', 'content-length', 'transfer-encoding', 'connection'}
+
+
+class CachingSession(requests.Session):
+	"""
+	A requests session for the Up API client, which keeps connections alive in a pool sized for
+	the concurrent fetches, and caches the accounts and categories on disk as they rarely change.
+
+	Cached responses are used without a request until they are older than the TTL, after which
+	they are revalidated with the ETag or Last-Modified headers of the response, if the API sent
+	either. Entries are keyed on the URL and the token, so different tokens don't share them.
+	"""
+	cache : Optional[ResponseCacheConfig]
+	hits : int
+	misses : int
+	revalidated : int
+
+	def __init__(self, cache : Optional[ResponseCacheConfig] = None, pool_size : int = DEFAULT_POOLSIZE):
+		super().__init__()
+		adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(pool_size, DEFAULT_POOLSIZE))
+		self.mount('https://', adapter)
+		self.mount('http://', adapter)
+		self.cache = cache
+		self.hits = 0
+		self.misses = 0
+		self.revalidated = 0
+
+	@property
+	def hit_rate(self) -> float:
+		total = self.hits + self.misses + self.revalidated
+		return (self.hits + self.revalidated) / total if total else 0.0
+
+	def request(self, method, url, params=None, headers=None, **kw):
+		if self.cache is None or method.upper() != 'GET' or not CACHEABLE_PATH.search(urlparse(url).path):
+			return super().request(method, url, params=params, headers=headers, **kw)
+
+		path = self._entry_path(url, params, headers)
+		entry = self._load(path)
+		if entry is not None and time.time() - entry['stored'] < self.cache.ttl.total_seconds():
+			self._count('hits')
+			return CachingSession._to_response(entry, url)
+
+		headers = dict(headers or {})
+		if entry is not None:
+			if 'etag' in entry['headers']:
+				headers['If-None-Match'] = entry['headers']['etag']
+			if 'last-modified' in entry['headers']:
+				headers['If-Modified-Since'] = entry['headers']['last-modified']
+		response = super().request(method, url, params=params, headers=headers, **kw)
+
+		if entry is not None and response.status_code == 304:
+			self._count('revalidated')
+			entry['stored'] = time.time()
+			self._save(path, entry)
+			return CachingSession._to_response(entry, url)
+		self._count('misses')
+		if response.status_code == 200:
+			self._save(path, {
+				'stored': time.time(),
+				'status': response.status_code,
+				'headers': {key.lower() : value for key, value in response.headers.items() if key.lower() not in TRANSFER_HEADERS},
+				'body': response.text,
+			})
+		return response
+
+	def _count(self, counter : str) -> None:
+		setattr(self, counter, getattr(self, counter) + 1)
+		timings.count('http cache %s' % counter)
+
+	def _entry_path(self, url, params, headers) -> str:
+		key = json.dumps([url, sorted((params or {}).items()), (headers or {}).get('Authorization')])
+		return os.path.join(self.cache.path, hashlib.sha256(key.encode()).hexdigest() + '.json')
+
+	def _load(self, path : str) -> Optional[dict]:
+		try:
+			with open(path, 'r') as f:
+				return json.load(f)
+		except FileNotFoundError:
+			return None
+		except (OSError, ValueError) as e:
+			log.debug("Ignoring cached response %s: %s", path, e)
+			return None
+
+	def _save(self, path : str, entry : dict) -> None:
+		try:
+			os.makedirs(self.cache.path, exist_ok=True)
+			with open(path + '.tmp', 'w') as f:
+				json.dump(entry, f)
+			os.replace(path + '.tmp', path)
+		except OSError as e:
+			log.debug("Could not cache response %s: %s", path, e)
+
+	@staticmethod
+	def _to_response(entry : dict, url : str) -> requests.Response:
+		response = requests.Response()
+		response.status_code = entry['status']
+		response.headers = CaseInsensitiveDict(entry['headers'])
+		response._content = entry['body'].encode('utf-8')
+		response.encoding = 'utf-8'
+		response.url = url
+		return response
@@ -0,0 +1,152 @@
+"""
+Test doubles for the Up API, implementing the Client protocol in src/protocol.py without the network.
+"""
+import asyncio
+
+from datetime import datetime, timezone
+from upbankapi.models import Account, Category, Transaction
+
+PING_ID = 'fake-user'
+
+
+def raw_account(id, name, ownership='INDIVIDUAL'):
+	return {
+		'type': 'accounts',
+		'id': id,
+		'attributes': {
+			'displayName': name,
+			'accountType': 'TRANSACTIONAL',
+			'ownershipType': ownership,
+			'balance': {'currencyCode': 'AUD', 'value': '0.00', 'valueInBaseUnits': 0},
+			'createdAt': '2020-01-01T00:00:00+10:00',
+		},
+		'relationships': {},
+	}
+
+
+def raw_category(id, name, parent=None, children=()):
+	return {
+		'type': 'categories',
+		'id': id,
+		'attributes': {'name': name},
+		'relationships': {
+			'parent': {'data': {'type': 'categories', 'id': parent} if parent else None},
+			'children': {'data': [{'type': 'categories', 'id': child} for child in children]},
+		},
+	}
+
+
+def raw_transaction(id, description, amount, created_at, account, transfer_account=None,
+		category=None, parent_category=None, tags=(), currency='AUD', status='SETTLED', message=None):
+	if created_at.tzinfo is None:
+		created_at = created_at.replace(tzinfo=timezone.utc)
+	related = lambda type, id: {'data': {'type': type, 'id': id} if id else None}
+	return {
+		'type': 'transactions',
+		'id': id,
+		'attributes': {
+			'status': status,
+			'rawText': None,
+			'description': description,
+			'message': message,
+			'isCategorizable': True,
+			'holdInfo': None,
+			'roundUp': None,
+			'cashback': None,
+			'amount': {'currencyCode': currency, 'value': '%.2f' % amount, 'valueInBaseUnits': round(amount * 100)},
+			'foreignAmount': None,
+			'cardPurchaseMethod': None,
+			'settledAt': created_at.isoformat(),
+			'createdAt': created_at.isoformat(),
+		},
+		'relationships': {
+			'account': related('accounts', account),
+			'transferAccount': related('accounts', transfer_account),
+			'category': related('categories', category),
+			'parentCategory': related('categories', parent_category),
+			'tags': {'data': [{'type': 'tags', 'id': tag} for tag in tags]},
+		},
+	}
+
+
+def as_timestamp(date):
+	return date.timestamp() if date is not None else None
+
+
+class FakeClient:
+	"""
+	Serves raw API payloads from memory, newest transactions first as the Up API does. Every call
+	to `transactions` is recorded so tests can check what would have been downloaded.
+	"""
+	def __init__(self, accounts=(), categories=(), transactions=()):
+		self.raw_accounts = list(accounts)
+		self.raw_categories = list(categories)
+		self.raw_transactions = list(transactions)
+		self.requests = []
+
+	def ping(self):
+		return PING_ID
+
+	def accounts(self, *, limit=None):
+		return [Account(self, raw) for raw in self.raw_accounts][:limit]
+
+	def categories(self):
+		return [Category(self, raw) for raw in self.raw_categories]
+
+	def transactions(self, account=None, *, since=None, until=None, category=None, limit=None, page_size=50):
+		self.requests.append({'account': account, 'since': since, 'until': until, 'limit': limit})
+		account = getattr(account, 'id', account)
+		selected = []
+		for raw in self.raw_transactions:
+			created_at = as_timestamp(datetime.fromisoformat(raw['attributes']['createdAt']))
+			if since is not None and created_at < as_timestamp(since):
+				continue
+			if until is not None and created_at > as_timestamp(until):
+				continue
+			if account is not None and raw['relationships']['account']['data']['id'] != account:
+				continue
+			selected.append(raw)
+		selected.sort(key=lambda raw: raw['attributes']['createdAt'], reverse=True)
+		return [Transaction(self, raw) for raw in selected[:limit]]
+
+
+class FakeAsyncPages:
+	"""Iterates page by page like upbankapi's AsyncPaginatedList, where the first page has already arrived."""
+	def __init__(self, items, page_size, latency):
+		self.items = list(items)
+		self.page_size = page_size
+		self.latency = latency
+
+	async def __aiter__(self):
+		for offset in range(0, len(self.items), self.page_size):
+			if offset:
+				await asyncio.sleep(self.latency)
+			for item in self.items[offset:offset + self.page_size]:
+				yield item
+
+
+class FakeAsyncClient:
+	"""
+	Serves the payloads of a FakeClient through the AsyncClient protocol, waiting `latency`
+	seconds for every request, including each page after the first.
+	"""
+	def __init__(self, client, latency=0.0):
+		self.client = client
+		self.latency = latency
+
+	async def ping(self):
+		await asyncio.sleep(self.latency)
+		return self.client.ping()
+
+	async def accounts(self, *, limit=None):
+		await asyncio.sleep(self.latency)
+		return FakeAsyncPages(self.client.accounts(limit=limit), 100, self.latency)
+
+	async def categories(self):
+		await asyncio.sleep(self.latency)
+		return self.client.categories()
+
+	async def transactions(self, account=None, *, since=None, until=None, category=None, limit=None, page_size=50):
+		await asyncio.sleep(self.latency)
+		transactions = self.client.transactions(account, since=since, until=until, category=category, limit=limit, page_size=page_size)
+		return FakeAsyncPages(transactions, page_size, self.latency)
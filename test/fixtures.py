@@ -0,0 +1,77 @@
+"""
+Configs and transactions shared by the tests and benchmarks.
+"""
+from datetime import datetime, timedelta, timezone
+from typing import Iterable, List, Mapping
+
+from src.config import CollectionConfig, Config, TransactionType
+from src.interface import TransactionCollection
+from src.transaction import AccountType, GenericTransaction
+from test.fake import FakeClient, raw_account, raw_category, raw_transaction
+
+start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+def make_config(since : datetime = start, until : datetime = start + timedelta(days=30), up_api : dict = None,
+		ignore_accounts : Iterable[str] = (), categories : List[dict] = (), **options) -> Config:
+	"""
+	A Config resolved from the defaults as though read from a config file, without reading the
+	command line. Options are named as in the file, with underscores in place of hyphens.
+	"""
+	return Config(args=[], config={
+		'options': {
+			'dates': {'since': since, 'until': until},
+			'sources': {'up-api': {'limit': None, 'pagesize': 50, 'joint-account-funders': {'me': [], 'others': ['Partner']}, **(up_api or {})}},
+			**{name.replace('_', '-') : value for name, value in options.items()},
+		},
+		'ignore': {'accounts': list(ignore_accounts)},
+		'categories': list(categories),
+	})
+
+
+def collection_configs(ignore_accounts : Iterable[str] = ()) -> Mapping[TransactionType, CollectionConfig]:
+	"""The collections of the default config, ignoring transactions with the given descriptions."""
+	return make_config(ignore_accounts=ignore_accounts).collections
+
+
+def household_config(concurrency : int = 1, **options) -> Config:
+	return make_config(up_api={'concurrency': concurrency}, cover_window=None, **options)
+
+
+def transaction(id : str, days : int, description : str, amount : float, **kw) -> GenericTransaction:
+	return GenericTransaction(id=id, description=description, amount=amount, date=start + timedelta(days=days), **kw)
+
+
+def household() -> List[GenericTransaction]:
+	return [
+		transaction('1', 0, 'Employer', 2000.1, source=AccountType.PERSONAL, destination=AccountType.EXTERNAL),
+		transaction('2', 1, 'Rent', -900, category='Rent', parentCategory='Home', source=AccountType.JOINT, destination=AccountType.EXTERNAL),
+		transaction('3', 2, 'From me', 600, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+		transaction('4', 3, 'From partner', 400, source=AccountType.JOINT, destination=AccountType.PARTNER),
+		transaction('5', 4, 'Cafe', -4.5, category='Coffee', parentCategory='Food', source=AccountType.PERSONAL, destination=AccountType.EXTERNAL),
+		transaction('6', 5, 'Cafe', -5.2, category='Coffee', parentCategory='Food', source=AccountType.PERSONAL, destination=AccountType.EXTERNAL),
+	]
+
+
+def batch_output(transactions : Iterable[GenericTransaction], **options) -> str:
+	"""The output of the default pipeline, collecting every transaction before building the streams."""
+	collection = TransactionCollection(make_config(cover_window=None, **options))
+	collection.add_transactions(list(transactions))
+	return str(collection.as_streams())
+
+
+def household_client() -> FakeClient:
+	accounts = [raw_account('personal', 'Spending'), raw_account('joint', '2Up', ownership='JOINT')]
+	categories = [raw_category('home', 'Home', children=['rent']), raw_category('rent', 'Rent', parent='home'),
+		raw_category('food', 'Food', children=['coffee']), raw_category('coffee', 'Coffee', parent='food')]
+	transactions = []
+	for day in range(30):
+		date = start + timedelta(days=day)
+		transactions += [
+			raw_transaction('pay%d' % day, 'Employer', 100.1, date, 'personal'),
+			raw_transaction('coffee%d' % day, 'Cafe %d' % (day % 4), -4.5 - day / 10, date, 'personal', category='coffee', parent_category='food'),
+			raw_transaction('rent%d' % day, 'Rent', -30, date, 'joint', category='rent', parent_category='home'),
+			raw_transaction('fund%d' % day, 'Transfer from Spending', 20, date, 'joint', transfer_account='personal'),
+			raw_transaction('partner%d' % day, 'Partner', 10, date, 'joint', transfer_account='someone-else'),
+		]
+	return FakeClient(accounts, categories, transactions)
@@ -0,0 +1,34 @@
+import asyncio
+import time
+import unittest
+from src.aio import AsyncUpBankApiHelper, streams_from_async_up_api
+from src.interface import TransactionCollection
+from test.fake import FakeAsyncClient
+from test.fixtures import household_client, household_config
+
+
+class TestAsyncPipeline(unittest.TestCase):
+	def test_matches_sync(self):
+		serial = TransactionCollection(household_config())
+		serial.add_from_up_api(household_client())
+		expected = str(serial.as_streams())
+		for concurrency in [1, 3]:
+			streams = asyncio.run(streams_from_async_up_api(household_config(concurrency), FakeAsyncClient(household_client())))
+			self.assertEqual(str(streams), expected)
+
+	def test_requests_overlap(self):
+		latency = 0.1
+		config = household_config()
+		client = FakeAsyncClient(household_client(), latency)
+		started = time.perf_counter()
+		helper, transactions = asyncio.run(AsyncUpBankApiHelper.connect(client, config.up_api, config.since, config.until))
+		elapsed = time.perf_counter() - started
+
+		self.assertEqual(len(transactions), 150)
+		self.assertEqual(len(helper.accounts), 2)
+		# three pages of transactions take the longest, while one after another would take six requests
+		self.assertLess(elapsed, 4.5 * latency)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,129 @@
+import os
+import tempfile
+import unittest
+from upbankapi.models import Category, Transaction
+from src.categories import CategoryIndex
+from src.config import CategoryConfig, TransactionType
+from src.interface import UpBankApiHelper
+from src.state import StreamState
+from src.stream import StreamCollection
+from src.table import TransactionTable
+from src.transaction import GenericTransaction
+from test.fake import raw_category, raw_transaction
+from test.fixtures import collection_configs, household_client, household_config, start
+
+
+def categories():
+	raw = [raw_category('food', 'Food', children=['cafes']), raw_category('cafes', 'Cafes', parent='food', children=['coffee']),
+		raw_category('coffee', 'Coffee', parent='cafes'), raw_category('home', 'Home')]
+	return [Category(None, category) for category in raw]
+
+
+def configured(*categories):
+	return [CategoryConfig(category) for category in categories]
+
+
+def nested_transactions():
+	path = lambda *names: tuple(names)
+	return [GenericTransaction(description='Shop %d' % (i % 7), amount=-(i * 1.37 % 9 + 0.01), date=start,
+			categoryPath=[path('Food', 'Cafes', 'Coffee'), path('Food', 'Cafes', 'Tea'), path('Food', 'Groceries'), path('Home')][i % 4])
+		for i in range(40)] + [GenericTransaction(description='Payer', amount=500.5, date=start)]
+
+
+class TestCategoryIndex(unittest.TestCase):
+	def test_paths(self):
+		index = CategoryIndex(categories())
+		self.assertEqual(index.path('coffee'), ('Food', 'Cafes', 'Coffee'))
+		self.assertEqual(index.path('home'), ('Home',))
+		self.assertEqual(index.path(None), ())
+		self.assertEqual(index.paths, {'food': ('Food',), 'cafes': ('Food', 'Cafes'), 'coffee': ('Food', 'Cafes', 'Coffee'), 'home': ('Home',)})
+
+	def test_transaction_paths(self):
+		first = GenericTransaction(description='a', amount=-1, category='Coffee', parentCategory='Food')
+		second = GenericTransaction(description='b', amount=-1, categoryPath=('Food', 'Coffee'))
+		nested = GenericTransaction(description='c', amount=-1, categoryPath=CategoryIndex(categories()).path('coffee'))
+		self.assertIs(first.categoryPath, second.categoryPath)
+		self.assertEqual((nested.category, nested.parentCategory), ('Coffee', 'Cafes'))
+
+	def test_configured_categories(self):
+		index = CategoryIndex(categories(), configured(
+			{'name': 'Flat White', 'parent': 'Coffee', 'accounts': ['Bean Bar', '$Barista']},
+			{'name': 'Travel', 'tags': ['Holiday']},
+			{'name': 'Flights', 'parent': 'Travel', 'accounts': ['Qantas']}))
+		self.assertEqual(index.categorise('coffee', 'Bean Bar', []), ('Food', 'Cafes', 'Coffee', 'Flat White'))
+		self.assertEqual(index.categorise(None, 'Paid $Barista Jane', []), ('Food', 'Cafes', 'Coffee', 'Flat White'))
+		self.assertEqual(index.categorise('home', 'Qantas', []), ('Travel', 'Flights'))
+		self.assertEqual(index.categorise('coffee', 'Cafe', ['Holiday']), ('Travel',))
+		self.assertEqual(index.categorise('coffee', 'Cafe', []), ('Food', 'Cafes', 'Coffee'))
+
+	def test_configured_mistakes(self):
+		with self.assertRaises(ValueError):
+			CategoryIndex(categories(), configured({'name': 'Flat White', 'parent': 'Espresso'}))
+		with self.assertRaises(ValueError):
+			CategoryIndex(categories(), configured({'name': 'A', 'parent': 'B'}, {'name': 'B', 'parent': 'A'}))
+
+	def test_helper_uses_configured_categories(self):
+		helper = UpBankApiHelper(household_client(), household_config().up_api, configured_categories=configured({'name': 'Latte', 'parent': 'Coffee', 'tags': ['Latte']}))
+		convert = lambda **kw: helper.to_generic_transaction(Transaction(None,
+			raw_transaction('cafe', 'Cafe', -5, start, 'personal', category='coffee', parent_category='food', **kw)))
+		plain, tagged = convert(), convert(tags=['Latte'])
+		self.assertEqual(plain.categoryPath, ('Food', 'Coffee'))
+		self.assertEqual(tagged.categoryPath, ('Food', 'Coffee', 'Latte'))
+
+
+class TestNestedExpenses(unittest.TestCase):
+	def streams(self):
+		streams = StreamCollection(collection_configs())
+		streams.add_transactions(nested_transactions())
+		return streams.cleanup().link()
+
+	def test_levels_balance(self):
+		expenses = self.streams().collections[TransactionType.Expense]
+		self.assertEqual(set(expenses.groups), {('Food',), ('Food', 'Cafes')})
+		self.assertEqual(expenses.depth, 2)
+		for path, group in expenses.groups.items():
+			parents = expenses if len(path) == 1 else expenses.groups[path[:-1]]
+			self.assertEqual(group.total, parents[path[-1]].total)
+		self.assertIn('Cafes [', str(expenses))
+
+	def test_consolidated_category_folds_its_groups(self):
+		configs = collection_configs()
+		configs[TransactionType.Expense].threshold.count = 2
+		transactions = [GenericTransaction(description='Shop', amount=amount, date=start, categoryPath=path) for amount, path in [
+			(-50, ('A', 'A1', 'x')), (-40, ('A', 'A3', 'z')), (-3.2, ('A', 'A2', 'y')), (-2.1, ('A', 'A2', 'w'))]]
+		transactions.append(GenericTransaction(description='Payer', amount=500, date=start))
+		streams = StreamCollection(configs)
+		streams.add_transactions(transactions)
+		expenses = streams.cleanup().link().collections[TransactionType.Expense]
+		self.assertEqual(set(expenses.groups), {('A',), ('A', 'A1'), ('A', 'A3')})
+		self.assertIn('Other A', expenses.groups[('A',)])
+		# every category with streams out of it has a stream into it
+		sources = {source for section in streams.sections() for source, _, _ in (stream.flow for stream in section)}
+		targets = {target for section in streams.sections() for _, _, target in (stream.flow for stream in section)}
+		self.assertEqual(sources - targets, {'Payer'})
+
+	def test_partial_group_rounds_to_its_own_total(self):
+		transactions = [GenericTransaction(description='Cafe', amount=amount, date=start, categoryPath=path) for amount, path in [
+			(-9.4, ('Food', 'Coffee')), (-0.3, ('Food', 'Coffee', 'Latte')), (-0.3, ('Food', 'Coffee', 'Mocha')), (500, ())]]
+		streams = StreamCollection(collection_configs())
+		streams.add_transactions(transactions)
+		expenses = streams.cleanup().collections[TransactionType.Expense]
+		self.assertEqual(expenses.groups[('Food',)]['Coffee'].total, -10)
+		self.assertEqual(sorted(stream.total for stream in expenses.groups[('Food', 'Coffee')].values()), [-1, 0])
+
+	def test_state_and_table_match(self):
+		expected = str(self.streams())
+		state = StreamState(collection_configs())
+		state.apply(GenericTransaction(id=str(i), description=t.description, amount=t.amount, date=t.date, categoryPath=t.categoryPath)
+			for i, t in enumerate(nested_transactions()))
+		self.assertEqual(str(state.as_streams()), expected)
+		self.assertEqual(str(TransactionTable.from_transactions(nested_transactions()).as_streams(collection_configs())), expected)
+
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'state.json')
+			state.save(path)
+			self.assertEqual(str(StreamState.load(path, collection_configs()).as_streams()), expected)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from datetime import datetime, timedelta
+from src.interface import TransactionCollection
+from src.transaction import DisjointSet, GenericTransaction, AccountType
+from test.fixtures import make_config
+
+start = datetime(2022, 1, 1)
+
+
+def purchase(description, days, source=AccountType.PERSONAL):
+	return GenericTransaction(description=description, amount=-25, date=start + timedelta(days=days), source=source, destination=AccountType.EXTERNAL)
+
+
+def cover(days):
+	"""The two halves of a cover from the joint account to the personal account."""
+	date = start + timedelta(days=days)
+	return [
+		GenericTransaction(description='Cover from 2Up', amount=25, date=date, source=AccountType.PERSONAL, destination=AccountType.JOINT),
+		GenericTransaction(description='Cover to Spending', amount=-25, date=date, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+	]
+
+
+def collection(combine_covers=True):
+	return TransactionCollection(make_config(cover_window=7, combine_covers=combine_covers))
+
+
+class TestDisjointSet(unittest.TestCase):
+	def test_union(self):
+		sets = DisjointSet()
+		sets.union(1, 2)
+		sets.union(3, 4)
+		sets.union(2, 4)
+		self.assertEqual(len({sets.find(key) for key in [1, 2, 3, 4]}), 1)
+		self.assertEqual(sets.find(5), 5)
+
+
+class TestCoverCombiner(unittest.TestCase):
+	def test_combines_purchase_with_cover(self):
+		transactions = collection()
+		shop = purchase('shop', 0)
+		transactions.add_transactions([shop, *cover(1)])
+		self.assertEqual(transactions.transactions, [shop])
+		self.assertEqual(shop.source, AccountType.JOINT)
+
+	def test_disabled(self):
+		transactions = collection(combine_covers=False)
+		shop = purchase('shop', 0)
+		transactions.add_transactions([shop, *cover(1)])
+		self.assertEqual(len(transactions.transactions), 3)
+		self.assertEqual(shop.source, AccountType.PERSONAL)
+
+	def test_nearest_purchase_is_combined(self):
+		transactions = collection()
+		early, late = purchase('early', 0), purchase('late', 3)
+		transactions.add_transactions([early, late, *cover(4)])
+		self.assertEqual([t.source for t in transactions.transactions], [AccountType.PERSONAL, AccountType.JOINT])
+
+		# a second cover in a later batch takes the purchase that is left
+		transactions.add_transactions(cover(5))
+		self.assertEqual(transactions.transactions, [early, late])
+		self.assertEqual(early.source, AccountType.JOINT)
+
+	def test_cover_halves_paired_by_date(self):
+		transactions = collection()
+		first, second = cover(0), cover(2)
+		transactions.add_transactions([purchase('shop', 2), first[0], second[1], first[1], second[0]])
+		self.assertEqual(len(transactions.transactions), 3)
+		self.assertNotIn(second[0], transactions.transactions)
+		self.assertNotIn(second[1], transactions.transactions)
+
+	def test_joint_funding_excludes_covers(self):
+		transactions = collection()
+		funding = [
+			GenericTransaction(description='From me', amount=50, date=start, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+			GenericTransaction(description='From partner', amount=50, date=start, source=AccountType.JOINT, destination=AccountType.PARTNER),
+		]
+		shop = purchase('shop', 0)
+		transactions.add_transactions([*funding, shop, *cover(1)])
+		self.assertEqual(shop.split, 0.5)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,4 +1,7 @@
+import os
+import tempfile
 import unittest
+from unittest import mock
 from src.config import Config, CollectionConfig, ClassifierConfig, TransactionType
 from src.transaction import GenericTransaction, TransactionAliaser
 
@@ -38,6 +41,46 @@ class TestConfig(unittest.TestCase):
 		self.assertEqual(config.contains('tag2'), True)
 		self.assertEqual(config.contains('expected_missing_tag'), False)
 
+	def test_cached_config(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'config.yaml')
+			with open(path, 'w') as f:
+				f.write("collections:\n  savings:\n    classifiers:\n      accounts: [{$Savings: Savings}]\n")
+			cache = os.path.join(directory, 'cache')
+
+			config, collections, hit = Config._load(path, cache)
+			cached_config, cached_collections, cached_hit = Config._load(path, cache)
+			self.assertEqual((hit, cached_hit), (False, True))
+			self.assertEqual(cached_config, config)
+			self.assertEqual(repr(cached_collections), repr(collections))
+			transfer = GenericTransaction(description='Transfer to $Savings', amount=-10)
+			self.assertEqual(cached_collections.rules.match_account(transfer), TransactionType.Savings)
+			self.assertEqual(collections.rules.match_account(transfer), TransactionType.Savings)
+			self.assertTrue(cached_collections[TransactionType.Income].accounts.contains('Interest'))
+
+			# a corrupt entry is rebuilt rather than failing the run
+			entry, = os.listdir(cache)
+			with open(os.path.join(cache, entry), 'wb') as f:
+				f.write(b'corrupt')
+			_, _, hit = Config._load(path, cache)
+			self.assertFalse(hit)
+			_, _, hit = Config._load(path, cache)
+			self.assertTrue(hit)
+
+	def test_cache_keyed_on_source(self):
+		with tempfile.TemporaryDirectory() as directory:
+			path, source = os.path.join(directory, 'config.yaml'), os.path.join(directory, 'source.py')
+			for file in [path, source]:
+				with open(file, 'w') as f:
+					f.write("collections: {}\n")
+			cache = os.path.join(directory, 'cache')
+			with mock.patch('src.config.CACHE_SOURCES', [source]):
+				self.assertFalse(Config._load(path, cache)[2])
+				self.assertTrue(Config._load(path, cache)[2])
+				with open(source, 'a') as f:
+					f.write("# changed parsing\n")
+				self.assertFalse(Config._load(path, cache)[2])
+
 
 if __name__ == '__main__':
 	unittest.main()
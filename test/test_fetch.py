@@ -0,0 +1,76 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from upbankapi import RateLimitExceededException
+from src.fetch import ConcurrentFetcher
+from test.fake import FakeClient, raw_transaction
+
+start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+end = start + timedelta(days=100)
+
+
+class RateLimitedClient(FakeClient):
+	"""Fails the next `failures` requests, each after returning `after` transactions."""
+	def __init__(self, failures, after=0, **kw):
+		super().__init__(**kw)
+		self.failures = failures
+		self.after = after
+
+	def transactions(self, *args, **kw):
+		transactions = super().transactions(*args, **kw)
+		if self.failures > 0:
+			self.failures -= 1
+			yield from transactions[:self.after]
+			raise RateLimitExceededException({'status': '429'})
+		yield from transactions
+
+
+class TestConcurrentFetcher(unittest.TestCase):
+	def setUp(self):
+		self.client = FakeClient(transactions=[
+			raw_transaction('t%d' % day, 'purchase', -day, start + timedelta(days=day), 'personal') for day in range(101)])
+
+	def test_shards_cover_window(self):
+		shards = ConcurrentFetcher.shards(start, end, 4)
+		self.assertEqual(len(shards), 4)
+		self.assertEqual(shards[0][0], start)
+		self.assertEqual(shards[-1][1], end)
+		self.assertTrue(all(a[1] == b[0] for a, b in zip(shards, shards[1:])))
+
+	def test_matches_serial_fetch(self):
+		expected = [t.id for t in self.client.transactions(since=start, until=end)]
+		actual = ConcurrentFetcher(self.client, concurrency=4).transactions(since=start, until=end)
+		self.assertEqual([t.id for t in actual], expected)
+		self.assertEqual(len(self.client.requests), 5)
+
+	def test_limit_keeps_newest(self):
+		actual = ConcurrentFetcher(self.client, concurrency=4).transactions(since=start, until=end, limit=3)
+		self.assertEqual([t.id for t in actual], ['t100', 't99', 't98'])
+		self.assertEqual([request['limit'] for request in self.client.requests], [3])
+
+	def test_backs_off_on_rate_limit(self):
+		client = RateLimitedClient(failures=2, transactions=self.client.raw_transactions)
+		fetcher = ConcurrentFetcher(client, concurrency=2, backoff=0)
+		self.assertEqual(len(fetcher.transactions(since=start, until=end)), 101)
+
+		client.failures = 10
+		with self.assertRaises(RateLimitExceededException):
+			ConcurrentFetcher(client, concurrency=2, retries=1, backoff=0).transactions(since=start, until=end)
+
+	def test_serial_resumes_on_rate_limit(self):
+		expected = [t.id for t in self.client.transactions(since=start, until=end)]
+		client = RateLimitedClient(failures=2, after=30, transactions=self.client.raw_transactions)
+		actual = ConcurrentFetcher(client, concurrency=1, backoff=0).transactions(since=start, until=end)
+		self.assertEqual([t.id for t in actual], expected)
+		self.assertEqual([request['until'] for request in client.requests], [end, start + timedelta(days=71), start + timedelta(days=42)])
+
+		client.failures = 2
+		actual = ConcurrentFetcher(client, concurrency=4, backoff=0).transactions(since=start, until=end, limit=40)
+		self.assertEqual([t.id for t in actual], expected[:40])
+
+		client.failures = 10
+		with self.assertRaises(RateLimitExceededException):
+			list(ConcurrentFetcher(client, concurrency=1, retries=1, backoff=0).transactions(since=start, until=end))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,126 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta
+from itertools import combinations
+from src.interface import TransactionCollection
+from src.transaction import GenericTransaction, AccountType
+from test.fixtures import household_client, household_config, make_config
+
+
+def relation_graph(transactions):
+	return {(i, j) for (i, t1), (j, t2) in combinations(enumerate(transactions), 2) if t2 in t1.connections}
+
+
+def sample_transactions():
+	date = datetime(2022, 1, 1)
+	return [
+		GenericTransaction(description='transfer', amount=-10, date=date, source=AccountType.PERSONAL, destination=AccountType.JOINT),
+		GenericTransaction(description='transfer', amount=10, date=date, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+		GenericTransaction(description='transfer', amount=10, currency='USD', date=date, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+		GenericTransaction(description='Cover from Savings', amount=25, date=date + timedelta(days=1)),
+		GenericTransaction(description='shop', amount=-25, currency='USD', date=date),
+		GenericTransaction(description='shop', amount=-25, date=date),
+		GenericTransaction(description='unrelated', amount=-7, date=date),
+	]
+
+
+class TestTransactionCollection(unittest.TestCase):
+	def test_relations_match_all_pairs(self):
+		expected = sample_transactions()
+		for t1, t2 in combinations(expected, 2):
+			if t1.relates_to(t2):
+				t1.connect(t2)
+
+		transactions = sample_transactions()
+		collection = TransactionCollection(household_config())
+		collection._update_relations(transactions[:3])
+		collection._update_relations(transactions[3:])
+		self.assertEqual(relation_graph(transactions), relation_graph(expected))
+		self.assertEqual(relation_graph(transactions), {(0, 1), (3, 4), (3, 5)})
+
+
+	def test_cover_window(self):
+		date = datetime(2022, 1, 1)
+		transactions = lambda: [
+			GenericTransaction(description='Cover from Savings', amount=10, date=date),
+			GenericTransaction(description='lunch', amount=-10, date=date - timedelta(days=2), source=AccountType.PERSONAL, destination=AccountType.EXTERNAL),
+			GenericTransaction(description='lunch', amount=-10, date=date - timedelta(days=60), source=AccountType.PERSONAL, destination=AccountType.EXTERNAL),
+		]
+		unbounded = TransactionCollection(household_config())
+		unbounded_transactions = transactions()
+		unbounded._update_relations(unbounded_transactions)
+		self.assertEqual(relation_graph(unbounded_transactions), {(0, 1), (0, 2)})
+
+		windowed = TransactionCollection(make_config(cover_window=7))
+		windowed_transactions = transactions()
+		windowed._update_relations(windowed_transactions)
+		self.assertEqual(relation_graph(windowed_transactions), {(0, 1)})
+
+	def test_cover_window_only_limits_covers(self):
+		date = datetime(2022, 1, 1)
+		window = timedelta(days=7)
+		transactions = lambda: [
+			GenericTransaction(description='Cover to 2Up', amount=-10, date=date, source=AccountType.PERSONAL, destination=AccountType.JOINT),
+			GenericTransaction(description='Cover from Spending', amount=10, date=date + timedelta(days=30), source=AccountType.JOINT, destination=AccountType.PERSONAL),
+			GenericTransaction(description='transfer', amount=10, date=date - timedelta(days=30), source=AccountType.JOINT, destination=AccountType.PERSONAL),
+			GenericTransaction(description='lunch', amount=-10, date=date + timedelta(days=2)),
+		]
+		expected = transactions()
+		for t1, t2 in combinations(expected, 2):
+			if t1.relates_to(t2, window):
+				t1.connect(t2)
+
+		indexed = transactions()
+		TransactionCollection(make_config(cover_window=window.days))._update_relations(indexed)
+		self.assertEqual(relation_graph(indexed), relation_graph(expected))
+		self.assertEqual(relation_graph(indexed), {(0, 1), (0, 2), (0, 3)})
+
+	def test_stream_matches_batch(self):
+		def household():
+			date = datetime(2022, 1, 1)
+			return [
+				GenericTransaction(description='Employer', amount=2000, date=date, source=AccountType.PERSONAL, destination=AccountType.EXTERNAL),
+				GenericTransaction(description='Rent', amount=-900, date=date, category='Rent', parentCategory='Home', source=AccountType.JOINT, destination=AccountType.EXTERNAL),
+				GenericTransaction(description='To joint', amount=-600, date=date, source=AccountType.PERSONAL, destination=AccountType.JOINT),
+				GenericTransaction(description='From me', amount=600, date=date, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+				GenericTransaction(description='From partner', amount=400, date=date, source=AccountType.JOINT, destination=AccountType.PARTNER),
+				GenericTransaction(description='Cafe', amount=-4.5, date=date, category='Coffee', parentCategory='Food', source=AccountType.PERSONAL, destination=AccountType.EXTERNAL),
+				GenericTransaction(description='Groceries', amount=-120.3, date=date, category='Groceries', parentCategory='Food', source=AccountType.JOINT, destination=AccountType.EXTERNAL),
+			]
+
+		batch = TransactionCollection(household_config())
+		batch.add_transactions(household())
+		expected = str(batch.as_streams())
+
+		streaming = TransactionCollection(household_config())
+		actual = str(streaming.stream_transactions(iter(household())))
+		self.assertEqual(actual, expected)
+		self.assertIn('Home [540] Rent', actual)
+		self.assertEqual(streaming.transactions, [])
+		self.assertEqual(sum(len(expenses) for expenses in streaming.ledger.expenses.values()), 2)
+
+	def test_incremental_rerun_with_timezone(self):
+		config = household_config()
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'state.json')
+			first = str(TransactionCollection(config).update_from_up_api(household_client(), path))
+			client = household_client()
+			second = str(TransactionCollection(config).update_from_up_api(client, path))
+		self.assertEqual(second, first)
+		self.assertEqual(client.requests[0]['since'], config.until - timedelta(days=7))
+
+	def test_rerun_retracts_missing_transactions(self):
+		config = household_config()
+		client = household_client()
+		client.raw_transactions = [raw for raw in client.raw_transactions if raw['id'] != 'coffee28']
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'state.json')
+			TransactionCollection(config).update_from_up_api(household_client(), path)
+			rerun = str(TransactionCollection(config).update_from_up_api(client, path))
+			fresh = str(TransactionCollection(config).update_from_up_api(client, os.path.join(directory, 'fresh.json')))
+		self.assertEqual(rerun, fresh)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,87 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from src.ledger import FundingLedger, bucket_of
+from src.state import StreamState
+from src.transaction import AccountType
+from test.fixtures import batch_output, collection_configs, start, transaction
+
+
+def months():
+	return [
+		transaction('1', 0, 'From me', 300, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+		transaction('2', 1, 'From partner', 100, source=AccountType.JOINT, destination=AccountType.PARTNER),
+		transaction('3', 2, 'Rent', -400, category='Rent', parentCategory='Home', source=AccountType.JOINT, destination=AccountType.EXTERNAL),
+		transaction('4', 32, 'From me', 100, source=AccountType.JOINT, destination=AccountType.PERSONAL),
+		transaction('5', 33, 'From partner', 300, source=AccountType.JOINT, destination=AccountType.PARTNER),
+		transaction('6', 34, 'Rent', -200, category='Rent', parentCategory='Home', source=AccountType.JOINT, destination=AccountType.EXTERNAL),
+	]
+
+
+class TestFundingLedger(unittest.TestCase):
+	def test_buckets(self):
+		self.assertEqual(bucket_of(start, 'window'), '')
+		self.assertEqual(bucket_of(start, 'month'), '2022-01')
+		# 1/1/2022 is a Saturday, in the fortnight starting on Monday 20/12/2021
+		self.assertEqual(bucket_of(start, 'fortnight'), '2021-12-20')
+		self.assertEqual(bucket_of(start + timedelta(days=1), 'fortnight'), '2021-12-20')
+		self.assertEqual(bucket_of(start + timedelta(days=2), 'fortnight'), '2022-01-03')
+		with self.assertRaises(ValueError):
+			FundingLedger('week')
+
+	def test_split_by_month(self):
+		transactions = months()
+		ledger = FundingLedger('month')
+		ledger.add(transactions)
+		self.assertEqual(ledger.apply(), 2)
+		self.assertEqual([transactions[2].split, transactions[5].split], [0.75, 0.25])
+
+	def test_split_by_window(self):
+		transactions = months()
+		ledger = FundingLedger()
+		ledger.add(transactions)
+		ledger.apply()
+		self.assertEqual([transactions[2].split, transactions[5].split], [0.5, 0.5])
+
+	def test_only_touched_buckets_are_updated(self):
+		transactions = months()
+		ledger = FundingLedger('month')
+		ledger.add(transactions[:3])
+		self.assertEqual(ledger.apply(), 1)
+		self.assertEqual(transactions[2].split, 0.75)
+		ledger.add(transactions[3:])
+		self.assertEqual(ledger.apply(), 1)
+		self.assertEqual(transactions[2].split, 0.75)
+		self.assertEqual(transactions[5].split, 0.25)
+		self.assertEqual(ledger.apply(), 0)
+
+	def test_one_funder(self):
+		transactions = months()[:1] + months()[2:3]
+		ledger = FundingLedger('month')
+		ledger.add(transactions)
+		ledger.apply()
+		self.assertEqual(transactions[1].split, 1.0)
+
+	def test_state_matches_batch(self):
+		for joint_split in ['window', 'month', 'fortnight']:
+			state = StreamState(collection_configs(), joint_split=joint_split)
+			state.apply(months())
+			self.assertEqual(str(state.as_streams()), batch_output(months(), joint_split=joint_split))
+		self.assertNotEqual(batch_output(months(), joint_split='window'), batch_output(months(), joint_split='month'))
+
+	def test_state_saved_with_other_split_is_rebuilt(self):
+		state = StreamState(collection_configs(), joint_split='month')
+		state.apply(months())
+		state.until = start.timestamp()
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'state.json')
+			state.save(path)
+			self.assertEqual(len(StreamState.load(path, collection_configs(), 'month')), 6)
+			with self.assertLogs(level='WARNING'):
+				rebuilt = StreamState.load(path, collection_configs(), 'window')
+		self.assertEqual((len(rebuilt), rebuilt.until), (0, None))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,27 @@
+import unittest
+from datetime import timedelta
+from src.interface import UpBankApiHelper
+from src.parallel import ParallelAggregator
+from src.state import StreamState
+from test.fixtures import collection_configs, household_client, household_config, start
+
+
+class TestParallelAggregator(unittest.TestCase):
+	def test_matches_serial(self):
+		client = household_client()
+		config = household_config().up_api
+		helper = UpBankApiHelper(client, config)
+		since, until = start, start + timedelta(days=30)
+
+		serial = StreamState(collection_configs())
+		serial.apply(helper.iter_transactions(since, until))
+
+		aggregator = ParallelAggregator(helper.accounts.values(), helper.categories.values(), config, collection_configs(), workers=2, chunk_size=7)
+		parallel = aggregator.aggregate(t._raw_response for t in helper.up_transactions(since, until))
+		self.assertEqual(parallel.streams, serial.streams)
+		self.assertEqual(parallel.funding, serial.funding)
+		self.assertEqual(str(parallel.as_streams()), str(serial.as_streams()))
+
+
+if __name__ == '__main__':
+	unittest.main()
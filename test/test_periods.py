@@ -0,0 +1,50 @@
+import unittest
+from datetime import datetime, timedelta, timezone
+from src.config import PeriodConfig
+from src.periods import PeriodBuckets
+from src.state import StreamState
+from test.fixtures import collection_configs, household, start
+
+
+class TestPeriodConfig(unittest.TestCase):
+	def test_rolling_monthly(self):
+		periods = PeriodConfig.rolling('monthly', 3, datetime(2022, 2, 15))
+		self.assertEqual([p.name for p in periods], ['2021-12', '2022-01', '2022-02'])
+		self.assertEqual(periods[0].since, datetime(2021, 12, 1))
+		self.assertEqual(periods[0].until, datetime(2022, 1, 1))
+		self.assertEqual(periods[-1].until, datetime(2022, 2, 15))
+
+	def test_rolling_quarterly(self):
+		periods = PeriodConfig.rolling('quarterly', 2, datetime(2022, 5, 3))
+		self.assertEqual([p.name for p in periods], ['2022-Q1', '2022-Q2'])
+		self.assertEqual(periods[1].since, datetime(2022, 4, 1))
+
+	def test_rolling_with_timezone(self):
+		until = datetime(2022, 2, 15, tzinfo=timezone.utc)
+		periods = PeriodConfig.rolling('monthly', 2, until)
+		self.assertEqual(periods[0].since, datetime(2022, 1, 1, tzinfo=timezone.utc))
+		self.assertEqual(periods[-1].until, until)
+
+
+
+class TestPeriodBuckets(unittest.TestCase):
+	def test_periods_match_single_runs(self):
+		day = lambda days: start + timedelta(days=days)
+		periods = [
+			PeriodConfig('all', day(0), day(10)),
+			PeriodConfig('early', day(0), day(3)),
+			PeriodConfig('late', day(2), day(6)),
+		]
+		buckets = PeriodBuckets(collection_configs(), periods)
+		buckets.add_transactions(household())
+		self.assertEqual(len(buckets.buckets), 4)
+		streams = buckets.as_streams()
+
+		for period in periods:
+			state = StreamState(collection_configs())
+			state.apply(t for t in household() if period.since <= t.date < period.until)
+			self.assertEqual(str(streams[period.name]), str(state.as_streams()), period.name)
+
+
+if __name__ == '__main__':
+	unittest.main()
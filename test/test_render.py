@@ -0,0 +1,62 @@
+import csv
+import io
+import json
+import os
+import tempfile
+import unittest
+from src.interface import TransactionCollection
+from src.render import CsvRenderer, JsonRenderer, PlotlyRenderer, SankeyMaticRenderer, render_to_files, renderers
+from test.fixtures import household, household_config
+
+
+def streams():
+	collection = TransactionCollection(household_config())
+	collection.add_transactions(household())
+	return collection.as_streams()
+
+
+def render(renderer, streams):
+	f = io.StringIO()
+	renderer.render(streams, f)
+	return f.getvalue()
+
+
+def lines(streams):
+	return [line for line in str(streams).split('\n') if line]
+
+
+class TestRenderers(unittest.TestCase):
+	def test_sankeymatic_matches_str(self):
+		self.assertEqual(render(SankeyMaticRenderer(), streams()), str(streams()) + '\n')
+
+	def test_json(self):
+		graph = json.loads(render(JsonRenderer(), streams()))
+		names = [node['name'] for node in graph['nodes']]
+		rendered = ["%s [%d] %s" % (names[link['source']], link['value'], names[link['target']]) for link in graph['links']]
+		self.assertEqual(rendered, lines(streams()))
+
+	def test_csv(self):
+		rows = list(csv.reader(io.StringIO(render(CsvRenderer(), streams()))))
+		self.assertEqual(rows[0], ['source', 'target', 'value'])
+		self.assertEqual(["%s [%s] %s" % (source, value, target) for source, target, value in rows[1:]], lines(streams()))
+
+	def test_plotly(self):
+		trace = json.loads(render(PlotlyRenderer(), streams()))['data'][0]
+		labels, link = trace['node']['label'], trace['link']
+		rendered = ["%s [%d] %s" % (labels[s], v, labels[t]) for s, t, v in zip(link['source'], link['target'], link['value'])]
+		self.assertEqual(trace['type'], 'sankey')
+		self.assertEqual(rendered, lines(streams()))
+
+	def test_render_to_files(self):
+		with tempfile.TemporaryDirectory() as directory:
+			output = os.path.join(directory, 'results.txt')
+			paths = render_to_files(streams(), output, ['sankeymatic', 'json', 'csv', 'plotly'])
+			self.assertEqual([os.path.basename(path) for path in paths], ['results.txt', 'results.json', 'results.csv', 'results.plotly.json'])
+			with open(output) as f:
+				self.assertEqual(f.read(), str(streams()) + '\n')
+		with self.assertRaises(ValueError):
+			renderers(['sankeymatic', 'svg'])
+
+
+if __name__ == '__main__':
+	unittest.main()
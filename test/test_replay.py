@@ -0,0 +1,57 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from src.interface import TransactionCollection
+from src.replay import ReplayClient, RecordingClient, read_fixture
+from test.fake import PING_ID
+from test.fixtures import household_client, household_config, start
+
+
+class TestReplay(unittest.TestCase):
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.path = os.path.join(directory.name, 'fixture.gz')
+
+	def record(self, client, concurrency=1):
+		with RecordingClient(client, self.path) as recording:
+			collection = TransactionCollection(household_config(concurrency))
+			collection.add_from_up_api(recording)
+		return str(collection.as_streams())
+
+	def test_replay_matches_recording(self):
+		for concurrency in [1, 3]:
+			expected = self.record(household_client(), concurrency)
+			collection = TransactionCollection(household_config(concurrency))
+			collection.add_from_up_api(ReplayClient(self.path))
+			self.assertEqual(str(collection.as_streams()), expected)
+
+	def test_transactions_recorded_once(self):
+		client = household_client()
+		with RecordingClient(client, self.path) as recording:
+			list(recording.transactions(until=start + timedelta(days=10)))
+			list(recording.transactions(since=start + timedelta(days=5)))
+		kinds = [kind for kind, _, _ in read_fixture(self.path)]
+		self.assertEqual(kinds.count('ping'), 1)
+		self.assertEqual(kinds.count('transaction'), len(client.raw_transactions))
+
+	def test_filters_like_api(self):
+		client = household_client()
+		self.record(client)
+		replay = ReplayClient(self.path)
+		self.assertEqual(replay.ping(), PING_ID)
+		self.assertEqual([a.id for a in replay.accounts()], [a.id for a in client.accounts()])
+		self.assertEqual([c.name for c in replay.categories()], [c.name for c in client.categories()])
+
+		since, until = start + timedelta(days=3), start + timedelta(days=5)
+		for account in [None, 'joint']:
+			expected = {t.id for t in client.transactions(account, since=since, until=until)}
+			actual = [t.id for t in replay.transactions(account, since=since, until=until)]
+			self.assertEqual(len(actual), len(expected))
+			self.assertEqual(set(actual), expected)
+		self.assertEqual(len(list(replay.transactions(limit=4))), 4)
+
+
+if __name__ == '__main__':
+	unittest.main()
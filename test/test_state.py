@@ -0,0 +1,55 @@
+import os
+import tempfile
+import unittest
+from datetime import timedelta
+from src.state import StreamState
+from test.fixtures import batch_output, collection_configs, household, household_config, start
+
+
+class TestStreamState(unittest.TestCase):
+	def test_matches_batch(self):
+		state = StreamState(collection_configs())
+		state.apply(household())
+		self.assertEqual(str(state.as_streams()), batch_output(household()))
+
+	def test_changed_transaction_replaces_previous(self):
+		state = StreamState(collection_configs())
+		state.apply(household())
+		changed = household()[5]
+		changed.amount = -15.2
+		state.apply([changed])
+		self.assertEqual(len(state), 6)
+		self.assertEqual(str(state.as_streams()), batch_output(household()[:5] + [changed]))
+
+	def test_retract_before(self):
+		state = StreamState(collection_configs())
+		state.apply(household())
+		self.assertEqual(state.retract_before(start + timedelta(days=2)), 2)
+		self.assertEqual(str(state.as_streams()), batch_output(household()[2:]))
+
+	def test_save_and_load(self):
+		state = StreamState(collection_configs())
+		state.apply(household()[:3])
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'state.json')
+			state.save(path)
+			state = StreamState.load(path, collection_configs())
+		state.apply(household()[3:])
+		self.assertEqual(str(state.as_streams()), batch_output(household()))
+
+	def test_saved_with_other_config_is_rebuilt(self):
+		state = StreamState(collection_configs(), digest=household_config().collections_digest)
+		state.apply(household())
+		with tempfile.TemporaryDirectory() as directory:
+			path = os.path.join(directory, 'state.json')
+			state.save(path)
+			self.assertEqual(len(StreamState.load(path, collection_configs(), digest=household_config().collections_digest)), 6)
+			other = household_config(ignore_accounts=['Cafe'])
+			self.assertNotEqual(other.collections_digest, household_config().collections_digest)
+			with self.assertLogs(level='WARNING'):
+				rebuilt = StreamState.load(path, other.collections, digest=other.collections_digest)
+		self.assertEqual(len(rebuilt), 0)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,60 @@
+import os
+import tempfile
+import unittest
+from datetime import datetime, timedelta, timezone
+from src.store import TransactionStore
+from test.fake import FakeClient, raw_transaction
+
+start = datetime(2022, 1, 1, tzinfo=timezone.utc)
+
+
+def daily_transactions(days):
+	return [raw_transaction('t%d' % day, 'purchase %d' % day, -day, start + timedelta(days=day), 'personal') for day in range(days)]
+
+
+class TestTransactionStore(unittest.TestCase):
+	def setUp(self):
+		directory = tempfile.TemporaryDirectory()
+		self.addCleanup(directory.cleanup)
+		self.store = TransactionStore(os.path.join(directory.name, 'store.db'), overlap=timedelta(days=2))
+		self.addCleanup(self.store.close)
+
+	def test_sync_downloads_window(self):
+		client = FakeClient(transactions=daily_transactions(10))
+		self.assertEqual(self.store.sync(client, start, start + timedelta(days=9), page_size=50), 10)
+		transactions = self.store.transactions(start, start + timedelta(days=9))
+		self.assertEqual([t.id for t in transactions], ['t%d' % day for day in reversed(range(10))])
+		self.assertEqual(transactions[0].amount, -9)
+
+	def test_sync_only_fetches_new_transactions(self):
+		client = FakeClient(transactions=daily_transactions(10))
+		self.store.sync(client, start, start + timedelta(days=5), page_size=50)
+		self.store.sync(client, start, start + timedelta(days=9), page_size=50)
+		self.assertEqual(client.requests[-1]['since'].timestamp(), (start + timedelta(days=3)).timestamp())
+		self.assertEqual(len(self.store), 10)
+
+		self.assertEqual(self.store.sync(client, start, start + timedelta(days=8), page_size=50), 0)
+		self.assertEqual(len(client.requests), 2)
+
+	def test_sync_updates_changed_transactions(self):
+		client = FakeClient(transactions=[raw_transaction('t0', 'held', -5, start, 'personal', status='HELD')])
+		self.store.sync(client, start, start + timedelta(days=1), page_size=50)
+		client.raw_transactions = [raw_transaction('t0', 'settled', -5, start, 'personal')]
+		self.store.sync(client, start, start + timedelta(days=2), page_size=50)
+		self.assertEqual([t.description for t in self.store.transactions(start, start + timedelta(days=2))], ['settled'])
+
+	def test_sync_removes_reversed_transactions(self):
+		client = FakeClient(transactions=[raw_transaction('t0', 'old', -3, start, 'personal'),
+			raw_transaction('t1', 'held', -5, start + timedelta(days=3), 'personal', status='HELD')])
+		self.store.sync(client, start, start + timedelta(days=4), page_size=50)
+		client.raw_transactions = client.raw_transactions[:1]
+		self.store.sync(client, start, start + timedelta(days=5), page_size=50)
+		self.assertEqual([t.id for t in self.store.transactions(start, start + timedelta(days=5))], ['t0'])
+
+	def test_transactions_limit(self):
+		self.store.sync(FakeClient(transactions=daily_transactions(10)), start, start + timedelta(days=9), page_size=50)
+		self.assertEqual([t.id for t in self.store.transactions(start, start + timedelta(days=9), limit=2)], ['t9', 't8'])
+
+
+if __name__ == '__main__':
+	unittest.main()
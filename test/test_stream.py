@@ -0,0 +1,77 @@
+import unittest
+from src.config import CollectionConfig, TransactionType
+from src.stream import Stream, StreamCollection, Streams, largest_remainder
+from src.transaction import GenericTransaction
+from test.fixtures import collection_configs
+
+defaultCollection = {
+	'name' : 'Name',
+	'outgoing' : False,
+	'classifiers' : {'tags': [], 'accounts': []},
+	'threshold' : {'count': 10, 'value': 0, 'percentage': 0}
+}
+
+
+class TestStream(unittest.TestCase):
+	def test_total_is_maintained(self):
+		stream = Stream('source', 'target')
+		stream.append(GenericTransaction(description='a', amount=10.4))
+		stream.append_all([GenericTransaction(description='b', amount=0.3), GenericTransaction(description='c', amount=-0.1)])
+		self.assertAlmostEqual(stream.raw_total, 10.6)
+		self.assertEqual(stream.total, 11)
+		stream.rounded = 10
+		self.assertEqual(stream.total, 10)
+		stream.append(GenericTransaction(description='d', amount=1))
+		self.assertEqual(stream.total, 12)
+
+	def test_rename_merges_totals(self):
+		streams = Streams(CollectionConfig(defaultCollection))
+		streams.insert(GenericTransaction(description='a', amount=5))
+		streams.insert(GenericTransaction(description='b', amount=7))
+		streams.rename(streams['a'], 'b')
+		self.assertEqual(list(streams), ['b'])
+		self.assertEqual(streams['b'].raw_total, 12)
+		self.assertEqual(len(streams['b'].transactions), 2)
+
+	def test_consolidate_by_count(self):
+		streams = Streams(CollectionConfig(defaultCollection))
+		for description, amount in [('a', 1), ('b', 5), ('c', 1), ('d', 3), ('e', 2)]:
+			streams.insert(GenericTransaction(description=description, amount=amount))
+		streams.consolidate_by_count(4)  # ties consolidate the earliest stream first
+		self.assertEqual(list(streams), ['b', 'c', 'd', 'e', 'Other Name'])
+		streams.consolidate_by_count(3)
+		self.assertEqual(list(streams), ['b', 'd', 'Other Name'])
+		self.assertEqual(streams['Other Name'].raw_total, 4)
+		self.assertEqual([t.description for t in streams['Other Name'].transactions], ['a', 'c', 'e'])
+		self.assertTrue(streams['Other Name'].isOther)
+
+	def test_consolidate_by_count_merges_smallest_first(self):
+		streams = Streams(CollectionConfig(defaultCollection))
+		for description, amount in [('a', 3.3), ('b', 100), ('c', 1.1), ('d', 2.2)]:
+			streams.insert(GenericTransaction(description=description, amount=amount))
+		streams.consolidate_by_count(1)
+		self.assertEqual([t.description for t in streams['Other Name'].transactions], ['c', 'd', 'a'])
+		self.assertEqual(streams['Other Name'].raw_total, 1.1 + 2.2 + 3.3)
+
+	def test_largest_remainder(self):
+		self.assertEqual(largest_remainder([10.4, 10.3, 10.3], [0, 0, 0], [31]), [11, 10, 10])
+		self.assertEqual(largest_remainder([-10.4, -10.3, -10.3], [0, 0, 0], [-31]), [-11, -10, -10])
+		self.assertEqual(largest_remainder([1.5, 2.5, 0.2, 0.9], [0, 0, 1, 1], [4, 1]), [2, 2, 0, 1])
+
+	def test_rounded_hierarchy_balances(self):
+		streams = StreamCollection(collection_configs())
+		for i in range(40):
+			streams.add_transaction(GenericTransaction(description='Shop %d' % (i % 7), amount=-(i * 1.37 % 9 + 0.01),
+				category='Child %d' % (i % 5), parentCategory='Parent %d' % (i % 3)))
+			streams.add_transaction(GenericTransaction(description='Payer %d' % (i % 4), amount=i * 2.11 % 13 + 0.5))
+		streams.cleanup()
+
+		for collection in streams.collections.values():
+			self.assertEqual(collection.total, round(collection.raw_total))
+		expenses = streams.collections[TransactionType.Expense]
+		for path, group in expenses.groups.items():
+			self.assertEqual(group.total, expenses[path[0]].total)
+
+
+if __name__ == '__main__':
+	unittest.main()
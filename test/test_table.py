@@ -0,0 +1,52 @@
+import copy
+import unittest
+from src.config import CollectionConfig, IgnoreConfig, TransactionType, defaultConfig
+from src.stream import StreamCollection
+from src.table import TransactionTable
+from src.transaction import GenericTransaction, AccountType
+
+
+def collection_configs():
+	config = copy.deepcopy(defaultConfig)
+	config['collections']['expenses']['threshold'] = {'count': 2, 'value': 0, 'percentage': 0}
+	configs = {TransactionType.Ignore : IgnoreConfig({'tags': ['skip'], 'accounts': []})}
+	for name, c in config['collections'].items():
+		configs[TransactionType(name)] = CollectionConfig(c)
+	return configs
+
+
+def sample_transactions():
+	return [
+		GenericTransaction(description='Employer', amount=1000.25),
+		GenericTransaction(description='Cafe', amount=-4.5, category='Coffee', parentCategory='Food'),
+		GenericTransaction(description='Grocer', amount=-80.3, category='Groceries', parentCategory='Food'),
+		GenericTransaction(description='Cafe', amount=-5.5, category='Coffee', parentCategory='Food'),
+		GenericTransaction(description='Bus', amount=-3.2, category='Public Transport', parentCategory='Transport'),
+		GenericTransaction(description='Taxi', amount=-30.1, category='Taxis', parentCategory='Transport'),
+		GenericTransaction(description='Fuel', amount=-60.9, category='Fuel', parentCategory='Transport'),
+		GenericTransaction(description='Employer', amount=1000.25),
+		GenericTransaction(description='Refund', amount=12.4, tags=['skip']),
+		GenericTransaction(description='Transfer', amount=-50, source=AccountType.PERSONAL, destination=AccountType.PERSONAL),
+		GenericTransaction(description='Unknown', amount=-1),
+	]
+
+
+class TestTransactionTable(unittest.TestCase):
+	def test_columns(self):
+		table = TransactionTable.from_transactions(sample_transactions())
+		self.assertEqual(len(table), 11)
+		self.assertEqual(table.description_values[table.descriptions[3]], 'Cafe')
+		self.assertEqual(table.descriptions[1], table.descriptions[3])
+		self.assertEqual(table.totals[9], 0)
+
+	def test_streams_match_transactions(self):
+		streams = StreamCollection(collection_configs())
+		streams.add_transactions(sample_transactions())
+		expected = str(streams.cleanup().link())
+
+		table = TransactionTable.from_transactions(sample_transactions())
+		self.assertEqual(str(table.as_streams(collection_configs())), expected)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,55 @@
+import json
+import os
+import tempfile
+import unittest
+from src.interface import TransactionCollection
+from src.timings import Timings, timings
+from test.fixtures import household_client, household_config
+
+
+class TestTimings(unittest.TestCase):
+	def test_disabled_is_passthrough(self):
+		disabled = Timings()
+		items = [1, 2, 3]
+		self.assertIs(disabled.timed('stage', items), items)
+		with disabled.span('stage'):
+			disabled.count('counter')
+		self.assertEqual(disabled.as_dict(), {'spans': {}, 'counters': {}})
+
+	def test_nested_self_time(self):
+		enabled = Timings(enabled=True)
+		with enabled.span('outer'):
+			self.assertEqual(list(enabled.timed('inner', range(3), counter='items')), [0, 1, 2])
+		calls, total, own = enabled.spans['outer']
+		inner_total = enabled.spans['inner'][1]
+		self.assertEqual(calls, 1)
+		self.assertAlmostEqual(own, total - inner_total)
+		self.assertEqual(enabled.spans['inner'][0], 4)  # one more step to find the end
+		self.assertEqual(enabled.counters, {'items': 3})
+
+	def test_pipeline_stages(self):
+		timings.enabled = True
+		try:
+			collection = TransactionCollection(household_config())
+			collection.add_from_up_api(household_client())
+			collection.as_streams()
+
+			self.assertEqual(timings.counters['transactions converted'], 150)
+			self.assertEqual(timings.counters['pages fetched'], 3)
+			self.assertEqual(timings.spans['fetch'][0], 151)  # a step per transaction, and one to find the end
+			self.assertIn('relation comparisons', timings.counters)
+			for stage in ['fetch', 'convert', 'relations', 'joint splits', 'classify and insert', 'cleanup']:
+				self.assertIn(stage, timings.spans)
+
+			with tempfile.TemporaryDirectory() as directory:
+				path = os.path.join(directory, 'timings.json')
+				timings.save(path)
+				with open(path) as f:
+					self.assertEqual(json.load(f)['counters'], timings.counters)
+			self.assertIn('transactions converted', str(timings))
+		finally:
+			timings.__init__()
+
+
+if __name__ == '__main__':
+	unittest.main()
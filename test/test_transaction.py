@@ -1,7 +1,9 @@
 import unittest
 import copy
-from src.config import CollectionConfig
-from src.transaction import GenericTransaction, TransactionAliaser, TransactionFilter, AccountType
+import tracemalloc
+import pickle
+from src.config import CollectionConfig, IgnoreConfig, MerchantConfig, TransactionType
+from src.transaction import DescriptionNormaliser, GenericTransaction, TransactionAliaser, TransactionClassifier, TransactionFilter, AccountType
 
 defaultClassifiers = {
 	'tags': [{'tag1': 'alias'}, 'tag2'],
@@ -72,6 +74,33 @@ class TestGenericTransaction(unittest.TestCase):
 		self.assertTrue(transaction.matches(transaction2))
 		self.assertTrue(transaction2.matches(transaction))
 
+	def test_transaction_equal_by_id(self):
+		transaction = GenericTransaction(description='default', amount=10, id='abc')
+		self.assertEqual(transaction, GenericTransaction(description='changed', amount=-10, id='abc'))
+		self.assertNotEqual(transaction, GenericTransaction(description='default', amount=10, id='def'))
+		self.assertNotEqual(transaction, defaultTransaction)
+		self.assertEqual(len({transaction, copy.deepcopy(transaction)}), 1)
+
+	def test_relations_allocated_on_connect(self):
+		transaction = copy.deepcopy(defaultTransaction)
+		other = copy.deepcopy(defaultTransaction)
+		self.assertIsNone(transaction._relations)
+		self.assertEqual(transaction.connections, [])
+		transaction.connect(other)
+		self.assertEqual(transaction.connections, [other])
+		self.assertEqual(other.connections, [transaction])
+
+	def test_transaction_memory(self):
+		descriptions = ['merchant %d' % i for i in range(1000)]
+		tracemalloc.start()
+		try:
+			before = tracemalloc.get_traced_memory()[0]
+			transactions = [GenericTransaction(description=d, amount=-i, id=d) for i, d in enumerate(descriptions * 10)]
+			size = (tracemalloc.get_traced_memory()[0] - before) / len(transactions)
+		finally:
+			tracemalloc.stop()
+		self.assertLess(size, 200)
+
 
 class TestTransactionAliaser(unittest.TestCase):
 	def test_alias_by_tag(self):
@@ -91,6 +120,72 @@ class TestTransactionAliaser(unittest.TestCase):
 		transaction = copy.deepcopy(defaultTransaction)
 		self.assertEqual(TransactionAliaser(config).get_alias(transaction), 'default')
 
+	def test_alias_by_merchant(self):
+		config = CollectionConfig(defaultCollection)
+		normaliser = DescriptionNormaliser(MerchantConfig({'cache-size': 16, 'rules': [
+			{'pattern': r'\s+#?\d+\b'},
+			{'pattern': r'(?i)\s+(sydney|melbourne)$'},
+			{'pattern': r'(?i)^sq \*', 'replace': 'Square '},
+			{'pattern': r'^\d+$'},
+		]}))
+		aliaser = TransactionAliaser(config, normaliser)
+		merchant = lambda description: aliaser.get_alias(GenericTransaction(description=description, amount=-1))
+		self.assertEqual(merchant('Coles 0412 Sydney'), 'Coles')
+		self.assertEqual(merchant('Coles #881 Melbourne'), 'Coles')
+		self.assertEqual(merchant('SQ *Cafe 12'), 'Square Cafe')
+		self.assertEqual(merchant('account1 23'), 'alias')  # aliases also match the merchant
+		self.assertEqual(merchant('2024'), '2024')  # keeps descriptions that normalise to nothing
+		self.assertEqual(normaliser.normalise.cache_info().currsize, 5)
+
+		restored = pickle.loads(pickle.dumps(normaliser))
+		self.assertEqual(restored.normalise('Coles 0412 Sydney'), 'Coles')
+
+
+class TestTransactionClassifier(unittest.TestCase):
+	def setUp(self):
+		income = dict(defaultCollection, classifiers={'tags': ['pay', 'shared'], 'accounts': ['Employer', {'$Savings': 'Savings'}]})
+		savings = dict(defaultCollection, classifiers={'tags': ['shared'], 'accounts': ['$Sav', 'Broker']})
+		self.configs = {
+			TransactionType.Ignore: IgnoreConfig({'tags': ['skip'], 'accounts': ['$Savings Goal']}),
+			TransactionType.Income: CollectionConfig(income),
+			TransactionType.Savings: CollectionConfig(savings),
+		}
+		self.classifier = TransactionClassifier(self.configs)
+
+	def filter_classification(self, transaction):
+		filters = self.classifier.filters
+		for type, filter in filters.items():
+			if filter.match_by_tag(transaction):
+				return type
+		if transaction.category:
+			return TransactionType.Expense
+		if transaction.internal:
+			return TransactionType.Ignore
+		for type, filter in filters.items():
+			if filter.match_by_account(transaction):
+				return type
+		return TransactionType.Income if transaction.amount > 0 else TransactionType.Unknown
+
+	def test_matches_filters(self):
+		transactions = [
+			GenericTransaction(description='Employer', amount=-1),
+			GenericTransaction(description='Broker', amount=-1, tags=['shared']),
+			GenericTransaction(description='Broker', amount=-1, tags=['skip', 'pay']),
+			GenericTransaction(description='Transfer to $Savings Goal', amount=-1),
+			GenericTransaction(description='Transfer to $Savings', amount=-1),
+			GenericTransaction(description='Transfer to $Sav', amount=-1),
+			GenericTransaction(description='$ from $Savings', amount=-1),
+			GenericTransaction(description='Cafe', amount=-1, category='coffee'),
+			GenericTransaction(description='Cafe', amount=-1),
+			GenericTransaction(description='Refund', amount=1),
+		]
+		expected = [self.filter_classification(t) for t in transactions]
+		self.assertEqual(self.classifier.classify_many(transactions), expected)
+		self.assertEqual(expected, [
+			TransactionType.Income, TransactionType.Income, TransactionType.Ignore, TransactionType.Ignore,
+			TransactionType.Income, TransactionType.Savings, TransactionType.Income, TransactionType.Expense,
+			TransactionType.Unknown, TransactionType.Income])
+
 
 if __name__ == '__main__':
 	unittest.main()
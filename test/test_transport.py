@@ -0,0 +1,97 @@
+import json
+import tempfile
+import threading
+import unittest
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+from upbankapi import Client
+from src.config import ResponseCacheConfig
+from src.transport import CachingSession
+from test.fake import raw_account
+
+
+class StubHandler(BaseHTTPRequestHandler):
+	"""Serves a fixed payload for every path, supporting conditional requests with an ETag."""
+	etag = '"v1"'
+
+	def do_GET(self):
+		self.server.paths.append(self.path)
+		if self.headers.get('If-None-Match') == self.etag:
+			self.send_response(304)
+			self.end_headers()
+			return
+		data = [raw_account('spending', 'Spending')] if self.path.startswith('/api/v1/accounts?') else [{'id': self.path}]
+		body = json.dumps({'data': data, 'links': {'prev': None, 'next': None}}).encode()
+		self.send_response(200)
+		self.send_header('Content-Type', 'application/json')
+		self.send_header('Content-Length', str(len(body)))
+		self.send_header('ETag', self.etag)
+		self.end_headers()
+		self.wfile.write(body)
+
+	def log_message(self, *args):
+		pass
+
+
+class TestCachingSession(unittest.TestCase):
+	def setUp(self):
+		self.server = ThreadingHTTPServer(('127.0.0.1', 0), StubHandler)
+		self.server.paths = []
+		threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.01}, daemon=True).start()
+		self.base = 'http://127.0.0.1:%d/api/v1' % self.server.server_port
+		self.directory = tempfile.TemporaryDirectory()
+
+	def tearDown(self):
+		self.server.shutdown()
+		self.server.server_close()
+		self.directory.cleanup()
+
+	def session(self, ttl=timedelta(hours=1)):
+		config = ResponseCacheConfig({'path': self.directory.name})
+		config.ttl = ttl
+		return CachingSession(config)
+
+	def get(self, session, path, token='token'):
+		response = session.get(self.base + path, headers={'Authorization': 'Bearer ' + token})
+		self.assertEqual(response.status_code, 200)
+		return response.json()
+
+	def test_warm_run_skips_requests(self):
+		cold = self.session()
+		self.assertEqual(self.get(cold, '/accounts'), self.get(cold, '/accounts'))
+		self.assertEqual((cold.hits, cold.misses), (1, 1))
+
+		warm = self.session()
+		self.assertEqual(self.get(warm, '/accounts')['data'][0]['id'], '/api/v1/accounts')
+		self.assertEqual(warm.hit_rate, 1.0)
+		self.assertEqual(self.server.paths, ['/api/v1/accounts'])
+
+		self.get(warm, '/accounts', token='other')  # not shared between tokens
+		self.assertEqual(len(self.server.paths), 2)
+
+	def test_revalidates_expired_entries(self):
+		self.get(self.session(), '/categories')
+		expired = self.session(ttl=timedelta(0))
+		self.assertEqual(self.get(expired, '/categories')['data'][0]['id'], '/api/v1/categories')
+		self.assertEqual(expired.revalidated, 1)
+		self.assertEqual(len(self.server.paths), 2)
+
+	def test_transactions_are_not_cached(self):
+		session = self.session()
+		for _ in range(2):
+			self.get(session, '/accounts/joint/transactions')
+			self.get(session, '/transactions')
+		self.assertEqual(len(self.server.paths), 4)
+		self.assertEqual(session.hits + session.misses, 0)
+
+	def test_up_client_warm_run(self):
+		with mock.patch('upbankapi.client._sync.BASE_URL', self.base):
+			for _ in range(2):
+				accounts = Client('token', session=self.session()).accounts()
+				self.assertEqual([account.name for account in accounts], ['Spending'])
+		self.assertEqual(len(self.server.paths), 1)
+
+
+if __name__ == '__main__':
+	unittest.main()